@@ -4,23 +4,35 @@
 import xarray as xr
 import pandas as pd
 import numpy as np
+import os
+import sys
+
+# Shared derived-variable kernels from the main pipeline
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Source code"))
+from climate_kernels import kelvin_to_celsius, relative_humidity, wind_speed, deaccumulate
 
 # Load the downloaded NetCDF file
 ds = xr.open_dataset('/Users/dheemanth/Desktop/Project/ForestFireDatasetGenerator/App/Data/bc_climate_data.nc')
 
 # Convert temperature and dewpoint from Kelvin to Celsius
-ds['t2m'] = ds['t2m'] - 273.15
-ds['d2m'] = ds['d2m'] - 273.15
+ds['t2m'] = kelvin_to_celsius(ds['t2m'])
+ds['d2m'] = kelvin_to_celsius(ds['d2m'])
 
 # Calculate relative humidity using temperature and dewpoint
-ds['humidity'] = 100 * (np.exp((17.625 * ds['d2m']) / (243.04 + ds['d2m'])) /
-                        np.exp((17.625 * ds['t2m']) / (243.04 + ds['t2m'])))
+ds['humidity'] = relative_humidity(ds['t2m'], ds['d2m'])
 
 # Calculate wind speed from U and V components
-ds['wind_speed'] = (ds['u10']**2 + ds['v10']**2) ** 0.5
+ds['wind_speed'] = wind_speed(ds['u10'], ds['v10'])
+
+# Precipitation and solar radiation are accumulated since 00 UTC; convert them to per-step amounts
+ds['tp'] = deaccumulate(ds['tp'], time_dim='valid_time')
+# J/m2 per step -> mean W/m2 over the step, using the step length of the file's time axis
+step_seconds = ds['valid_time'].diff('valid_time').dt.total_seconds().reindex(valid_time=ds['valid_time'], method='bfill')
+ds['ssrd'] = deaccumulate(ds['ssrd'], time_dim='valid_time') / step_seconds
 
 # Resample to daily averages
 daily_avg = ds.resample(valid_time='1D').mean()
+daily_avg['tp'] = ds['tp'].resample(valid_time='1D').sum()  # Daily total precipitation
 
 # Select and rename variables for the final dataset
 df = daily_avg[['t2m', 'tp', 'wind_speed', 'humidity', 'ssrd', 'swvl1']].to_dataframe().reset_index()
@@ -1,11 +1,17 @@
+import os
+import sys
 import geopandas as gpd
 import pandas as pd
 from shapely.geometry import Point, box
 
+# Parquet NFDB archive from the main pipeline
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Source code"))
+from nfdb_archive import ensure_fire_archive, read_fires
+
 # Load the fire history data and check columns
 print("Loading fire history data...")
 file_path = "/Users/dheemanth/Desktop/Project/ForestFireDatasetGenerator/App/Data/cwfis/NFDB_point_txt/NFDB_point_20240613.txt"
-fire_data = pd.read_csv(file_path, low_memory=False)  # Set low_memory to False to avoid dtype warning
+fire_data = read_fires(ensure_fire_archive(file_path))  # Typed Parquet archive, parsed from the text file only once
 print("Column names in the fire history data:", fire_data.columns)
 print("First few rows of the fire history data:")
 print(fire_data.head())
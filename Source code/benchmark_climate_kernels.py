@@ -0,0 +1,88 @@
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+from climate_kernels import kelvin_to_celsius, relative_humidity, wind_speed, deaccumulate
+
+def _legacy_derived(climate_df):
+    """The original pandas expressions of `process_climate_csv`."""
+    temperature = climate_df["t2m"] - 273.15
+    speed = (climate_df["u10"]**2 + climate_df["v10"]**2)**0.5
+    humidity = 100 * (2.718**((17.625 * climate_df["d2m"]) / (243.04 + climate_df["d2m"])) /
+                      2.718**((17.625 * climate_df["t2m"]) / (243.04 + climate_df["t2m"])))
+    return temperature, speed, humidity, climate_df["tp"]
+
+def _kernel_derived(t2m, d2m, u10, v10, tp, hours, buffers):
+    """The shared kernels, writing into preallocated float32 buffers."""
+    temperature = kelvin_to_celsius(t2m, out=buffers["temperature"])
+    dewpoint = kelvin_to_celsius(d2m, out=buffers["humidity"])
+    humidity = relative_humidity(temperature, dewpoint, out=dewpoint)
+    speed = wind_speed(u10, v10, out=buffers["speed"])
+    precipitation = deaccumulate(tp, hours, out=buffers["precipitation"])
+    return temperature, speed, humidity, precipitation
+
+def _measure(function, repeats):
+    """Best wall time over `repeats` runs and the peak traced allocation of one run."""
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+def benchmark_climate_kernels(n_times=248, n_pixels=40 * 70, repeats=5, seed=0):
+    """
+    Times the derived-variable kernels against the original pandas
+    expressions on synthetic ERA5-like data.
+
+    Parameters:
+    - n_times (int): Time steps (248 = one month of 3-hourly data).
+    - n_pixels (int): ERA5 pixels per time step.
+    - repeats (int): Timed runs per method; the best run is kept.
+    - seed (int): Random seed for the synthetic fields.
+
+    Returns:
+    - dict: Timings (s) and peak allocations (MB) of both methods.
+    """
+    rng = np.random.default_rng(seed)
+    shape = (n_times, n_pixels)
+    t2m = rng.uniform(250, 305, shape).astype(np.float32)
+    d2m = t2m - rng.uniform(0, 15, shape).astype(np.float32)
+    u10 = rng.normal(0, 5, shape).astype(np.float32)
+    v10 = rng.normal(0, 5, shape).astype(np.float32)
+    hours = np.arange(n_times) * 3 % 24
+    tp = np.cumsum(rng.exponential(1e-4, shape), axis=0).astype(np.float32)
+
+    # The CSV path holds every variable as a float64 column
+    climate_df = pd.DataFrame({name: values.ravel().astype(np.float64)
+                               for name, values in [("t2m", t2m), ("d2m", d2m), ("u10", u10), ("v10", v10), ("tp", tp)]})
+    buffers = {name: np.empty(shape, dtype=np.float32) for name in ("temperature", "humidity", "speed", "precipitation")}
+
+    legacy_s, legacy_peak = _measure(lambda: _legacy_derived(climate_df), repeats)
+    kernel_s, kernel_peak = _measure(lambda: _kernel_derived(t2m, d2m, u10, v10, tp, hours, buffers), repeats)
+
+    t_c, td_c = t2m.astype(np.float64) - 273.15, d2m.astype(np.float64) - 273.15
+    reference = 100 * np.exp(17.625 * td_c / (243.04 + td_c) - 17.625 * t_c / (243.04 + t_c))
+    humidity_diff = np.nanmax(np.abs(relative_humidity(kelvin_to_celsius(t2m), kelvin_to_celsius(d2m)) - reference))
+
+    result = {
+        "values": n_times * n_pixels,
+        "legacy_s": legacy_s,
+        "kernel_s": kernel_s,
+        "speedup": legacy_s / kernel_s,
+        "legacy_peak_mb": legacy_peak / 1e6,
+        "kernel_peak_mb": kernel_peak / 1e6,
+        "humidity_max_abs_diff": float(humidity_diff),
+    }
+    print(f"{result['values']} values: legacy {legacy_s * 1000:.1f} ms, peak {result['legacy_peak_mb']:.1f} MB; "
+          f"kernels {kernel_s * 1000:.1f} ms, peak {result['kernel_peak_mb']:.1f} MB; "
+          f"speedup {result['speedup']:.1f}x; humidity vs float64 Magnus {humidity_diff:.1e} %")
+    return result
+
+if __name__ == "__main__":
+    benchmark_climate_kernels()
+    benchmark_climate_kernels(n_times=248 * 12, n_pixels=40 * 70, repeats=2)
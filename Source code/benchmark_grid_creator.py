@@ -0,0 +1,56 @@
+import time
+import os
+import geopandas as gpd
+from grid_creator import _overlay_grid, _vectorized_grid
+
+def benchmark_grid_creation(province_shapefile, grid_sizes, repeats=1):
+    """
+    Times the vectorized grid engine against the original overlay path and
+    checks that both produce the same cells.
+
+    Parameters:
+    - province_shapefile (str): Path to the province shapefile.
+    - grid_sizes (list): Grid cell sizes (in meters) to benchmark.
+    - repeats (int): Number of timed runs per method; the best run is kept.
+
+    Returns:
+    - list: One dict per grid size with timings, cell counts and the
+      relative difference in total clipped area.
+    """
+    print(f"Loading province shapefile from {province_shapefile}...")
+    province_gdf = gpd.read_file(province_shapefile).to_crs("EPSG:3005")
+
+    results = []
+    for grid_size in grid_sizes:
+        timings = {}
+        grids = {}
+        for name, build in [("overlay", _overlay_grid), ("vectorized", _vectorized_grid)]:
+            best = float("inf")
+            for _ in range(repeats):
+                start = time.perf_counter()
+                grids[name] = build(province_gdf, grid_size)
+                best = min(best, time.perf_counter() - start)
+            timings[name] = best
+
+        overlay_area = grids["overlay"].geometry.area.sum()
+        vectorized_area = grids["vectorized"].geometry.area.sum()
+        result = {
+            "grid_size": grid_size,
+            "overlay_s": timings["overlay"],
+            "vectorized_s": timings["vectorized"],
+            "speedup": timings["overlay"] / timings["vectorized"],
+            "overlay_cells": len(grids["overlay"]),
+            "vectorized_cells": len(grids["vectorized"]),
+            "area_rel_diff": abs(overlay_area - vectorized_area) / overlay_area,
+        }
+        results.append(result)
+        print(f"{grid_size / 1000:g} km: overlay {result['overlay_s']:.2f}s "
+              f"({result['overlay_cells']} cells), vectorized {result['vectorized_s']:.2f}s "
+              f"({result['vectorized_cells']} cells), speedup {result['speedup']:.1f}x, "
+              f"area difference {result['area_rel_diff']:.2e}")
+    return results
+
+if __name__ == "__main__":
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    province_shapefile = os.path.join(base_dir, "shapefiles", "British_Columbia_shapefile", "british_columbia_boundary.shp")
+    benchmark_grid_creation(province_shapefile, grid_sizes=[20000, 10000, 5000])
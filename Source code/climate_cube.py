@@ -0,0 +1,205 @@
+import os
+import shutil
+import numpy as np
+import xarray as xr
+from numcodecs import Blosc
+from pathlib import Path
+
+# 248 time steps = one month of 3-hourly data; spatial tiles of 32 x 32 pixels
+TIME_CHUNK = 248
+SPATIAL_CHUNK = 32
+COMPRESSOR = Blosc(cname="zstd", clevel=5, shuffle=Blosc.BITSHUFFLE)
+
+SEASONS = {
+    "DJF": (12, 1, 2),
+    "MAM": (3, 4, 5),
+    "JJA": (6, 7, 8),
+    "SON": (9, 10, 11),
+    "fire_season": (4, 5, 6, 7, 8, 9, 10),
+}
+
+def _normalize_month(ds):
+    """Renames the ERA5 time dimension to "time" and drops scalar and auxiliary coordinates."""
+    if "valid_time" in ds.dims:
+        ds = ds.rename({"valid_time": "time"})
+    # Only the auxiliary dimensions are squeezed; a single step or pixel row stays a dimension
+    ds = ds.squeeze([dim for dim in ("number", "expver") if dim in ds.dims], drop=True)
+    ds = ds.drop_vars([name for name in ds.coords if name not in ds.dims])
+    # Encodings read from NetCDF (contiguous layout, zlib flags) do not apply to Zarr
+    for name in ds.variables:
+        ds[name].encoding = {}
+    return ds.sortby("time")
+
+def cube_months(store_path):
+    """
+    Months already present in a climate cube.
+
+    Parameters:
+    - store_path (str): Path to the Zarr store.
+
+    Returns:
+    - np.ndarray: Sorted datetime64[M] months (empty if the store does not exist).
+    """
+    if not Path(store_path).exists():
+        return np.array([], dtype="datetime64[M]")
+    with xr.open_zarr(store_path, consolidated=True) as cube:
+        return np.unique(cube["time"].values.astype("datetime64[M]"))
+
+def _cube_times(store_path):
+    """Time steps stored in a climate cube (empty if the store does not exist)."""
+    if not Path(store_path).exists():
+        return np.array([], dtype="datetime64[ns]")
+    with xr.open_zarr(store_path, consolidated=True) as cube:
+        return cube["time"].values
+
+def _rewrite_in_time_order(store_path, ds, time_chunk, spatial_chunk):
+    """
+    Merges new time steps into the cube where they belong in time.
+
+    The cube and the new steps are combined lazily, sorted by time and
+    written chunk by chunk to a new store, which then replaces the old one.
+    """
+    tmp_path = f"{str(store_path).rstrip('/')}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    with xr.open_zarr(store_path, consolidated=True) as cube:
+        merged = xr.concat([cube, ds], dim="time").sortby("time")
+        merged = merged.chunk({"time": time_chunk, "latitude": spatial_chunk, "longitude": spatial_chunk})
+        for name in merged.variables:
+            merged[name].encoding = {}
+        encoding = {
+            name: {"chunks": (time_chunk, spatial_chunk, spatial_chunk), "compressors": (COMPRESSOR,)}
+            for name in merged.data_vars
+        }
+        merged.to_zarr(tmp_path, mode="w-", encoding=encoding, consolidated=True, zarr_format=2)
+    shutil.rmtree(store_path)
+    os.replace(tmp_path, store_path)
+
+def ingest_month(store_path, climate_file, time_chunk=TIME_CHUNK, spatial_chunk=SPATIAL_CHUNK):
+    """
+    Adds the months of one ERA5 NetCDF file to the region's climate cube.
+
+    The cube is a single compressed Zarr store (time x latitude x longitude)
+    with consolidated metadata. Time steps already in the store are skipped,
+    so re-ingesting a file is a no-op, while a month stored only in part gets
+    its missing steps. Steps after the end of the store are appended; older
+    ones (e.g. a month that failed to download on an earlier run) are merged
+    in time order by rewriting the store.
+
+    Parameters:
+    - store_path (str): Path to the Zarr store (created on first ingest).
+    - climate_file (str): ERA5 NetCDF file (e.g., one written by `fetch_climate_data`).
+    - time_chunk (int): Time steps per chunk.
+    - spatial_chunk (int): Pixels per latitude/longitude chunk.
+
+    Returns:
+    - list: Months with new time steps, as "YYYY-MM" strings.
+    """
+    stored_times = _cube_times(store_path)
+
+    with xr.open_dataset(climate_file) as ds:
+        ds = _normalize_month(ds)
+        new_steps = ~np.isin(ds["time"].values, stored_times)
+        if not new_steps.any():
+            print(f"{climate_file} is already in {store_path}. Skipping.")
+            return []
+
+        ds = ds.isel(time=np.flatnonzero(new_steps)).load()
+        new_months = np.unique(ds["time"].values.astype("datetime64[M]"))
+
+        if len(stored_times) == 0:
+            print(f"Creating {store_path} with {', '.join(str(m) for m in new_months)} from {climate_file}...")
+            encoding = {
+                name: {"chunks": (time_chunk, spatial_chunk, spatial_chunk), "compressors": (COMPRESSOR,)}
+                for name in ds.data_vars
+            }
+            ds.to_zarr(store_path, mode="w-", encoding=encoding, consolidated=True, zarr_format=2)
+            return [str(month) for month in new_months]
+
+        with xr.open_zarr(store_path, consolidated=True) as cube:
+            if set(cube.data_vars) != set(ds.data_vars):
+                raise ValueError(f"Variables of {climate_file} do not match {store_path}: "
+                                 f"{sorted(ds.data_vars)} vs {sorted(cube.data_vars)}")
+            if not (np.array_equal(cube["latitude"].values, ds["latitude"].values)
+                    and np.array_equal(cube["longitude"].values, ds["longitude"].values)):
+                raise ValueError(f"Pixel lattice of {climate_file} does not match {store_path}")
+
+        if ds["time"].values[0] > stored_times.max():
+            print(f"Appending {', '.join(str(m) for m in new_months)} from {climate_file} to {store_path}...")
+            ds.to_zarr(store_path, append_dim="time", consolidated=True, zarr_format=2)
+        else:
+            print(f"Inserting {', '.join(str(m) for m in new_months)} from {climate_file} into {store_path} "
+                  f"in time order...")
+            _rewrite_in_time_order(store_path, ds, time_chunk, spatial_chunk)
+
+    return [str(month) for month in new_months]
+
+def ingest_climate_files(store_path, climate_files, time_chunk=TIME_CHUNK, spatial_chunk=SPATIAL_CHUNK):
+    """
+    Adds several ERA5 NetCDF files to the climate cube in time order.
+
+    Parameters:
+    - store_path (str): Path to the Zarr store.
+    - climate_files (list): ERA5 NetCDF paths.
+    - time_chunk (int): Time steps per chunk, used when the store is created.
+    - spatial_chunk (int): Pixels per latitude/longitude chunk, used when the store is created.
+
+    Returns:
+    - list: Months with new time steps, as "YYYY-MM" strings.
+    """
+    first_times = {}
+    for climate_file in climate_files:
+        with xr.open_dataset(climate_file) as ds:
+            time_dim = "valid_time" if "valid_time" in ds.dims else "time"
+            first_times[climate_file] = ds[time_dim].values.min()
+
+    appended = []
+    for climate_file in sorted(climate_files, key=first_times.get):
+        appended += ingest_month(store_path, climate_file, time_chunk, spatial_chunk)
+    return appended
+
+def open_climate_cube(store_path):
+    """
+    Opens the climate cube lazily; nothing is read until values are used.
+
+    Parameters:
+    - store_path (str): Path to the Zarr store.
+
+    Returns:
+    - xr.Dataset: Dask-backed dataset with dimensions (time, latitude, longitude).
+    """
+    return xr.open_zarr(store_path, consolidated=True)
+
+def read_climate_cube(store_path, variables=None, season=None, years=None, bbox=None):
+    """
+    Selects variables, a season, years and a bounding box from the climate cube.
+
+    Only the Zarr chunks overlapping the selection are decoded when the
+    result is computed.
+
+    Parameters:
+    - store_path (str): Path to the Zarr store.
+    - variables (str or list): Variable name(s), e.g. "t2m". All when None.
+    - season (str or tuple): A key of SEASONS or a tuple of month numbers.
+    - years (tuple): Optional (first_year, last_year), inclusive.
+    - bbox (list): Optional [min_lon, min_lat, max_lon, max_lat]
+      (e.g., a province's `total_bounds`).
+
+    Returns:
+    - xr.Dataset: Lazy selection.
+    """
+    cube = open_climate_cube(store_path)
+    if variables is not None:
+        cube = cube[[variables] if isinstance(variables, str) else list(variables)]
+
+    if years is not None:
+        cube = cube.sel(time=slice(f"{years[0]}-01-01", f"{years[1]}-12-31T23:59:59"))
+    if season is not None:
+        months = SEASONS[season] if isinstance(season, str) else tuple(season)
+        cube = cube.isel(time=np.flatnonzero(np.isin(cube["time"].dt.month.values, months)))
+
+    if bbox is not None:
+        min_lon, min_lat, max_lon, max_lat = bbox
+        latitude = cube["latitude"].values
+        lat_slice = slice(max_lat, min_lat) if latitude[0] > latitude[-1] else slice(min_lat, max_lat)
+        cube = cube.sel(latitude=lat_slice, longitude=slice(min_lon, max_lon))
+    return cube
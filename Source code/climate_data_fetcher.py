@@ -1,46 +1,308 @@
-import cdsapi
 import os
+import re
+import numpy as np
+import shapely
+import xarray as xr
 from pathlib import Path
+from era5_download_manager import ERA5DownloadManager
 
-def fetch_climate_data(bounding_box, year, months, output_folder):
+ERA5_VARIABLES = [
+    '2m_temperature', 'total_precipitation', '10m_u_component_of_wind',
+    '10m_v_component_of_wind', '2m_dewpoint_temperature',
+    'surface_solar_radiation_downwards', 'volumetric_soil_water_layer_1'
+]
+ERA5_LAND_RESOLUTION = 0.1
+# Time steps in a 31-day month of 3-hourly data, used for size estimates
+STEPS_PER_MONTH = 31 * 8
+# Sub-area downloads are kept apart from the monthly files until they are merged
+SUB_AREA_FOLDER = "sub_areas"
+MONTHLY_FILE_PATTERN = re.compile(r"climate_data_\d{4}_\d{2}\.nc")
+
+def monthly_climate_files(folder):
+    """
+    Monthly files written by `fetch_climate_data` in a folder, oldest first.
+
+    Only complete monthly files ("climate_data_YYYY_MM.nc") are listed;
+    sub-area parts and partial downloads are not.
+
+    Parameters:
+    - folder (str): Climate data folder.
+
+    Returns:
+    - list: Paths of the monthly files.
+    """
+    return sorted(path for path in Path(folder).glob("climate_data_*.nc") if MONTHLY_FILE_PATTERN.fullmatch(path.name))
+
+def _province_geometry(province):
+    """Single EPSG:4326 geometry from a shapely geometry or a GeoDataFrame/GeoSeries."""
+    if hasattr(province, "to_crs"):
+        return shapely.union_all(province.to_crs("EPSG:4326").geometry.values)
+    return province
+
+def _lattice_mask(geometry, resolution=ERA5_LAND_RESOLUTION):
+    """
+    ERA5 pixels (centres on multiples of `resolution`) whose cell overlaps
+    the geometry, as a (row, col) mask ordered north to south, west to east.
+    """
+    minx, miny, maxx, maxy = geometry.bounds
+    lats = np.arange(np.ceil(maxy / resolution + 0.5), np.floor(miny / resolution - 0.5) - 1, -1) * resolution
+    lons = np.arange(np.floor(minx / resolution - 0.5), np.ceil(maxx / resolution + 0.5) + 1) * resolution
+    lon2d, lat2d = np.meshgrid(lons, lats)
+    half = resolution / 2
+    shapely.prepare(geometry)
+    mask = shapely.intersects(geometry, shapely.box(lon2d - half, lat2d - half, lon2d + half, lat2d + half))
+    return np.round(lats, 6), np.round(lons, 6), mask
+
+def cover_sub_areas(province, max_areas=4, resolution=ERA5_LAND_RESOLUTION):
+    """
+    Covers a province with a few latitude bands, each trimmed to the
+    longitudes the province spans inside it.
+
+    The bands are chosen by dynamic programming over the rows of the ERA5
+    lattice so that the total number of requested pixels is minimal for
+    the given number of bands.
+
+    Parameters:
+    - province (shapely geometry or GeoDataFrame): Province boundary.
+    - max_areas (int): Maximum number of sub-areas.
+    - resolution (float): ERA5 grid spacing in degrees.
+
+    Returns:
+    - list: CDS areas [North, West, South, East], north to south.
+    """
+    lats, lons, mask = _lattice_mask(_province_geometry(province), resolution)
+    occupied = np.flatnonzero(mask.any(axis=1))
+    lats, mask = lats[occupied[0]:occupied[-1] + 1], mask[occupied[0]:occupied[-1] + 1]
+    n_rows = len(lats)
+    row_first = np.where(mask.any(axis=1), mask.argmax(axis=1), len(lons))
+    row_last = np.where(mask.any(axis=1), len(lons) - 1 - mask[:, ::-1].argmax(axis=1), -1)
+
+    # cost[i, j]: pixels of one band covering rows i..j
+    cost = np.full((n_rows, n_rows), np.inf)
+    for i in range(n_rows):
+        first = np.minimum.accumulate(row_first[i:])
+        last = np.maximum.accumulate(row_last[i:])
+        cost[i, i:] = np.maximum(last - first + 1, 0) * np.arange(1, n_rows - i + 1)
+
+    # best[k, j]: minimal pixels covering rows 0..j-1 with k bands
+    n_areas = min(max_areas, n_rows)
+    best = np.full((n_areas + 1, n_rows + 1), np.inf)
+    split = np.zeros((n_areas + 1, n_rows + 1), dtype=int)
+    best[0, 0] = 0
+    for k in range(1, n_areas + 1):
+        for j in range(1, n_rows + 1):
+            totals = best[k - 1, :j] + cost[:j, j - 1]
+            split[k, j] = np.argmin(totals)
+            best[k, j] = totals[split[k, j]]
+
+    k = int(np.argmin(best[1:, n_rows])) + 1
+    bands = []
+    j = n_rows
+    while k > 0:
+        i = split[k, j]
+        bands.append((i, j - 1))
+        j, k = i, k - 1
+
+    areas = []
+    for i, j in reversed(bands):
+        first, last = row_first[i:j + 1].min(), row_last[i:j + 1].max()
+        if last < first:
+            continue
+        areas.append([float(lats[i]), float(lons[first]), float(lats[j]), float(lons[last])])
+    return areas
+
+def _area_pixels(area, resolution=ERA5_LAND_RESOLUTION):
+    north, west, south, east = area
+    return (int(round((north - south) / resolution)) + 1) * (int(round((east - west) / resolution)) + 1)
+
+def footprint_report(bbox_area, sub_areas, n_variables=len(ERA5_VARIABLES), resolution=ERA5_LAND_RESOLUTION):
+    """
+    Pixels and bytes per month of a sub-area request compared with the bounding-box request.
+
+    Bytes are estimated for uncompressed float32 NetCDF (one value per
+    pixel, time step and variable).
+
+    Parameters:
+    - bbox_area (list): Bounding-box area [North, West, South, East].
+    - sub_areas (list): Sub-areas from `cover_sub_areas`.
+    - n_variables (int): Variables per request.
+    - resolution (float): ERA5 grid spacing in degrees.
+
+    Returns:
+    - dict: Pixel counts, estimated bytes per month and savings.
+    """
+    bbox_pixels = _area_pixels(bbox_area, resolution)
+    sub_pixels = sum(_area_pixels(area, resolution) for area in sub_areas)
+    bytes_per_pixel = STEPS_PER_MONTH * n_variables * 4
+    report = {
+        "bbox_pixels": bbox_pixels,
+        "sub_area_pixels": sub_pixels,
+        "pixels_saved": bbox_pixels - sub_pixels,
+        "bbox_bytes_per_month": bbox_pixels * bytes_per_pixel,
+        "sub_area_bytes_per_month": sub_pixels * bytes_per_pixel,
+        "bytes_saved_per_month": (bbox_pixels - sub_pixels) * bytes_per_pixel,
+        "fraction_saved": 1 - sub_pixels / bbox_pixels,
+    }
+    print(f"{len(sub_areas)} sub-areas: {sub_pixels} pixels instead of {bbox_pixels} "
+          f"({report['fraction_saved']:.0%} saved, about {report['bytes_saved_per_month'] / 1e6:.0f} MB less per month)")
+    return report
+
+def merge_sub_areas(part_files, output_file):
+    """
+    Merges the sub-area downloads of one month into a single NetCDF file on
+    the union lattice; pixels outside every sub-area are NaN.
+
+    Parameters:
+    - part_files (list): Sub-area NetCDF files.
+    - output_file (str): Merged NetCDF file.
+    """
+    parts = []
+    for part_file in part_files:
+        with xr.open_dataset(part_file) as ds:
+            # Round the coordinates so that pixels of different requests line up
+            parts.append(ds.load().assign_coords(latitude=np.round(ds["latitude"].values, 4),
+                                                 longitude=np.round(ds["longitude"].values, 4)))
+    merged = xr.merge(parts, join="outer", compat="no_conflicts")
+    merged = merged.sortby("latitude", ascending=False).sortby("longitude")
+
+    tmp_file = str(output_file) + ".part"
+    merged.to_netcdf(tmp_file)
+    os.replace(tmp_file, output_file)
+
+def era5_month_request(area, year, month):
+    """
+    Builds the CDS request for one month of 3-hourly ERA5-Land data.
+
+    Parameters:
+    - area (list): [North, West, South, East] in degrees.
+    - year (int): Year for the climate data.
+    - month (int): Month for the climate data.
+
+    Returns:
+    - dict: CDS request.
+    """
+    return {
+        'variable': ERA5_VARIABLES,
+        'year': str(year),
+        'month': f"{month:02d}",
+        'day': [f"{d:02d}" for d in range(1, 32)],
+        'time': [f"{h:02d}:00" for h in range(0, 24, 3)],
+        'area': area,
+        'format': 'netcdf'
+    }
+
+def fetch_climate_data(bounding_box, year, months, output_folder, max_concurrent=4, client_factory=None,
+                       province=None, max_areas=4, tile_cache=None):
     """
     Fetch climate data for the given bounding box, year, and months.
 
+    Month requests are submitted concurrently and tracked on disk, so an
+    interrupted run resumes without re-requesting finished months
+    (see `era5_download_manager.ERA5DownloadManager`).
+
+    With a province boundary, each month is requested as a few sub-areas
+    that cover the province tightly (see `cover_sub_areas`) instead of the
+    whole bounding box, and the parts are merged into the monthly file.
+    Parts are downloaded into a "sub_areas" subfolder, so a month with a
+    failed or unmerged part never looks like a monthly file; finished parts
+    are reused by the next run when their request is unchanged.
+
+    Every monthly file is recorded in the folder's download state with the
+    request it was made for (area, and sub-areas or tile cache), and an
+    existing file is only reused for the same request, so a folder shared by
+    several regions or settings never hands out another region's month.
+
+    With a tile cache, each month is assembled from shared global tiles and
+    only the tiles not cached yet are downloaded
+    (see `era5_tile_cache.ERA5TileCache`). The monthly files are rewritten
+    from the tiles on every call, so a folder shared by several regions
+    always gets the requested region's data.
+
     Parameters:
-    - bounding_box (list): [minx, miny, maxx, maxy] for the area.
+    - bounding_box (list): [minx, miny, maxx, maxy] for the area
+      (may be None when a province is given).
     - year (int): Year for the climate data.
     - months (list): List of months (integers) to fetch.
     - output_folder (str): Folder to save the climate data.
-    """
-    c = cdsapi.Client()
+    - max_concurrent (int): Number of month requests in flight at once.
+    - client_factory (callable): Optional CDS client factory (defaults to `era5_download_manager.CDSClient`,
+      or blocking cdsapi downloads if the installed cdsapi does not support it).
+    - province (shapely geometry or GeoDataFrame): Optional province boundary.
+    - max_areas (int): Maximum number of sub-areas per month.
+    - tile_cache (ERA5TileCache): Optional shared tile cache.
 
+    Returns:
+    - dict: Output filename -> download status ("done" or "failed").
+    """
     # Ensure output folder exists
     output_folder = Path(output_folder)
     output_folder.mkdir(parents=True, exist_ok=True)
 
+    if bounding_box is None:
+        bounding_box = list(_province_geometry(province).bounds)
+    area = [
+        bounding_box[3], bounding_box[0],  # North, West
+        bounding_box[1], bounding_box[2]   # South, East
+    ]
+
+    # Monthly files are named by year and month only; the download state in the
+    # output folder records which request (area, sub-areas) each one was made for
+    month_state = ERA5DownloadManager(output_folder, client_factory=client_factory, max_concurrent=max_concurrent)
+
+    if tile_cache is not None:
+        results = {}
+        for month in months:
+            # Monthly names do not identify the region, so the file is always
+            # rebuilt from the (cached) tiles rather than reused
+            monthly_file = f"climate_data_{year}_{month:02d}.nc"
+            tile_cache.write_month(bounding_box, year, month, output_folder / monthly_file, province=province)
+            # Recorded so that the other paths do not take this file for theirs
+            month_state.mark_done(monthly_file, era5_month_request(area, year, month) | {"source": "tile_cache"})
+            results[monthly_file] = "done"
+        return results
+
+    if province is None:
+        requests = {
+            f"climate_data_{year}_{month:02d}.nc": era5_month_request(area, year, month)
+            for month in months
+        }
+        print(f"Fetching data for {year}, months {', '.join(f'{m:02d}' for m in months)}...")
+        return month_state.download(requests)
+
+    sub_areas = cover_sub_areas(province, max_areas=max_areas)
+    footprint_report(area, sub_areas)
+
+    parts_folder = output_folder / SUB_AREA_FOLDER
+    requests = {}
+    parts_by_month = {}
+    results = {}
+    merged_requests = {}
     for month in months:
-        filename = output_folder / f"climate_data_{year}_{month:02d}.nc"
-        print(f"Fetching data for {year}-{month:02d}...")
-
-        c.retrieve(
-            'reanalysis-era5-land',
-            {
-                'variable': [
-                    '2m_temperature', 'total_precipitation', '10m_u_component_of_wind',
-                    '10m_v_component_of_wind', '2m_dewpoint_temperature',
-                    'surface_solar_radiation_downwards', 'volumetric_soil_water_layer_1'
-                ],
-                'year': str(year),
-                'month': f"{month:02d}",
-                'day': [f"{d:02d}" for d in range(1, 32)],
-                'time': [f"{h:02d}:00" for h in range(0, 24, 3)],
-                'area': [
-                    bounding_box[3], bounding_box[0],  # North, West
-                    bounding_box[1], bounding_box[2]   # South, East
-                ],
-                'format': 'netcdf'
-            },
-            str(filename)
-        )
-        print(f"Saved: {filename}")
+        monthly_file = f"climate_data_{year}_{month:02d}.nc"
+        merged_requests[monthly_file] = era5_month_request(area, year, month) | {"sub_areas": sub_areas}
+        if month_state.is_done(monthly_file, merged_requests[monthly_file]):
+            print(f"{monthly_file} already downloaded. Skipping.")
+            results[monthly_file] = "done"
+            continue
+        parts_by_month[monthly_file] = []
+        for i, sub_area in enumerate(sub_areas):
+            part_file = f"climate_data_{year}_{month:02d}_area{i}.nc"
+            requests[part_file] = era5_month_request(sub_area, year, month)
+            parts_by_month[monthly_file].append(part_file)
+
+    print(f"Fetching data for {year}, months {', '.join(f'{m:02d}' for m in months)} as {len(sub_areas)} sub-areas...")
+    manager = ERA5DownloadManager(parts_folder, client_factory=client_factory, max_concurrent=max_concurrent)
+    part_results = manager.download(requests)
 
+    for monthly_file, part_files in parts_by_month.items():
+        if any(part_results[part_file] != "done" for part_file in part_files):
+            # Finished parts stay in the sub-area folder for the next run
+            results[monthly_file] = "failed"
+            continue
+        print(f"Merging {len(part_files)} sub-areas into {monthly_file}...")
+        merge_sub_areas([parts_folder / part_file for part_file in part_files], output_folder / monthly_file)
+        for part_file in part_files:
+            (parts_folder / part_file).unlink()
+        month_state.mark_done(monthly_file, merged_requests[monthly_file])
+        results[monthly_file] = "done"
+    return results
@@ -1,69 +1,390 @@
+import numpy as np
 import pandas as pd
-import geopandas as gpd
-from shapely.geometry import Point
+import xarray as xr
+from grid_cache import load_grid
+from era5_regridder import load_or_create_regridder
+from climate_cube import open_climate_cube
+from climate_kernels import (kelvin_to_celsius, relative_humidity, wind_speed, deaccumulate, deaccumulate_steps,
+                             restart_after_gaps)
 
-def process_climate_csv(grid_shapefile, climate_csv, output_csv):
+# Length-1 dimensions some ERA5 files carry besides time, latitude and longitude
+AUXILIARY_DIMS = ("number", "expver")
+
+CLIMATE_CSV_COLUMNS = ["valid_time", "latitude", "longitude", "t2m", "tp", "u10", "v10", "d2m"]
+
+# Output column -> (input column, reduction) of the (grid_id, time) aggregates
+CLIMATE_AGGREGATES = {
+    "avg_temperature": ("Temperature_C", "mean"),
+    "total_precipitation": ("Precipitation_mm", "sum"),
+    "avg_wind_speed": ("WindSpeed_m/s", "mean"),
+    "avg_humidity": ("Humidity_%", "mean"),
+    "latitude": ("latitude", "mean"),
+    "longitude": ("longitude", "mean"),
+}
+
+def _read_climate_chunks(climate_file, chunksize):
     """
-    Process climate data CSV and map it to grid cells.
+    Yields the climate table in row chunks.
 
     Parameters:
-    - grid_shapefile (str): Path to the shapefile containing grid cells.
-    - climate_csv (str): Path to the climate data CSV.
-    - output_csv (str): Path to save the processed CSV file.
+    - climate_file (str): Path to a climate CSV or Parquet file.
+    - chunksize (int): Rows per chunk.
     """
-    print(f"Loading grid shapefile from {grid_shapefile}...")
-    grid_gdf = gpd.read_file(grid_shapefile)
+    if str(climate_file).endswith(".parquet"):
+        import pyarrow.parquet as pq
+        parquet_file = pq.ParquetFile(climate_file)
+        missing_columns = set(CLIMATE_CSV_COLUMNS) - set(parquet_file.schema_arrow.names)
+        if missing_columns:
+            raise ValueError(f"Climate data is missing required columns: {missing_columns}")
+        for batch in parquet_file.iter_batches(batch_size=chunksize, columns=CLIMATE_CSV_COLUMNS):
+            yield batch.to_pandas()
+    else:
+        for chunk in pd.read_csv(climate_file, chunksize=chunksize):
+            yield chunk
 
-    print(f"Loading climate data from {climate_csv}...")
-    climate_df = pd.read_csv(climate_csv)
+def _deaccumulate_chunk(climate_df, carry):
+    """
+    Per-step precipitation of one chunk.
+
+    Each pixel's series continues from the last row of that pixel in the
+    previous chunks (`carry`, indexed by latitude/longitude), so rows must
+    reach the reader in time order per pixel. A row that does not directly
+    follow the pixel's previous row restarts the accumulation, with the same
+    rule as the gridded path (see `climate_kernels.restart_after_gaps`); the
+    time step is the smallest interval between a pixel's rows seen so far.
+
+    Returns:
+    - tuple: (per-step values aligned with climate_df, updated carry)
+    """
+    series = pd.DataFrame({
+        "latitude": climate_df["latitude"],
+        "longitude": climate_df["longitude"],
+        "time": climate_df["time"],
+        "tp": climate_df["tp"].astype(np.float32),
+        "hour": climate_df["time"].dt.hour.astype(np.float32),
+    }).sort_values(["latitude", "longitude", "time"], kind="stable")
 
+    pixel = series.groupby(["latitude", "longitude"], sort=False)
+    previous = pixel["tp"].shift(1)
+    previous_hour = pixel["hour"].shift(1)
+    previous_time = pixel["time"].shift(1)
+    step = None
+    if carry is not None:
+        step = carry.attrs.get("step")
+        first = previous_hour.isna()
+        carried = carry.reindex(pd.MultiIndex.from_frame(series.loc[first, ["latitude", "longitude"]]))
+        previous[first] = carried["tp"].to_numpy()
+        previous_hour[first] = carried["hour"].to_numpy()
+        previous_time[first] = carried["time"].to_numpy()
+
+    interval = (series["time"] - previous_time).to_numpy()
+    intervals = interval[~np.isnat(interval)]
+    if len(intervals):
+        step = intervals.min() if step is None else min(step, intervals.min())
+    if step is not None:
+        previous_hour = restart_after_gaps(previous_hour.to_numpy(), interval, step)
+    else:
+        previous_hour = previous_hour.to_numpy()
+
+    steps = deaccumulate_steps(series["tp"].to_numpy(), series["hour"].to_numpy(),
+                               previous.to_numpy(), previous_hour)
+    last = series.drop_duplicates(["latitude", "longitude"], keep="last").set_index(["latitude", "longitude"])
+    last = last[["tp", "hour", "time"]]
+    carry = last if carry is None else last.combine_first(carry)
+    carry.attrs["step"] = step
+    return pd.Series(steps, index=series.index).reindex(climate_df.index).to_numpy(), carry
+
+def _partial_climate_aggregates(climate_df, grid, carry=None):
+    """
+    Derives the climate variables of one chunk, assigns grid cells and
+    returns per-(grid_id, time) sums and counts, plus the precipitation
+    carry for the next chunk (see `_deaccumulate_chunk`).
+    """
     # Ensure required columns exist
-    required_columns = {"valid_time", "latitude", "longitude", "t2m", "tp", "u10", "v10", "d2m"}
-    if not required_columns.issubset(climate_df.columns):
-        missing_columns = required_columns - set(climate_df.columns)
+    missing_columns = set(CLIMATE_CSV_COLUMNS) - set(climate_df.columns)
+    if missing_columns:
         raise ValueError(f"Climate data is missing required columns: {missing_columns}")
 
-    print("Converting temperature from Kelvin to Celsius...")
-    climate_df["Temperature_C"] = climate_df["t2m"] - 273.15
+    temperature = kelvin_to_celsius(climate_df["t2m"].to_numpy())
+    dewpoint = kelvin_to_celsius(climate_df["d2m"].to_numpy())
+    climate_df = pd.DataFrame({
+        "time": pd.to_datetime(climate_df["valid_time"]),
+        "latitude": climate_df["latitude"],
+        "longitude": climate_df["longitude"],
+        "tp": climate_df["tp"],
+        "Temperature_C": temperature,
+        "WindSpeed_m/s": wind_speed(climate_df["u10"].to_numpy(), climate_df["v10"].to_numpy()),
+        # Computed into the dewpoint buffer, which is not needed afterwards
+        "Humidity_%": relative_humidity(temperature, dewpoint, out=dewpoint),
+    })
+    climate_df["Precipitation_mm"], carry = _deaccumulate_chunk(climate_df, carry)
+    climate_df["grid_id"] = grid.assign_points(climate_df["longitude"].to_numpy(), climate_df["latitude"].to_numpy())
+    climate_df = climate_df[climate_df["grid_id"] > 0]
 
-    print("Calculating wind speed...")
-    climate_df["WindSpeed_m/s"] = (climate_df["u10"]**2 + climate_df["v10"]**2)**0.5
+    grouped = climate_df.groupby(["grid_id", "time"])
+    columns = [column for column, _ in CLIMATE_AGGREGATES.values()]
+    sums = grouped[columns].sum().add_suffix("_sum")
+    counts = grouped[columns].count().add_suffix("_count")
+    return pd.concat([sums, counts], axis=1), carry
 
-    print("Calculating relative humidity...")
-    climate_df["Humidity_%"] = 100 * (2.718**((17.625 * climate_df["d2m"]) / (243.04 + climate_df["d2m"])) /
-                                      2.718**((17.625 * climate_df["t2m"]) / (243.04 + climate_df["t2m"])))
+def process_climate_csv(grid, climate_csv, output_csv, chunksize=1_000_000):
+    """
+    Process climate data CSV and map it to grid cells.
 
-    print("Renaming precipitation column...")
-    climate_df.rename(columns={"tp": "Precipitation_mm"}, inplace=True)
+    The file is streamed in row chunks: each chunk is mapped to grid cells and
+    reduced to per-(grid_id, time) sums and counts, which are merged into
+    running totals. Memory is bounded by the chunk size and the number of
+    (grid_id, time) groups, not by the size of the file.
 
-    print("Converting time column...")
-    climate_df.rename(columns={"valid_time": "time"}, inplace=True)
-    climate_df["time"] = pd.to_datetime(climate_df["time"])
+    Derived variables come from the shared float32 kernels in
+    `climate_kernels`, and the accumulated ERA5-Land precipitation is
+    de-accumulated into per-step amounts before it is summed.
 
-    print("Converting climate data to GeoDataFrame...")
-    climate_gdf = gpd.GeoDataFrame(
-        climate_df,
-        geometry=gpd.points_from_xy(climate_df["longitude"], climate_df["latitude"]),
-        crs="EPSG:4326"
-    )
+    Parameters:
+    - grid (CachedGrid or str): Loaded grid (see `grid_cache.load_or_create_grid`)
+      or path to the shapefile containing grid cells.
+    - climate_csv (str): Path to the climate data CSV (or Parquet file with the same columns).
+    - output_csv (str): Path to save the processed CSV file.
+    - chunksize (int): Rows read per chunk.
+    """
+    grid = load_grid(grid)
 
-    print("Mapping climate data to grid cells...")
-    climate_with_grid = gpd.sjoin(climate_gdf, grid_gdf, how="inner", predicate="within")
+    print(f"Streaming climate data from {climate_csv} in chunks of {chunksize} rows...")
+    totals = None
+    carry = None
+    rows_read = 0
+    for chunk_number, chunk in enumerate(_read_climate_chunks(climate_csv, chunksize), start=1):
+        partial, carry = _partial_climate_aggregates(chunk, grid, carry)
+        # Groups can span chunk boundaries, so partial sums are merged by key
+        totals = partial if totals is None else totals.add(partial, fill_value=0)
+        rows_read += len(chunk)
+        print(f"Chunk {chunk_number}: {rows_read} rows read, {len(totals)} (grid_id, time) groups so far")
 
-    # Ensure latitude and longitude columns are retained
-    climate_with_grid["latitude"] = climate_with_grid.geometry.y
-    climate_with_grid["longitude"] = climate_with_grid.geometry.x
+    if totals is None:
+        raise ValueError(f"Climate data file {climate_csv} is empty")
 
     print("Aggregating climate data by grid cells...")
-    aggregated_data = climate_with_grid.groupby(["grid_id", "time"]).agg(
-        avg_temperature=("Temperature_C", "mean"),
-        total_precipitation=("Precipitation_mm", "sum"),
-        avg_wind_speed=("WindSpeed_m/s", "mean"),
-        avg_humidity=("Humidity_%", "mean"),
-        latitude=("latitude", "mean"),
-        longitude=("longitude", "mean")
-    ).reset_index()
+    aggregated_data = pd.DataFrame(index=totals.index)
+    for name, (column, how) in CLIMATE_AGGREGATES.items():
+        if how == "sum":
+            aggregated_data[name] = totals[f"{column}_sum"]
+        else:
+            aggregated_data[name] = totals[f"{column}_sum"] / totals[f"{column}_count"]
+    aggregated_data = aggregated_data.sort_index().reset_index()
+    aggregated_data["grid_id"] = aggregated_data["grid_id"].astype(np.int64)
+
+    print(f"Saving processed climate data to {output_csv}...")
+    aggregated_data.to_csv(output_csv, index=False)
+    print("Processing complete!")
+
+
+def _time_dim(ds):
+    """Name of the time dimension of an ERA5 dataset ("valid_time" or "time")."""
+    return "valid_time" if "valid_time" in ds.dims else "time"
+
+def _squeeze_auxiliary(ds):
+    """
+    Drops the length-1 ensemble and experiment dimensions of an ERA5 dataset.
+
+    Only these are squeezed: time, latitude and longitude are kept even with
+    a single step, row or column.
+    """
+    return ds.squeeze([dim for dim in AUXILIARY_DIMS if dim in ds.dims], drop=True)
+
+def _daily_reduce(values, day_codes, n_days, how="mean"):
+    """
+    Reduces (n_times, n_cells) values to (n_days, n_cells), skipping NaN.
+
+    Parameters:
+    - values (np.ndarray): Cell values per time step.
+    - day_codes (np.ndarray): Day index of each time step.
+    - n_days (int): Number of days.
+    - how (str): "mean" or "sum".
+    """
+    valid = ~np.isnan(values)
+    totals = np.zeros((n_days, values.shape[1]))
+    np.add.at(totals, day_codes, np.where(valid, values, 0))
+    if how == "sum":
+        return totals
+    counts = np.zeros((n_days, values.shape[1]))
+    np.add.at(counts, day_codes, valid)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return totals / counts
+
+def _aggregate_netcdf(ds, regridder, previous_tp=None):
+    """
+    Aggregates one ERA5 dataset to (grid_id, day) rows.
+
+    `previous_tp` is the (tp, hour, time) of the last step of the preceding
+    file; it continues the precipitation de-accumulation when that step
+    directly precedes this file. Returns the rows and the same tuple for
+    this file's last step.
+    """
+    time_dim = _time_dim(ds)
+    ds = _squeeze_auxiliary(ds)
+
+    def pixels(var):
+        # (time, lat, lon) -> (time, lat * lon)
+        data = ds[var].transpose(time_dim, "latitude", "longitude").values
+        return data.reshape(data.shape[0], -1)
+
+    t2m, d2m, u10, v10, tp = (pixels(var) for var in ("t2m", "d2m", "u10", "v10", "tp"))
+    times = ds[time_dim].values
+    hours = times.astype("datetime64[h]").astype(np.int64) % 24
+
+    print("Computing derived variables on gridded arrays...")
+    # Temperatures are converted in place; humidity reuses the dewpoint buffer
+    temperature = kelvin_to_celsius(t2m, out=t2m)
+    humidity = relative_humidity(temperature, kelvin_to_celsius(d2m, out=d2m), out=d2m)
+    speed = wind_speed(u10, v10)
+    step = times[1] - times[0] if len(times) > 1 else None
+    if previous_tp is not None and step is not None and previous_tp[2] + step == times[0]:
+        precipitation = deaccumulate(tp, hours, previous=previous_tp[:2])
+    else:
+        precipitation = deaccumulate(tp, hours)
+    last_tp = (tp[-1].copy(), hours[-1], times[-1])
+
+    days, day_codes = np.unique(times.astype("datetime64[D]"), return_inverse=True)
+    n_days, n_cells = len(days), len(regridder.cell_ids)
+
+    print("Regridding to grid cells and aggregating by day...")
+    daily = {
+        "avg_temperature": _daily_reduce(regridder.apply(temperature), day_codes, n_days),
+        # Cell precipitation at each step, summed over the day
+        "total_precipitation": _daily_reduce(regridder.apply(precipitation), day_codes, n_days, how="sum"),
+        "avg_wind_speed": _daily_reduce(regridder.apply(speed), day_codes, n_days),
+        "avg_humidity": _daily_reduce(regridder.apply(humidity), day_codes, n_days),
+    }
+
+    lon2d, lat2d = np.meshgrid(ds["longitude"].values, ds["latitude"].values)
+    cell_latitude = regridder.apply(lat2d[None])[0]
+    cell_longitude = regridder.apply(lon2d[None])[0]
+
+    return pd.DataFrame({
+        "grid_id": np.tile(regridder.cell_ids, n_days),
+        "time": np.repeat(days, n_cells),
+        **{name: values.ravel() for name, values in daily.items()},
+        "latitude": np.tile(cell_latitude, n_days),
+        "longitude": np.tile(cell_longitude, n_days),
+    }), last_tp
+
+def process_climate_netcdf(grid, climate_files, output_csv, regrid="area", weights_folder=None):
+    """
+    Process ERA5 NetCDF files directly into daily climate data per grid cell,
+    without converting them to CSV first.
+
+    ERA5 pixels are mapped to grid cells through a sparse weight matrix that
+    is computed once per pixel lattice (and cached in weights_folder), and
+    the derived variables and (grid_id, day) aggregates are computed on the
+    gridded arrays.
+
+    Parameters:
+    - grid (CachedGrid or str): Loaded grid (see `grid_cache.load_or_create_grid`)
+      or path to the shapefile containing grid cells.
+    - climate_files (str or list): Path(s) to ERA5 NetCDF files
+      (e.g., the monthly files written by `fetch_climate_data`).
+    - output_csv (str): Path to save the processed CSV file.
+    - regrid (str): "area" (default) weights pixels by their overlap with
+      each cell, so every cell gets data; "within" uses only the pixels
+      whose centres fall inside a cell.
+    - weights_folder (str): Folder to cache regridding weights in.
+    """
+    grid = load_grid(grid)
+    if isinstance(climate_files, (str, bytes)) or not hasattr(climate_files, "__iter__"):
+        climate_files = [climate_files]
+
+    daily_frames = []
+    previous_tp = None
+    for climate_file in climate_files:
+        print(f"Loading climate data from {climate_file}...")
+        with xr.open_dataset(climate_file) as ds:
+            missing_variables = {"t2m", "tp", "u10", "v10", "d2m"} - set(ds.data_vars)
+            if missing_variables:
+                raise ValueError(f"Climate data is missing required variables: {missing_variables}")
+            regridder = load_or_create_regridder(grid, ds["latitude"].values, ds["longitude"].values,
+                                                 method=regrid, cache_folder=weights_folder)
+            daily_frame, previous_tp = _aggregate_netcdf(ds, regridder, previous_tp)
+            daily_frames.append(daily_frame)
+
+    aggregated_data = pd.concat(daily_frames, ignore_index=True)
+    aggregated_data = aggregated_data.dropna(subset=["avg_temperature"]).sort_values(["grid_id", "time"])
 
     print(f"Saving processed climate data to {output_csv}...")
     aggregated_data.to_csv(output_csv, index=False)
     print("Processing complete!")
+
+def process_climate_archive(grid, climate_files, output_csv, time_chunk=248, days_per_block=31,
+                            regrid="area", weights_folder=None):
+    """
+    Process a multi-year ERA5 archive out of core into daily climate data per grid cell.
+
+    All files are opened as one lazily chunked dataset. Derived variables and
+    the daily resample are evaluated chunk by chunk with dask (using all
+    cores), and each block of days is regridded and appended to the output
+    as soon as it is computed, so peak memory depends on the chunk and block
+    sizes rather than on the length of the archive.
+
+    Parameters:
+    - grid (CachedGrid or str): Loaded grid (see `grid_cache.load_or_create_grid`)
+      or path to the shapefile containing grid cells.
+    - climate_files (list or str): ERA5 NetCDF paths, a glob pattern
+      (e.g., "climate_data/climate_data_*.nc"), or a climate cube Zarr store
+      (see `climate_cube.ingest_climate_files`).
+    - output_csv (str): Path to save the processed CSV file.
+    - time_chunk (int): Time steps per dask chunk (248 = one month of 3-hourly data).
+    - days_per_block (int): Days computed and written per output block.
+    - regrid (str): "area" or "within" (see `process_climate_netcdf`).
+    - weights_folder (str): Folder to cache regridding weights in.
+    """
+    grid = load_grid(grid)
+
+    print("Opening climate archive as one lazily chunked dataset...")
+    if isinstance(climate_files, str) and climate_files.rstrip("/").endswith(".zarr"):
+        ds = open_climate_cube(climate_files)
+    else:
+        ds = xr.open_mfdataset(climate_files, combine="by_coords", parallel=True)
+    time_dim = _time_dim(ds)
+    ds = _squeeze_auxiliary(ds).chunk({time_dim: time_chunk, "latitude": -1, "longitude": -1})
+    missing_variables = {"t2m", "tp", "u10", "v10", "d2m"} - set(ds.data_vars)
+    if missing_variables:
+        raise ValueError(f"Climate data is missing required variables: {missing_variables}")
+
+    # Lazy derived variables and daily aggregates; nothing is computed yet
+    temperature = kelvin_to_celsius(ds["t2m"])
+    derived = xr.Dataset({
+        "avg_temperature": temperature,
+        "avg_wind_speed": wind_speed(ds["u10"], ds["v10"]),
+        "avg_humidity": relative_humidity(temperature, kelvin_to_celsius(ds["d2m"])),
+    })
+    daily = derived.resample({time_dim: "1D"}).mean()
+    precipitation = deaccumulate(ds["tp"], time_dim=time_dim)
+    daily["total_precipitation"] = precipitation.resample({time_dim: "1D"}).sum(min_count=1)
+
+    regridder = load_or_create_regridder(grid, ds["latitude"].values, ds["longitude"].values,
+                                         method=regrid, cache_folder=weights_folder)
+    lon2d, lat2d = np.meshgrid(ds["longitude"].values, ds["latitude"].values)
+    cell_latitude = regridder.apply(lat2d[None])[0]
+    cell_longitude = regridder.apply(lon2d[None])[0]
+    n_cells = len(regridder.cell_ids)
+
+    n_days = daily.sizes[time_dim]
+    columns = ["avg_temperature", "total_precipitation", "avg_wind_speed", "avg_humidity"]
+    for start in range(0, n_days, days_per_block):
+        stop = min(start + days_per_block, n_days)
+        print(f"Processing days {start + 1}-{stop} of {n_days}...")
+        block = daily.isel({time_dim: slice(start, stop)}).compute()
+        days = block[time_dim].values.astype("datetime64[D]")
+
+        frame = pd.DataFrame({
+            "grid_id": np.tile(regridder.cell_ids, len(days)),
+            "time": np.repeat(days, n_cells),
+            **{name: regridder.apply(block[name].transpose(time_dim, "latitude", "longitude").values).ravel()
+               for name in columns},
+            "latitude": np.tile(cell_latitude, len(days)),
+            "longitude": np.tile(cell_longitude, len(days)),
+        }).dropna(subset=["avg_temperature"])
+        frame.to_csv(output_csv, mode="w" if start == 0 else "a", header=start == 0, index=False)
+
+    ds.close()
+    print(f"Processed climate data saved to {output_csv}")
+    print("Processing complete!")
@@ -0,0 +1,191 @@
+import numpy as np
+import xarray as xr
+
+# Magnus coefficients for saturation vapour pressure over water (deg C)
+MAGNUS_A = np.float32(17.625)
+MAGNUS_B = np.float32(243.04)
+KELVIN_OFFSET = np.float32(273.15)
+
+def _buffer(shape, out):
+    """Returns `out`, or a new float32 array of the given shape."""
+    if out is None:
+        out = np.empty(shape, dtype=np.float32)
+    return out
+
+def _is_xarray(*values):
+    return any(isinstance(value, xr.DataArray) for value in values)
+
+def _apply_xarray(kernel, *values):
+    """Runs a numpy kernel block-wise on DataArrays (lazily for dask-backed ones)."""
+    return xr.apply_ufunc(kernel, *values, dask="parallelized", output_dtypes=[np.float32])
+
+def kelvin_to_celsius(kelvin, out=None):
+    """
+    Converts temperatures from Kelvin to degrees Celsius.
+
+    Parameters:
+    - kelvin (np.ndarray or xr.DataArray): Temperatures in K.
+    - out (np.ndarray): Optional float32 buffer for the result (may be `kelvin` itself).
+
+    Returns:
+    - float32 array or DataArray in deg C.
+    """
+    if _is_xarray(kelvin):
+        return _apply_xarray(kelvin_to_celsius, kelvin)
+    out = _buffer(np.shape(kelvin), out)
+    return np.subtract(kelvin, KELVIN_OFFSET, out=out, dtype=np.float32)
+
+def relative_humidity(temperature_c, dewpoint_c, out=None):
+    """
+    Relative humidity from temperature and dewpoint (Magnus formula).
+
+    RH = 100 * exp(a * Td / (b + Td) - a * T / (b + T)), evaluated in
+    float32 with a single temporary.
+
+    Parameters:
+    - temperature_c (np.ndarray or xr.DataArray): 2 m temperature in deg C.
+    - dewpoint_c (np.ndarray or xr.DataArray): 2 m dewpoint in deg C.
+    - out (np.ndarray): Optional float32 buffer for the result.
+
+    Returns:
+    - float32 array or DataArray in %.
+    """
+    if _is_xarray(temperature_c, dewpoint_c):
+        return _apply_xarray(relative_humidity, temperature_c, dewpoint_c)
+    out = _buffer(np.shape(temperature_c), out)
+    scratch = np.add(dewpoint_c, MAGNUS_B, dtype=np.float32)
+    np.multiply(dewpoint_c, MAGNUS_A, out=out, dtype=np.float32)
+    np.divide(out, scratch, out=out)
+    np.add(temperature_c, MAGNUS_B, out=scratch, dtype=np.float32)
+    np.divide(temperature_c, scratch, out=scratch, dtype=np.float32)
+    np.multiply(scratch, MAGNUS_A, out=scratch)
+    np.subtract(out, scratch, out=out)
+    np.exp(out, out=out)
+    return np.multiply(out, np.float32(100), out=out)
+
+def wind_speed(u, v, out=None):
+    """
+    Wind speed from the 10 m wind components.
+
+    Parameters:
+    - u, v (np.ndarray or xr.DataArray): Eastward and northward components in m/s.
+    - out (np.ndarray): Optional float32 buffer for the result.
+
+    Returns:
+    - float32 array or DataArray in m/s.
+    """
+    if _is_xarray(u, v):
+        return _apply_xarray(wind_speed, u, v)
+    out = _buffer(np.shape(u), out)
+    return np.hypot(u, v, out=out, dtype=np.float32)
+
+def wind_direction(u, v, out=None):
+    """
+    Meteorological wind direction (the direction the wind blows from).
+
+    Parameters:
+    - u, v (np.ndarray or xr.DataArray): Eastward and northward components in m/s.
+    - out (np.ndarray): Optional float32 buffer for the result.
+
+    Returns:
+    - float32 array or DataArray in degrees clockwise from north, in [0, 360).
+    """
+    if _is_xarray(u, v):
+        return _apply_xarray(wind_direction, u, v)
+    out = _buffer(np.shape(u), out)
+    np.arctan2(u, v, out=out, dtype=np.float32)
+    np.multiply(out, np.float32(180 / np.pi), out=out)
+    np.add(out, np.float32(180), out=out)
+    return np.mod(out, np.float32(360), out=out)
+
+def deaccumulate_steps(accumulated, hour, previous, previous_hour, out=None):
+    """
+    Per-step amounts of an ERA5-Land accumulated field, element-wise.
+
+    ERA5-Land accumulates `tp` and `ssrd` from 00 UTC: the value at 00 UTC
+    is the total of the previous day, and the accumulation restarts right
+    after it. A step's amount is therefore its value minus the previous
+    step's value, or its whole value when the previous step was at 00 UTC.
+    Without a previous step (NaN `previous_hour`) the value since 00 UTC is
+    used, except at 00 UTC itself, which is NaN.
+
+    Parameters:
+    - accumulated (np.ndarray): Accumulated values at this step.
+    - hour (np.ndarray): UTC hour of this step (broadcastable).
+    - previous (np.ndarray): Accumulated values at the previous step.
+    - previous_hour (np.ndarray): UTC hour of the previous step (broadcastable), NaN if unknown.
+    - out (np.ndarray): Optional float32 buffer for the result.
+
+    Returns:
+    - np.ndarray: float32 per-step amounts, clipped at 0.
+    """
+    out = _buffer(np.broadcast_shapes(np.shape(accumulated), np.shape(previous)), out)
+    np.subtract(accumulated, previous, out=out, dtype=np.float32)
+    restart = (previous_hour == 0) | (np.isnan(previous_hour) & (hour != 0))
+    np.copyto(out, accumulated, where=restart, casting="same_kind")
+    # Small negative differences are round-off in the accumulation
+    return np.maximum(out, 0, out=out)
+
+def restart_after_gaps(previous_hour, interval, step):
+    """
+    Previous-step hours for `deaccumulate_steps`, with NaN wherever a step
+    does not directly follow the previous one.
+
+    A step is contiguous when its interval to the previous step equals the
+    time step of the data (the smallest interval between steps); after a
+    gap (e.g. a missing day or month) the step restarts as if no previous
+    step were known, instead of being differenced against older values.
+
+    Parameters:
+    - previous_hour (np.ndarray): UTC hour of the previous step.
+    - interval (np.ndarray): timedelta64 from the previous step (NaT if none).
+    - step (np.timedelta64): Time step of the data.
+
+    Returns:
+    - np.ndarray: float32 previous hours, NaN after gaps.
+    """
+    return np.where(interval == step, previous_hour, np.nan).astype(np.float32)
+
+def deaccumulate(accumulated, hours=None, previous=None, time_dim=None, out=None):
+    """
+    Converts an accumulated ERA5-Land field (`tp`, `ssrd`) into per-step amounts.
+
+    Parameters:
+    - accumulated (np.ndarray or xr.DataArray): Values with time on axis 0
+      (numpy), or along `time_dim` (xarray).
+    - hours (np.ndarray): UTC hour of each time step (numpy input only).
+    - previous (tuple): Optional (accumulated values, UTC hour) of the step
+      just before this block, to continue across blocks or files.
+    - time_dim (str): Time dimension of a DataArray ("valid_time" or "time");
+      steps after a gap in it are not differenced across the gap.
+    - out (np.ndarray): Optional float32 buffer for the result, other than
+      `accumulated` itself (numpy input only).
+
+    Returns:
+    - float32 array or DataArray of per-step amounts.
+    """
+    if _is_xarray(accumulated):
+        times = accumulated[time_dim]
+        hour = times.dt.hour.astype(np.float32)
+        # A step that does not directly follow the previous one (a missing
+        # month in the archive) restarts as if no previous step were known
+        previous_hour = hour.shift({time_dim: 1})
+        if times.size > 1:
+            interval = np.concatenate([[np.timedelta64("NaT")], np.diff(times.values)])
+            previous_hour = previous_hour.copy(data=restart_after_gaps(previous_hour.values, interval,
+                                                                       interval[1:].min()))
+        return xr.apply_ufunc(
+            deaccumulate_steps, accumulated, hour,
+            accumulated.shift({time_dim: 1}), previous_hour,
+            dask="parallelized", output_dtypes=[np.float32],
+        )
+
+    hours = np.asarray(hours, dtype=np.float32).reshape((-1,) + (1,) * (np.ndim(accumulated) - 1))
+    out = _buffer(np.shape(accumulated), out)
+    if previous is None:
+        previous_values, previous_hour = np.nan, np.float32(np.nan)
+    else:
+        previous_values, previous_hour = previous[0], np.float32(previous[1])
+    deaccumulate_steps(accumulated[:1], hours[:1], previous_values, previous_hour, out=out[:1])
+    deaccumulate_steps(accumulated[1:], hours[1:], accumulated[:-1], hours[:-1], out=out[1:])
+    return out
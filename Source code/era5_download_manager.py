@@ -0,0 +1,218 @@
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+ERA5_LAND_DATASET = "reanalysis-era5-land"
+STATE_FILE = "download_state.json"
+
+class CDSClient:
+    """
+    cdsapi client split into submitting a request and downloading its result,
+    so the request id can be recorded in between and re-attached to later.
+
+    This goes through the datastores client that cdsapi wraps (`client.client`),
+    which is not part of cdsapi's public API; requirements.txt pins the
+    versions it was written against. Use `supports` before wrapping a client.
+    """
+
+    def __init__(self, client):
+        """
+        Parameters:
+        - client (cdsapi.Client): Client created with wait_until_complete=False.
+        """
+        self.client = client
+
+    @staticmethod
+    def supports(client):
+        """True if the cdsapi client exposes the request-id API this class uses."""
+        return callable(getattr(getattr(client, "client", None), "get_remote", None))
+
+    def submit(self, dataset, request):
+        """Queues a request on the CDS and returns its request id."""
+        request_id = getattr(self.client.retrieve(dataset, request), "request_id", None)
+        if request_id is None:
+            raise RuntimeError(f"cdsapi returned no request id for {dataset}; "
+                               "install the cdsapi version pinned in requirements.txt.")
+        return request_id
+
+    def download(self, request_id, target):
+        """Waits for a queued request to complete and downloads its result."""
+        self.client.client.get_remote(request_id).download(target)
+
+def _default_client():
+    """
+    CDSClient when the installed cdsapi supports it, otherwise a plain
+    cdsapi.Client whose blocking `retrieve(dataset, request, target)` the
+    manager falls back to (request ids are then not recorded).
+    """
+    import cdsapi
+    client = cdsapi.Client(wait_until_complete=False)
+    if CDSClient.supports(client):
+        return CDSClient(client)
+    print("Installed cdsapi has no request-id API; falling back to blocking downloads "
+          "(queued requests cannot be re-attached after an interruption).")
+    return cdsapi.Client()
+
+class ERA5DownloadManager:
+    """
+    Downloads many CDS requests concurrently, with on-disk state, retries and
+    atomic writes.
+
+    Each request is tracked in a JSON state file in the output folder
+    ("pending", "running", "done" or "failed"). A re-run skips every request
+    already marked done whose file exists, so an interrupted run resumes
+    without re-requesting finished months. The CDS request id is recorded as
+    soon as a request is accepted, so a request still queued or running when
+    the run stopped is re-attached to and downloaded rather than submitted
+    again. Files are retrieved to a ".part" file and renamed into place only
+    when complete.
+    """
+
+    def __init__(self, output_folder, client_factory=None, max_concurrent=4, max_retries=4,
+                 backoff_seconds=30, dataset=ERA5_LAND_DATASET, sleep=time.sleep):
+        """
+        Parameters:
+        - output_folder (str): Folder for downloaded files and the state file.
+        - client_factory (callable): Returns a client with `submit(dataset, request)`
+          (returning a request id) and `download(request_id, target)` methods, or
+          only a `retrieve(dataset, request, target)` method, in which case
+          request ids are not recorded. Defaults to `CDSClient`, or to plain
+          cdsapi `retrieve` calls if the installed cdsapi lacks the request-id
+          API; tests can pass a local fake.
+        - max_concurrent (int): Requests in flight at once.
+        - max_retries (int): Retries per request after the first attempt.
+        - backoff_seconds (float): Base delay, doubled after each failed attempt.
+        - dataset (str): CDS dataset name.
+        - sleep (callable): Sleep function used between retries.
+        """
+        self.output_folder = Path(output_folder)
+        self.output_folder.mkdir(parents=True, exist_ok=True)
+        self.client_factory = client_factory or _default_client
+        self.max_concurrent = max_concurrent
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.dataset = dataset
+        self.sleep = sleep
+        self.state_path = self.output_folder / STATE_FILE
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.state = self._load_state()
+
+    def _load_state(self):
+        if self.state_path.exists():
+            with open(self.state_path) as f:
+                return json.load(f)
+        return {}
+
+    def _set_state(self, filename, **fields):
+        """Updates one request's entry and atomically rewrites the state file."""
+        with self._lock:
+            self.state.setdefault(filename, {}).update(fields)
+            tmp_path = self.state_path.with_suffix(".json.tmp")
+            with open(tmp_path, "w") as f:
+                json.dump(self.state, f, indent=2)
+            os.replace(tmp_path, self.state_path)
+
+    def _client(self):
+        # One client per worker thread
+        if not hasattr(self._local, "client"):
+            self._local.client = self.client_factory()
+        return self._local.client
+
+    def is_done(self, filename, request=None):
+        """
+        True if a request was completed and its file is still on disk; with
+        `request`, only if the file was downloaded for that same request.
+        """
+        entry = self.state.get(filename, {})
+        if request is not None and entry.get("request") != request:
+            return False
+        return entry.get("status") == "done" and (self.output_folder / filename).exists()
+
+    def mark_done(self, filename, request):
+        """
+        Records a file produced outside the manager (e.g. merged from other
+        downloads) as done for `request`, so `is_done` can check it like a download.
+        """
+        self._set_state(filename, status="done", request=request, request_id=None, error=None)
+
+    def _recorded_request_id(self, filename, request):
+        """CDS request id recorded for this exact request by an earlier run, if any."""
+        entry = self.state.get(filename, {})
+        return entry.get("request_id") if entry.get("request") == request else None
+
+    def _retrieve(self, filename, request, request_id, part_file):
+        """Submits the request unless it is already queued on the CDS, then downloads it."""
+        client = self._client()
+        if not hasattr(client, "submit"):
+            client.retrieve(self.dataset, request, str(part_file))
+            return
+        if request_id is None:
+            request_id = client.submit(self.dataset, request)
+            self._set_state(filename, request_id=request_id)
+            print(f"{filename} queued as CDS request {request_id}.")
+        else:
+            print(f"Re-attaching {filename} to CDS request {request_id}...")
+        client.download(request_id, str(part_file))
+
+    def _download_one(self, filename, request):
+        target = self.output_folder / filename
+        part_file = target.with_name(target.name + ".part")
+        attempts = self.state.get(filename, {}).get("attempts", 0)
+        request_id = self._recorded_request_id(filename, request)
+
+        for attempt in range(self.max_retries + 1):
+            attempts += 1
+            self._set_state(filename, status="running", attempts=attempts, request=request, request_id=request_id)
+            try:
+                print(f"Requesting {filename} (attempt {attempt + 1})...")
+                self._retrieve(filename, request, request_id, part_file)
+                os.replace(part_file, target)
+                self._set_state(filename, status="done", error=None)
+                print(f"Saved: {target}")
+                return filename
+            except Exception as e:
+                if part_file.exists():
+                    part_file.unlink()
+                # A request that failed on the CDS is submitted afresh on the next attempt
+                request_id = None
+                self._set_state(filename, status="pending", error=str(e), request_id=None)
+                if attempt == self.max_retries:
+                    break
+                delay = self.backoff_seconds * 2 ** attempt * (1 + random.random() / 4)
+                print(f"Request for {filename} failed ({e}); retrying in {delay:.0f}s...")
+                self.sleep(delay)
+
+        self._set_state(filename, status="failed")
+        raise RuntimeError(f"Download of {filename} failed after {self.max_retries + 1} attempts")
+
+    def download(self, requests):
+        """
+        Downloads every request not already done.
+
+        Parameters:
+        - requests (dict): Output filename -> CDS request dict.
+
+        Returns:
+        - dict: Output filename -> final status ("done" or "failed").
+        """
+        todo = {name: request for name, request in requests.items() if not self.is_done(name, request)}
+        for name in requests.keys() - todo.keys():
+            print(f"{name} already downloaded. Skipping.")
+
+        results = {name: "done" for name in requests.keys() - todo.keys()}
+        with ThreadPoolExecutor(max_workers=self.max_concurrent) as pool:
+            futures = {pool.submit(self._download_one, name, request): name for name, request in todo.items()}
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    future.result()
+                    results[name] = "done"
+                except RuntimeError as e:
+                    print(e)
+                    results[name] = "failed"
+        return results
@@ -0,0 +1,220 @@
+import hashlib
+import numpy as np
+import shapely
+from pathlib import Path
+from pyproj import Transformer
+from scipy import sparse
+
+def era5_signature(latitude, longitude):
+    """
+    Hash identifying an ERA5 pixel lattice.
+
+    Parameters:
+    - latitude, longitude (np.ndarray): 1-D pixel-centre coordinates.
+
+    Returns:
+    - str: Hex digest of the rounded coordinates.
+    """
+    digest = hashlib.sha256()
+    digest.update(np.round(np.asarray(latitude, dtype=float), 6).tobytes())
+    digest.update(b"|")
+    digest.update(np.round(np.asarray(longitude, dtype=float), 6).tobytes())
+    return digest.hexdigest()[:16]
+
+def grid_signature(grid):
+    """
+    Hash identifying a grid: its cache key, or a hash of its cells.
+
+    Parameters:
+    - grid (CachedGrid): Loaded grid.
+
+    Returns:
+    - str
+    """
+    if grid.key is not None:
+        return grid.key
+    digest = hashlib.sha256()
+    digest.update(grid.gdf["grid_id"].to_numpy(dtype=np.int64).tobytes())
+    for wkb in shapely.to_wkb(grid.gdf.geometry.values):
+        digest.update(wkb)
+    return digest.hexdigest()[:16]
+
+def _cell_edges(centres):
+    """Pixel edges from 1-D pixel-centre coordinates (either order)."""
+    centres = np.asarray(centres, dtype=float)
+    if len(centres) == 1:
+        return np.array([centres[0] - 0.05, centres[0] + 0.05])
+    mid = (centres[:-1] + centres[1:]) / 2
+    return np.concatenate([[2 * centres[0] - mid[0]], mid, [2 * centres[-1] - mid[-1]]])
+
+def _projected_cells(grid):
+    """Grid cell polygons in the grid's projected CRS."""
+    crs = grid.index.crs if grid.index is not None else "EPSG:3005"
+    return grid.gdf.to_crs(crs), crs
+
+class ERA5Regridder:
+    """
+    Sparse (n_cells x n_pixels) weight matrix from an ERA5 pixel lattice to
+    grid cells. Applying it to a whole block of time steps is one sparse
+    matrix - dense matrix product.
+    """
+
+    def __init__(self, weights, cell_ids):
+        """
+        Parameters:
+        - weights (scipy.sparse matrix): (n_cells, n_lat * n_lon) weights over
+          the flattened (lat, lon) pixels; each row sums to 1.
+        - cell_ids (np.ndarray): grid_id of each weight row.
+        """
+        self.weights = sparse.csr_matrix(weights)
+        self.cell_ids = np.asarray(cell_ids, dtype=np.int64)
+
+    @classmethod
+    def within(cls, grid, latitude, longitude):
+        """
+        Equal weights for the pixels whose centres fall within each cell
+        (the original point-in-polygon mapping).
+
+        Parameters:
+        - grid (CachedGrid): Loaded grid.
+        - latitude, longitude (np.ndarray): 1-D pixel-centre coordinates.
+
+        Returns:
+        - ERA5Regridder
+        """
+        lon2d, lat2d = np.meshgrid(longitude, latitude)
+        pixel_ids = grid.assign_points(lon2d.ravel(), lat2d.ravel())
+        pixels = np.flatnonzero(pixel_ids > 0)
+        cell_ids, rows = np.unique(pixel_ids[pixels], return_inverse=True)
+        counts = np.bincount(rows)
+        weights = sparse.csr_matrix((1.0 / counts[rows], (rows, pixels)), shape=(len(cell_ids), lon2d.size))
+        return cls(weights, cell_ids)
+
+    @classmethod
+    def area_weighted(cls, grid, latitude, longitude):
+        """
+        Weights proportional to the area each ERA5 pixel shares with each
+        cell, so every cell touched by a pixel gets a value.
+
+        Parameters:
+        - grid (CachedGrid): Loaded grid.
+        - latitude, longitude (np.ndarray): 1-D pixel-centre coordinates.
+
+        Returns:
+        - ERA5Regridder
+        """
+        cells_gdf, crs = _projected_cells(grid)
+        lat_edges = _cell_edges(latitude)
+        lon_edges = _cell_edges(longitude)
+        n_lat, n_lon = len(latitude), len(longitude)
+
+        # Only pixels overlapping the grid extent become polygons
+        minx, miny, maxx, maxy = grid.gdf.total_bounds
+        lat_lo, lat_hi = np.minimum(lat_edges[:-1], lat_edges[1:]), np.maximum(lat_edges[:-1], lat_edges[1:])
+        lon_lo, lon_hi = np.minimum(lon_edges[:-1], lon_edges[1:]), np.maximum(lon_edges[:-1], lon_edges[1:])
+        lat_idx = np.flatnonzero((lat_hi >= miny) & (lat_lo <= maxy))
+        lon_idx = np.flatnonzero((lon_hi >= minx) & (lon_lo <= maxx))
+        ii, jj = np.meshgrid(lat_idx, lon_idx, indexing="ij")
+        ii, jj = ii.ravel(), jj.ravel()
+        pixel_boxes = shapely.box(lon_lo[jj], lat_lo[ii], lon_hi[jj], lat_hi[ii])
+        # Densify the edges so they follow the projection's curvature
+        pixel_boxes = shapely.segmentize(pixel_boxes, np.abs(np.diff(lon_edges)).min() / 8)
+
+        transformer = Transformer.from_crs("EPSG:4326", crs, always_xy=True)
+        pixel_polys = shapely.transform(pixel_boxes, lambda xy: np.column_stack(transformer.transform(xy[:, 0], xy[:, 1])))
+
+        cell_geoms = cells_gdf.geometry.values
+        tree = shapely.STRtree(pixel_polys)
+        cell_rows, pixel_cols = tree.query(cell_geoms, predicate="intersects")
+        areas = shapely.area(shapely.intersection(cell_geoms[cell_rows], pixel_polys[pixel_cols]))
+        keep = areas > 0
+        cell_rows, pixel_cols, areas = cell_rows[keep], pixel_cols[keep], areas[keep]
+
+        cell_codes, rows = np.unique(cell_rows, return_inverse=True)
+        row_totals = np.bincount(rows, weights=areas)
+        flat_pixels = ii[pixel_cols] * n_lon + jj[pixel_cols]
+        weights = sparse.csr_matrix((areas / row_totals[rows], (rows, flat_pixels)),
+                                    shape=(len(cell_codes), n_lat * n_lon))
+        return cls(weights, cells_gdf["grid_id"].to_numpy(dtype=np.int64)[cell_codes])
+
+    def apply(self, values):
+        """
+        Regrids a block of time steps.
+
+        NaN pixels (e.g. ocean in ERA5-Land) are left out and the remaining
+        weights of each cell are renormalized; cells with no valid pixel get NaN.
+
+        Parameters:
+        - values (np.ndarray): (n_times, n_lat, n_lon) or (n_times, n_pixels).
+
+        Returns:
+        - np.ndarray: (n_times, n_cells) cell values.
+        """
+        values = np.asarray(values)
+        values = values.reshape(values.shape[0], -1).T
+        valid = ~np.isnan(values)
+        totals = self.weights @ np.where(valid, values, 0)
+        coverage = self.weights @ valid.astype(values.dtype)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return (totals / coverage).T
+
+    def save(self, path):
+        """
+        Saves the weights as a compressed .npz file.
+
+        Parameters:
+        - path (str): Output path.
+        """
+        np.savez_compressed(path, data=self.weights.data, indices=self.weights.indices,
+                            indptr=self.weights.indptr, shape=np.array(self.weights.shape),
+                            cell_ids=self.cell_ids)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads weights saved with `save`.
+
+        Parameters:
+        - path (str): Path to the .npz file.
+
+        Returns:
+        - ERA5Regridder
+        """
+        with np.load(path) as data:
+            weights = sparse.csr_matrix((data["data"], data["indices"], data["indptr"]), shape=tuple(data["shape"]))
+            return cls(weights, data["cell_ids"])
+
+def load_or_create_regridder(grid, latitude, longitude, method="area", cache_folder=None):
+    """
+    Returns the regridder for an ERA5 lattice and a grid, computing the
+    weights once and reusing them from the cache afterwards.
+
+    Parameters:
+    - grid (CachedGrid): Loaded grid.
+    - latitude, longitude (np.ndarray): 1-D pixel-centre coordinates.
+    - method (str): "area" for area-overlap weights or "within" for the
+      original pixel-centre-in-cell mapping.
+    - cache_folder (str): Folder for cached weights, keyed by
+      (ERA5 signature, grid signature, method). No caching when None.
+
+    Returns:
+    - ERA5Regridder
+    """
+    builders = {"area": ERA5Regridder.area_weighted, "within": ERA5Regridder.within}
+    if method not in builders:
+        raise ValueError(f"Unknown regridding method: {method}")
+
+    cache_file = None
+    if cache_folder is not None:
+        cache_file = Path(cache_folder) / f"weights_{method}_{era5_signature(latitude, longitude)}_{grid_signature(grid)}.npz"
+        if cache_file.exists():
+            print(f"Loading cached regridding weights from {cache_file}...")
+            return ERA5Regridder.load(cache_file)
+
+    print(f"Computing {method} regridding weights from ERA5 pixels to grid cells...")
+    regridder = builders[method](grid, latitude, longitude)
+    if cache_file is not None:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        print(f"Saving regridding weights to {cache_file}...")
+        regridder.save(cache_file)
+    return regridder
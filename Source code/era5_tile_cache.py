@@ -0,0 +1,194 @@
+import hashlib
+import os
+import numpy as np
+import shapely
+import xarray as xr
+from pathlib import Path
+from era5_download_manager import ERA5DownloadManager
+from climate_data_fetcher import ERA5_VARIABLES, ERA5_LAND_RESOLUTION, era5_month_request, _province_geometry
+
+TILE_SIZE = 5
+DEFAULT_MAX_BYTES = 50 * 1024 ** 3
+
+def variables_signature(variables):
+    """Short hash naming a set of ERA5 variables."""
+    return hashlib.sha256("|".join(sorted(variables)).encode()).hexdigest()[:12]
+
+class ERA5TileCache:
+    """
+    Local cache of ERA5-Land data in fixed global tiles, shared across provinces and runs.
+
+    Each tile covers TILE_SIZE x TILE_SIZE degrees (pixel centres from its
+    south-west corner up to, but excluding, the next tile) for one month and
+    one set of variables, stored as
+    `{cache_folder}/{variables signature}/{year}-{month}/tile_{lat}_{lon}.nc`.
+    A request for any area is assembled from the tiles it overlaps, and only
+    missing tiles are downloaded. When the cache grows past `max_bytes`, the
+    least recently used tiles are evicted (a tile's modification time is
+    refreshed whenever it is used).
+    """
+
+    def __init__(self, cache_folder, max_bytes=DEFAULT_MAX_BYTES, variables=ERA5_VARIABLES, client_factory=None,
+                 max_concurrent=4, tile_size=TILE_SIZE, resolution=ERA5_LAND_RESOLUTION):
+        """
+        Parameters:
+        - cache_folder (str): Root folder of the cache.
+        - max_bytes (int): Size cap of the cached tiles.
+        - variables (list): ERA5 variables stored in every tile.
+        - client_factory (callable): CDS client factory passed to the download manager.
+        - max_concurrent (int): Tile requests in flight at once.
+        - tile_size (int): Tile edge in degrees.
+        - resolution (float): ERA5 grid spacing in degrees.
+        """
+        self.cache_folder = Path(cache_folder)
+        self.max_bytes = max_bytes
+        self.variables = list(variables)
+        self.client_factory = client_factory
+        self.max_concurrent = max_concurrent
+        self.tile_size = tile_size
+        self.resolution = resolution
+        self.variables_folder = self.cache_folder / variables_signature(self.variables)
+
+    def month_folder(self, year, month):
+        return self.variables_folder / f"{year}-{month:02d}"
+
+    @staticmethod
+    def tile_name(tile):
+        lat0, lon0 = tile
+        return f"tile_{lat0:+03d}_{lon0:+04d}.nc"
+
+    def tile_area(self, tile):
+        """CDS area [North, West, South, East] of a tile's pixel centres."""
+        lat0, lon0 = tile
+        inner = self.tile_size - self.resolution
+        return [round(lat0 + inner, 6), lon0, lat0, round(lon0 + inner, 6)]
+
+    def tiles_for(self, bbox, province=None):
+        """
+        Tiles overlapping a bounding box, optionally only those touching a province.
+
+        Parameters:
+        - bbox (list): [min_lon, min_lat, max_lon, max_lat].
+        - province (shapely geometry or GeoDataFrame): Optional boundary.
+
+        Returns:
+        - list: (lat0, lon0) south-west corners.
+        """
+        min_lon, min_lat, max_lon, max_lat = bbox
+        half = self.resolution / 2
+        lat_starts = np.arange(np.floor((min_lat - half) / self.tile_size), np.floor((max_lat + half) / self.tile_size) + 1)
+        lon_starts = np.arange(np.floor((min_lon - half) / self.tile_size), np.floor((max_lon + half) / self.tile_size) + 1)
+        tiles = [(int(i * self.tile_size), int(j * self.tile_size)) for i in lat_starts for j in lon_starts]
+        if province is not None:
+            geometry = _province_geometry(province)
+            boxes = shapely.box([lon0 - half for _, lon0 in tiles], [lat0 - half for lat0, _ in tiles],
+                                [lon0 + self.tile_size - half for _, lon0 in tiles],
+                                [lat0 + self.tile_size - half for lat0, _ in tiles])
+            tiles = [tile for tile, hit in zip(tiles, shapely.intersects(geometry, boxes)) if hit]
+        return tiles
+
+    def ensure_tiles(self, tiles, year, month):
+        """
+        Downloads the tiles of one month that are not cached yet.
+
+        Parameters:
+        - tiles (list): (lat0, lon0) tiles.
+        - year (int), month (int): Month to fetch.
+
+        Returns:
+        - list: Paths of the cached tiles, in the order of `tiles`.
+        """
+        folder = self.month_folder(year, month)
+        paths = [folder / self.tile_name(tile) for tile in tiles]
+        missing = {path.name: era5_month_request(self.tile_area(tile), year, month) | {"variable": self.variables}
+                   for tile, path in zip(tiles, paths) if not path.exists()}
+        print(f"{year}-{month:02d}: {len(tiles) - len(missing)} of {len(tiles)} tiles cached, fetching {len(missing)}...")
+        if missing:
+            manager = ERA5DownloadManager(folder, client_factory=self.client_factory, max_concurrent=self.max_concurrent)
+            results = manager.download(missing)
+            failed = [name for name, status in results.items() if status != "done"]
+            if failed:
+                raise RuntimeError(f"Could not fetch ERA5 tiles: {', '.join(failed)}")
+
+        # Mark the tiles as used, then keep the cache under its size cap
+        for path in paths:
+            os.utime(path)
+        self.evict(protected=set(paths))
+        return paths
+
+    def cached_tiles(self):
+        """All cached tile files with their size and last use, least recently used first."""
+        tiles = [(path, path.stat()) for path in self.cache_folder.glob("*/*/tile_*.nc")]
+        return [(path, stat.st_size, stat.st_mtime) for path, stat in sorted(tiles, key=lambda item: item[1].st_mtime)]
+
+    def cache_size(self):
+        """Total bytes of the cached tiles."""
+        return sum(size for _, size, _ in self.cached_tiles())
+
+    def evict(self, protected=()):
+        """
+        Deletes least recently used tiles until the cache fits `max_bytes`.
+
+        Parameters:
+        - protected (set): Tile paths that must not be evicted (e.g. the current request's).
+
+        Returns:
+        - list: Evicted tile paths.
+        """
+        tiles = self.cached_tiles()
+        total = sum(size for _, size, _ in tiles)
+        evicted = []
+        for path, size, _ in tiles:
+            if total <= self.max_bytes:
+                break
+            if path in protected:
+                continue
+            path.unlink()
+            total -= size
+            evicted.append(path)
+        if evicted:
+            print(f"Evicted {len(evicted)} least recently used tiles; cache is now {total / 1e6:.0f} MB")
+        return evicted
+
+    def open_month(self, bbox, year, month, province=None):
+        """
+        ERA5 data of one month for any bounding box, assembled from cached tiles.
+
+        Parameters:
+        - bbox (list): [min_lon, min_lat, max_lon, max_lat].
+        - year (int), month (int): Month to read.
+        - province (shapely geometry or GeoDataFrame): Optional boundary; only
+          the tiles touching it are fetched (pixels of other tiles are NaN).
+
+        Returns:
+        - xr.Dataset: Pixels whose cells overlap the bounding box.
+        """
+        tiles = self.tiles_for(bbox, province)
+        parts = []
+        for path in self.ensure_tiles(tiles, year, month):
+            with xr.open_dataset(path) as ds:
+                # Round the coordinates so that pixels of neighbouring tiles line up
+                parts.append(ds.load().assign_coords(latitude=np.round(ds["latitude"].values, 4),
+                                                     longitude=np.round(ds["longitude"].values, 4)))
+        merged = xr.merge(parts, join="outer", compat="no_conflicts")
+        merged = merged.sortby("latitude", ascending=False).sortby("longitude")
+
+        min_lon, min_lat, max_lon, max_lat = bbox
+        half = self.resolution / 2
+        return merged.sel(latitude=slice(max_lat + half, min_lat - half), longitude=slice(min_lon - half, max_lon + half))
+
+    def write_month(self, bbox, year, month, output_file, province=None):
+        """
+        Writes one month for a bounding box to NetCDF from the cached tiles.
+
+        Parameters:
+        - bbox (list): [min_lon, min_lat, max_lon, max_lat].
+        - year (int), month (int): Month to write.
+        - output_file (str): Output NetCDF path.
+        - province (shapely geometry or GeoDataFrame): Optional boundary (see `open_month`).
+        """
+        ds = self.open_month(bbox, year, month, province)
+        tmp_file = str(output_file) + ".part"
+        ds.to_netcdf(tmp_file)
+        os.replace(tmp_file, output_file)
+        print(f"Saved: {output_file}")
@@ -1,24 +1,26 @@
 import requests
 import json
+import math
+import os
+import rasterio
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from rasterio.crs import CRS
+from rasterio.transform import from_origin
+from raster_io import write_cog
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-def load_access_token():
-    try:
-        with open("project_data/access_token.json", "r") as f:
-            data = json.load(f)
-            return data["access_token"]
-    except FileNotFoundError:
-        print("Access token file not found. Please generate it first.")
-        return None
+PROCESS_API_URL = "https://sh.dataspace.copernicus.eu/api/v1/process"
+# COPERNICUS_30 is posted at 1 arc-second
+DEM_RESOLUTION = 1 / 3600
+# Largest output the Process API returns per request
+TILE_PIXELS = 2500
 
-def fetch_dem_data(bbox, output_file="dem_data.tif"):
-    access_token = load_access_token()
-    if not access_token:
-        print("Access token is missing or invalid.")
-        return False
-
-    url = "https://sh.dataspace.copernicus.eu/api/v1/process"
+GDAL_TYPE_NAMES = {"uint8": "Byte", "uint16": "UInt16", "int16": "Int16", "uint32": "UInt32",
+                   "int32": "Int32", "float32": "Float32", "float64": "Float64"}
 
-    evalscript = """
+EVALSCRIPT = """
     //VERSION=3
     function setup() {
       return {
@@ -36,11 +38,81 @@ def fetch_dem_data(bbox, output_file="dem_data.tif"):
     }
     """
 
-    payload = {
+def load_access_token():
+    try:
+        with open("project_data/access_token.json", "r") as f:
+            data = json.load(f)
+            return data["access_token"]
+    except FileNotFoundError:
+        print("Access token file not found. Please generate it first.")
+        return None
+
+def dem_tiles(bbox, resolution=DEM_RESOLUTION, tile_pixels=TILE_PIXELS):
+    """
+    Splits a bounding box into DEM tiles at the native resolution.
+
+    Tiles sit on a global lattice of `tile_pixels` x `tile_pixels` pixels,
+    so interior tiles are the same for any bounding box that contains them
+    and can be reused across runs; edge tiles are clipped to the box.
+
+    Parameters:
+    - bbox (list): [min_lon, min_lat, max_lon, max_lat] in EPSG:4326.
+    - resolution (float): Pixel size in degrees.
+    - tile_pixels (int): Tile edge in pixels.
+
+    Returns:
+    - list: One dict per tile with its name, bounds (west, south, east, north),
+      width and height in pixels.
+    """
+    # Global pixel indices of the box, snapped outwards to the lattice
+    col_start = math.floor(bbox[0] / resolution + 1e-9)
+    col_stop = math.ceil(bbox[2] / resolution - 1e-9)
+    row_start = math.floor(-bbox[3] / resolution + 1e-9)
+    row_stop = math.ceil(-bbox[1] / resolution - 1e-9)
+
+    tiles = []
+    for tile_row in range(row_start // tile_pixels, (row_stop - 1) // tile_pixels + 1):
+        for tile_col in range(col_start // tile_pixels, (col_stop - 1) // tile_pixels + 1):
+            row0 = max(tile_row * tile_pixels, row_start)
+            row1 = min((tile_row + 1) * tile_pixels, row_stop)
+            col0 = max(tile_col * tile_pixels, col_start)
+            col1 = min((tile_col + 1) * tile_pixels, col_stop)
+            tiles.append({
+                "name": f"dem_r{row0}_c{col0}_{col1 - col0}x{row1 - row0}.tif",
+                "bounds": (col0 * resolution, -row1 * resolution, col1 * resolution, -row0 * resolution),
+                "width": col1 - col0,
+                "height": row1 - row0,
+            })
+    return tiles
+
+def dem_session(access_token, max_retries=5, backoff_factor=1.0, pool_size=8):
+    """
+    HTTP session with a connection pool and retries on throttling and server errors.
+
+    Parameters:
+    - access_token (str): Bearer token for the Process API.
+    - max_retries (int): Retries per request.
+    - backoff_factor (float): Base of the exponential backoff between retries (s).
+    - pool_size (int): Connections kept open (at least the number of workers).
+
+    Returns:
+    - requests.Session
+    """
+    retry = Retry(total=max_retries, backoff_factor=backoff_factor,
+                  status_forcelist=[429, 500, 502, 503, 504], allowed_methods=["POST"])
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"})
+    return session
+
+def _dem_payload(tile):
+    return {
         "input": {
             "bounds": {
                 "properties": {"crs": "http://www.opengis.net/def/crs/EPSG/0/4326"},
-                "bbox": bbox,
+                "bbox": list(tile["bounds"]),
             },
             "data": [
                 {
@@ -50,27 +122,161 @@ def fetch_dem_data(bbox, output_file="dem_data.tif"):
             ],
         },
         "output": {
-            "width": 2500,
-            "height": 2500,
+            "width": tile["width"],
+            "height": tile["height"],
             "responses": [
                 {"identifier": "default", "format": {"type": "image/tiff"}},
             ],
         },
-        "evalscript": evalscript,
+        "evalscript": EVALSCRIPT,
     }
 
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json",
-    }
+def _fetch_tile(session, url, tile, tile_path):
+    """Downloads one tile to a .part file, georeferences it and moves it into place."""
+    response = session.post(url, json=_dem_payload(tile))
+    response.raise_for_status()
 
-    response = requests.post(url, headers=headers, json=payload)
+    part_path = tile_path.with_name(tile_path.name + ".part")
+    with open(part_path, "wb") as f:
+        f.write(response.content)
+    # Georeference from the requested bounds so the mosaic never depends on the response headers
+    west, _, _, north = tile["bounds"]
+    resolution = (tile["bounds"][2] - west) / tile["width"]
+    with rasterio.open(part_path, "r+") as dst:
+        dst.crs = CRS.from_epsg(4326)
+        dst.transform = from_origin(west, north, resolution, resolution)
+    os.replace(part_path, tile_path)
+    return tile_path
 
-    if response.status_code == 200:
-        with open(output_file, "wb") as f:
-            f.write(response.content)
-        print(f"DEM data saved as '{output_file}'")
-        return True
-    else:
-        print(f"Failed to fetch DEM data: {response.status_code} - {response.content}")
+def fetch_dem_tiles(bbox, tile_folder, access_token, url=PROCESS_API_URL, resolution=DEM_RESOLUTION,
+                    tile_pixels=TILE_PIXELS, max_workers=4, session=None):
+    """
+    Fetches the DEM tiles of a bounding box concurrently; tiles already in
+    tile_folder are not requested again.
+
+    Parameters:
+    - bbox (list): [min_lon, min_lat, max_lon, max_lat].
+    - tile_folder (str): Folder holding one GeoTIFF per tile.
+    - access_token (str): Bearer token for the Process API.
+    - url (str): Process API endpoint (overridable, e.g. for a local stub server).
+    - resolution (float): Pixel size in degrees.
+    - tile_pixels (int): Tile edge in pixels.
+    - max_workers (int): Tiles requested at once.
+    - session (requests.Session): Optional session (defaults to `dem_session`).
+
+    Returns:
+    - tuple: (paths of all tiles, names of tiles that failed).
+    """
+    tile_folder = Path(tile_folder)
+    tile_folder.mkdir(parents=True, exist_ok=True)
+    tiles = dem_tiles(bbox, resolution, tile_pixels)
+    missing = [tile for tile in tiles if not (tile_folder / tile["name"]).exists()]
+    print(f"DEM: {len(tiles)} tiles, {len(tiles) - len(missing)} already downloaded, fetching {len(missing)}...")
+
+    session = session or dem_session(access_token, pool_size=max_workers)
+    failed = []
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(_fetch_tile, session, url, tile, tile_folder / tile["name"]): tile for tile in missing}
+        for done, future in enumerate(as_completed(futures), start=1):
+            tile = futures[future]
+            try:
+                future.result()
+                print(f"Saved DEM tile {tile['name']} ({done}/{len(missing)})")
+            except (requests.RequestException, rasterio.errors.RasterioError) as e:
+                print(f"Failed to fetch DEM tile {tile['name']}: {e}")
+                failed.append(tile["name"])
+    return [tile_folder / tile["name"] for tile in tiles], failed
+
+def build_dem_mosaic(tile_paths, output_file):
+    """
+    Assembles DEM tiles into a VRT, and into a Cloud Optimized GeoTIFF when
+    output_file is not a .vrt.
+
+    The VRT only references the tiles, and the COG is streamed from it by
+    GDAL, so the mosaic is never held in memory.
+
+    Parameters:
+    - tile_paths (list): Tile GeoTIFFs on one lattice.
+    - output_file (str): Output .vrt or .tif path.
+
+    Returns:
+    - str: Path of the mosaic.
+    """
+    output_file = Path(output_file)
+    vrt_file = output_file if output_file.suffix == ".vrt" else output_file.with_suffix(".vrt")
+
+    tiles = []
+    for path in tile_paths:
+        with rasterio.open(path) as src:
+            tiles.append((Path(path), src.transform, src.width, src.height, src.dtypes[0], src.nodata, src.crs))
+    resolution = tiles[0][1].a
+    west = min(transform.c for _, transform, _, _, _, _, _ in tiles)
+    north = max(transform.f for _, transform, _, _, _, _, _ in tiles)
+    east = max(transform.c + width * resolution for _, transform, width, _, _, _, _ in tiles)
+    south = min(transform.f - height * resolution for _, transform, _, height, _, _, _ in tiles)
+    width, height = round((east - west) / resolution), round((north - south) / resolution)
+    dtype, nodata, crs = tiles[0][4], tiles[0][5], tiles[0][6]
+
+    sources = []
+    for path, transform, tile_width, tile_height, _, _, _ in tiles:
+        x_off, y_off = round((transform.c - west) / resolution), round((north - transform.f) / resolution)
+        sources.append(
+            f'    <SimpleSource>\n'
+            f'      <SourceFilename relativeToVRT="1">{os.path.relpath(path, vrt_file.parent)}</SourceFilename>\n'
+            f'      <SourceBand>1</SourceBand>\n'
+            f'      <SrcRect xOff="0" yOff="0" xSize="{tile_width}" ySize="{tile_height}"/>\n'
+            f'      <DstRect xOff="{x_off}" yOff="{y_off}" xSize="{tile_width}" ySize="{tile_height}"/>\n'
+            f'    </SimpleSource>\n')
+    nodata_xml = f"    <NoDataValue>{nodata}</NoDataValue>\n" if nodata is not None else ""
+    with open(vrt_file, "w") as f:
+        f.write(f'<VRTDataset rasterXSize="{width}" rasterYSize="{height}">\n'
+                f'  <SRS>{crs.to_wkt()}</SRS>\n'
+                f'  <GeoTransform>{west!r}, {resolution!r}, 0, {north!r}, 0, {-resolution!r}</GeoTransform>\n'
+                f'  <VRTRasterBand dataType="{GDAL_TYPE_NAMES[dtype]}" band="1">\n'
+                f'{nodata_xml}{"".join(sources)}'
+                f'  </VRTRasterBand>\n'
+                f'</VRTDataset>\n')
+    print(f"DEM mosaic VRT saved as '{vrt_file}'")
+
+    if output_file == vrt_file:
+        return str(vrt_file)
+    write_cog(vrt_file, output_file)
+    print(f"DEM data saved as '{output_file}'")
+    return str(output_file)
+
+def fetch_dem_data(bbox, output_file="dem_data.tif", tile_folder=None, url=PROCESS_API_URL, access_token=None,
+                   max_workers=4, tile_pixels=TILE_PIXELS, resolution=DEM_RESOLUTION):
+    """
+    Fetches the Copernicus 30 m DEM for a bounding box at its native
+    resolution, as concurrently requested tiles assembled into a mosaic.
+
+    Re-running after an interruption only requests the missing tiles.
+
+    Parameters:
+    - bbox (list): [min_lon, min_lat, max_lon, max_lat].
+    - output_file (str): Mosaic path (.tif for a COG, .vrt for a VRT).
+    - tile_folder (str): Folder for the tiles (defaults to "<output>_tiles").
+    - url (str): Process API endpoint.
+    - access_token (str): Bearer token (defaults to project_data/access_token.json).
+    - max_workers (int): Tiles requested at once.
+    - tile_pixels (int): Tile edge in pixels.
+    - resolution (float): Pixel size in degrees.
+
+    Returns:
+    - bool: True when the mosaic was written.
+    """
+    access_token = access_token or load_access_token()
+    if not access_token:
+        print("Access token is missing or invalid.")
         return False
+
+    output_file = Path(output_file)
+    tile_folder = tile_folder or output_file.with_name(output_file.stem + "_tiles")
+    tile_paths, failed = fetch_dem_tiles(bbox, tile_folder, access_token, url=url, resolution=resolution,
+                                         tile_pixels=tile_pixels, max_workers=max_workers)
+    if failed:
+        print(f"Failed to fetch {len(failed)} DEM tiles; re-run to retry them.")
+        return False
+
+    build_dem_mosaic(tile_paths, output_file)
+    return True
@@ -1,19 +1,46 @@
 import pandas as pd
-import geopandas as gpd
-from shapely.geometry import Point
+from fire_events import FireEvents, cause_labels
+from grid_cache import load_grid
+from nfdb_archive import ensure_fire_archive, read_fires
 
-def process_fire_data(fire_file, grid_shapefile, climate_csv, output_csv):
+FIRE_COLUMNS = ["LATITUDE", "LONGITUDE", "REP_DATE", "SIZE_HA", "CAUSE"]
+
+def process_fire_data(fire_file, grid, climate_csv, output_csv, archive_folder=None, cause_strings=True):
     """
     Process fire history data, map it to grid cells, and integrate with climate data.
 
+    The NFDB text file is converted once into a partitioned Parquet archive
+    (see `nfdb_archive.ensure_fire_archive`); each run then reads only the
+    fires inside the grid's bounding box and the climate data's date range.
+    Fires are aggregated per grid cell and day into a sparse `FireEvents`
+    table and matched to the climate rows on integer (grid_id, day) keys.
+
     Parameters:
-    - fire_file (str): Path to the fire history data file (e.g., CSV or TXT).
-    - grid_shapefile (str): Path to the shapefile containing grid cells.
+    - fire_file (str): Path to the NFDB fire history file, or a folder holding
+      NFDB_point_*.txt releases (the newest is used).
+    - grid (CachedGrid or str): Loaded grid (see `grid_cache.load_or_create_grid`)
+      or path to the shapefile containing grid cells.
     - climate_csv (str): Path to the processed climate data CSV.
     - output_csv (str): Path to save the combined data.
+    - archive_folder (str): Folder of the Parquet archive (defaults to
+      "nfdb_archive" next to the NFDB file).
+    - cause_strings (bool): Also write the causes as comma-separated codes
+      ("fire_cause") next to the fire_cause_mask bitmask.
+
+    Returns:
+    - FireEvents: Fires per grid cell and day.
     """
-    print(f"Loading fire history data from {fire_file}...")
-    fire_df = pd.read_csv(fire_file, delimiter=",")  # Adjust delimiter as needed
+    grid = load_grid(grid)
+
+    print(f"Loading processed climate data from {climate_csv}...")
+    climate_df = pd.read_csv(climate_csv)
+    climate_times = pd.to_datetime(climate_df["time"])
+
+    archive_folder = ensure_fire_archive(fire_file, archive_folder)
+    print(f"Loading fire history data from {archive_folder}...")
+    bbox = grid.gdf.to_crs("EPSG:4326").total_bounds
+    fire_df = read_fires(archive_folder, bbox=bbox, start=climate_times.min().normalize(),
+                         end=climate_times.max().normalize(), columns=FIRE_COLUMNS)
 
     # Rename columns to match expected format
     column_mapping = {
@@ -31,40 +58,23 @@ def process_fire_data(fire_file, grid_shapefile, climate_csv, output_csv):
         missing_columns = required_columns - set(fire_df.columns)
         raise ValueError(f"Fire data is missing required columns: {missing_columns}")
 
-    print("Converting fire data to GeoDataFrame...")
-    fire_gdf = gpd.GeoDataFrame(
-        fire_df,
-        geometry=gpd.points_from_xy(fire_df["longitude"], fire_df["latitude"]),
-        crs="EPSG:4326"
-    )
-
-    print(f"Loading grid shapefile from {grid_shapefile}...")
-    grid_gdf = gpd.read_file(grid_shapefile)
-
     print("Mapping fire data to grid cells...")
-    fire_with_grid = gpd.sjoin(fire_gdf, grid_gdf, how="inner", predicate="within")
+    grid_ids = grid.assign_points(fire_df["longitude"], fire_df["latitude"])
 
     print("Aggregating fire data by grid cells and dates...")
-    fire_with_grid["fire_date"] = pd.to_datetime(fire_with_grid["fire_date"]).dt.date
-    fire_summary = fire_with_grid.groupby(["grid_id", "fire_date"]).agg(
-        fire_count=("geometry", "count"),  # Count the number of fires
-        total_fire_size=("fire_size", "sum"),  # Sum fire sizes
-        fire_cause=("fire_cause", lambda x: ', '.join(x.dropna().unique())),  # Concatenate unique causes
-    ).reset_index()
-
-    print(f"Loading processed climate data from {climate_csv}...")
-    climate_df = pd.read_csv(climate_csv)
+    events = FireEvents.from_fires(grid_ids, fire_df["fire_date"], fire_df["fire_size"], fire_df["fire_cause"])
+    print(f"{len(fire_df)} fires in {len(events)} grid cell days.")
 
     print("Merging fire data with climate data...")
-    climate_df["fire_date"] = pd.to_datetime(climate_df["time"]).dt.date  # Convert time to date for merging
-    combined_data = pd.merge(climate_df, fire_summary, how="left", left_on=["grid_id", "fire_date"],
-                             right_on=["grid_id", "fire_date"])
-
-    # Fill NaN values for fire-related columns
-    combined_data["fire_count"] = combined_data["fire_count"].fillna(0).astype(int)
-    combined_data["total_fire_size"] = combined_data["total_fire_size"].fillna(0)
-    combined_data["fire_cause"] = combined_data["fire_cause"].fillna("None")
+    climate_df["fire_date"] = climate_times.dt.date  # Date of each row, as in the fire summary
+    counts, sizes, masks = events.lookup(climate_df["grid_id"].to_numpy(), climate_times.to_numpy())
+    climate_df["fire_count"] = counts
+    climate_df["total_fire_size"] = sizes
+    climate_df["fire_cause_mask"] = masks
+    if cause_strings:
+        climate_df["fire_cause"] = cause_labels(masks)
 
     print(f"Saving combined data to {output_csv}...")
-    combined_data.to_csv(output_csv, index=False)
+    climate_df.to_csv(output_csv, index=False)
     print("Fire data integration complete!")
+    return events
@@ -0,0 +1,167 @@
+import numpy as np
+import pandas as pd
+
+# NFDB cause codes, one bit each in the cause mask (bit i = CAUSE_CODES[i]);
+# codes not in the list set the last bit
+CAUSE_CODES = ("H", "N", "U", "H-PB", "RE", "OTHER")
+NO_CAUSE = "None"
+# Days are offset so that any date fits in the low 32 bits of a (grid_id, day) key
+DAY_OFFSET = 2 ** 31
+
+def cause_bits(causes):
+    """
+    Cause bit of each fire.
+
+    Parameters:
+    - causes (array-like): NFDB cause codes (strings or categoricals, NaN if unknown).
+
+    Returns:
+    - np.ndarray: uint8 bit per fire (0 for a missing cause).
+    """
+    codes = pd.Categorical(pd.Series(causes, dtype=object), categories=CAUSE_CODES[:-1]).codes
+    bits = np.where(codes >= 0, np.left_shift(1, codes), 1 << (len(CAUSE_CODES) - 1)).astype(np.uint8)
+    bits[pd.isna(np.asarray(causes, dtype=object))] = 0
+    return bits
+
+def cause_labels(masks):
+    """
+    Comma-separated cause codes of cause masks, for export.
+
+    Each distinct mask is decoded once, so this is cheap however many rows there are.
+
+    Parameters:
+    - masks (array-like): Cause masks.
+
+    Returns:
+    - np.ndarray: Object array of labels ("H, N", ...), NO_CAUSE for 0.
+    """
+    masks = np.asarray(masks, dtype=np.uint8)
+    unique, inverse = np.unique(masks, return_inverse=True)
+    labels = np.array([", ".join(code for bit, code in enumerate(CAUSE_CODES) if mask >> bit & 1) or NO_CAUSE
+                       for mask in unique], dtype=object)
+    return labels[inverse.reshape(masks.shape)]
+
+def _event_keys(grid_ids, days):
+    """int64 key ordering (grid_id, day) pairs."""
+    day_numbers = np.asarray(days, dtype="datetime64[D]").astype(np.int64) + DAY_OFFSET
+    return np.asarray(grid_ids, dtype=np.int64) << 32 | day_numbers
+
+class FireEvents:
+    """
+    Fires aggregated per grid cell and day, as a sparse COO table.
+
+    Only (cell, day) pairs with at least one fire are stored, sorted by
+    grid_id and day, with the number of fires, their total size and a
+    bitmask of their NFDB causes (see CAUSE_CODES).
+    """
+
+    def __init__(self, grid_ids, days, counts, sizes, cause_masks):
+        """
+        Parameters:
+        - grid_ids (np.ndarray): grid_id of each entry.
+        - days (np.ndarray): Day of each entry.
+        - counts (np.ndarray): Number of fires.
+        - sizes (np.ndarray): Total burned area (ha).
+        - cause_masks (np.ndarray): Bitmask of the causes.
+        """
+        self.grid_ids = np.asarray(grid_ids, dtype=np.int64)
+        self.days = np.asarray(days, dtype="datetime64[D]")
+        self.counts = np.asarray(counts, dtype=np.int32)
+        self.sizes = np.asarray(sizes, dtype=np.float64)
+        self.cause_masks = np.asarray(cause_masks, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.grid_ids)
+
+    @classmethod
+    def from_fires(cls, grid_ids, dates, sizes, causes):
+        """
+        Aggregates individual fires into (cell, day) entries.
+
+        The fires are grouped by sorting a single integer (grid_id, day)
+        key; counts and sizes are summed with np.bincount and the cause bits
+        are combined with np.bitwise_or.at, all without Python loops.
+
+        Parameters:
+        - grid_ids (array-like): grid_id of each fire (fires with grid_id <= 0 are dropped).
+        - dates (array-like): Report date of each fire (fires without one are dropped).
+        - sizes (array-like): Burned area of each fire (ha; NaN counts as 0).
+        - causes (array-like): NFDB cause code of each fire.
+
+        Returns:
+        - FireEvents
+        """
+        grid_ids = np.asarray(grid_ids, dtype=np.int64)
+        days = pd.to_datetime(pd.Series(dates)).to_numpy().astype("datetime64[D]")
+        keep = (grid_ids > 0) & ~np.isnat(days)
+        grid_ids, days = grid_ids[keep], days[keep]
+        sizes = np.nan_to_num(np.asarray(sizes, dtype=np.float64)[keep])
+        bits = cause_bits(np.asarray(causes, dtype=object)[keep])
+
+        keys, first, inverse = np.unique(_event_keys(grid_ids, days), return_index=True, return_inverse=True)
+        masks = np.zeros(len(keys), dtype=np.uint8)
+        np.bitwise_or.at(masks, inverse, bits)
+        return cls(grid_ids[first], days[first], np.bincount(inverse, minlength=len(keys)),
+                   np.bincount(inverse, weights=sizes, minlength=len(keys)), masks)
+
+    def lookup(self, grid_ids, days):
+        """
+        Fire values of arbitrary (grid_id, day) rows, e.g. the rows of the climate table.
+
+        The rows are matched on the integer key with a binary search in the
+        sorted entries, so no string or date columns are joined.
+
+        Parameters:
+        - grid_ids (array-like): grid_id of each row.
+        - days (array-like): Day of each row.
+
+        Returns:
+        - tuple: (counts, sizes, cause_masks) per row, zero for rows without fires.
+        """
+        keys = _event_keys(grid_ids, days)
+        counts = np.zeros(len(keys), dtype=np.int32)
+        sizes = np.zeros(len(keys), dtype=np.float64)
+        masks = np.zeros(len(keys), dtype=np.uint8)
+        if len(self):
+            event_keys = _event_keys(self.grid_ids, self.days)
+            position = np.minimum(np.searchsorted(event_keys, keys), len(event_keys) - 1)
+            hit = event_keys[position] == keys
+            counts[hit] = self.counts[position[hit]]
+            sizes[hit] = self.sizes[position[hit]]
+            masks[hit] = self.cause_masks[position[hit]]
+        return counts, sizes, masks
+
+    def to_frame(self, cause_strings=False):
+        """
+        The entries as a DataFrame (grid_id, fire_date, fire_count, total_fire_size,
+        fire_cause_mask), with a fire_cause label column only when cause_strings is True.
+        """
+        frame = pd.DataFrame({"grid_id": self.grid_ids, "fire_date": self.days, "fire_count": self.counts,
+                              "total_fire_size": self.sizes, "fire_cause_mask": self.cause_masks})
+        if cause_strings:
+            frame["fire_cause"] = cause_labels(self.cause_masks)
+        return frame
+
+    def save(self, path):
+        """
+        Saves the entries as a .npz file.
+
+        Parameters:
+        - path (str): Output path.
+        """
+        np.savez(path, grid_ids=self.grid_ids, days=self.days, counts=self.counts, sizes=self.sizes,
+                 cause_masks=self.cause_masks)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads entries saved with `save`.
+
+        Parameters:
+        - path (str): Path to the .npz file.
+
+        Returns:
+        - FireEvents
+        """
+        with np.load(path) as data:
+            return cls(data["grid_ids"], data["days"], data["counts"], data["sizes"], data["cause_masks"])
@@ -0,0 +1,332 @@
+import os
+import numpy as np
+import pandas as pd
+from gap_filling import to_dense, fill_gaps, daily_rows
+
+# Standard CFFDRS start-up values
+FFMC_START = 85.0
+DMC_START = 6.0
+DC_START = 15.0
+
+# Day-length factors by month for DMC and DC (Canadian standard tables)
+DMC_DAY_LENGTH = np.array([6.5, 7.5, 9.0, 12.8, 13.9, 13.9, 12.4, 10.9, 9.4, 8.0, 7.0, 6.0])
+DC_DAY_LENGTH = np.array([-1.6, -1.6, -1.6, 0.9, 3.8, 5.8, 6.4, 5.0, 2.4, 0.4, -1.6, -1.6])
+
+FWI_COLUMNS = ["ffmc", "dmc", "dc", "isi", "bui", "fwi"]
+# UTC hour of the noon observation for sub-daily inputs (12:00 Atlantic standard time)
+NOON_UTC_HOUR = 16
+
+def fine_fuel_moisture_code(ffmc0, temp, rh, wind, rain):
+    """
+    Fine Fuel Moisture Code for one day, for every cell at once.
+
+    Parameters:
+    - ffmc0 (np.ndarray): Previous day's FFMC.
+    - temp (np.ndarray): Temperature (deg C).
+    - rh (np.ndarray): Relative humidity (%).
+    - wind (np.ndarray): Wind speed (km/h).
+    - rain (np.ndarray): 24-hour precipitation (mm).
+
+    Returns:
+    - np.ndarray: FFMC.
+    """
+    rh = np.clip(rh, 0, 100)
+    mo = 147.2 * (101 - ffmc0) / (59.5 + ffmc0)
+
+    rf = np.where(rain > 0.5, rain - 0.5, 1.0)
+    wetting = 42.5 * rf * np.exp(-100 / (251 - mo)) * (1 - np.exp(-6.93 / rf))
+    wetting = np.where(mo > 150, wetting + 0.0015 * (mo - 150) ** 2 * np.sqrt(rf), wetting)
+    mo = np.where(rain > 0.5, np.minimum(mo + wetting, 250), mo)
+
+    ed = 0.942 * rh ** 0.679 + 11 * np.exp((rh - 100) / 10) + 0.18 * (21.1 - temp) * (1 - np.exp(-0.115 * rh))
+    ew = 0.618 * rh ** 0.753 + 10 * np.exp((rh - 100) / 10) + 0.18 * (21.1 - temp) * (1 - np.exp(-0.115 * rh))
+
+    kd = (0.424 * (1 - (rh / 100) ** 1.7) + 0.0694 * np.sqrt(wind) * (1 - (rh / 100) ** 8)) * 0.581 * np.exp(0.0365 * temp)
+    kw = (0.424 * (1 - ((100 - rh) / 100) ** 1.7) + 0.0694 * np.sqrt(wind) * (1 - ((100 - rh) / 100) ** 8)) * 0.581 * np.exp(0.0365 * temp)
+
+    m = np.where(mo > ed, ed + (mo - ed) * 10 ** -kd,
+                 np.where(mo < ew, ew - (ew - mo) * 10 ** -kw, mo))
+    return np.clip(59.5 * (250 - m) / (147.2 + m), 0, 101)
+
+def duff_moisture_code(dmc0, temp, rh, rain, month):
+    """
+    Duff Moisture Code for one day.
+
+    Parameters:
+    - dmc0 (np.ndarray): Previous day's DMC.
+    - temp, rh, rain (np.ndarray): Temperature (deg C), relative humidity (%), precipitation (mm).
+    - month (int): Month (1-12).
+
+    Returns:
+    - np.ndarray: DMC.
+    """
+    rh = np.clip(rh, 0, 100)
+    t = np.maximum(temp, -1.1)
+    drying = 1.894 * (t + 1.1) * (100 - rh) * DMC_DAY_LENGTH[month - 1] * 1e-4
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        re = 0.92 * rain - 1.27
+        mo = 20 + np.exp(5.6348 - dmc0 / 43.43)
+        b = np.where(dmc0 <= 33, 100 / (0.5 + 0.3 * dmc0),
+                     np.where(dmc0 <= 65, 14 - 1.3 * np.log(dmc0), 6.2 * np.log(dmc0) - 17.2))
+        mr = mo + 1000 * re / (48.77 + b * re)
+        wetted = np.maximum(244.72 - 43.43 * np.log(mr - 20), 0)
+    pr = np.where(rain > 1.5, wetted, dmc0)
+    return np.maximum(pr + drying, 0)
+
+def drought_code(dc0, temp, rain, month):
+    """
+    Drought Code for one day.
+
+    Parameters:
+    - dc0 (np.ndarray): Previous day's DC.
+    - temp, rain (np.ndarray): Temperature (deg C) and precipitation (mm).
+    - month (int): Month (1-12).
+
+    Returns:
+    - np.ndarray: DC.
+    """
+    t = np.maximum(temp, -2.8)
+    pe = np.maximum((0.36 * (t + 2.8) + DC_DAY_LENGTH[month - 1]) / 2, 0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rd = 0.83 * rain - 1.27
+        qr = 800 * np.exp(-dc0 / 400) + 3.937 * rd
+        wetted = np.maximum(400 * np.log(800 / qr), 0)
+    dr = np.where(rain > 2.8, wetted, dc0)
+    return np.maximum(dr + pe, 0)
+
+def initial_spread_index(ffmc, wind):
+    """
+    Initial Spread Index.
+
+    Parameters:
+    - ffmc (np.ndarray): FFMC.
+    - wind (np.ndarray): Wind speed (km/h).
+
+    Returns:
+    - np.ndarray: ISI.
+    """
+    mo = 147.2 * (101 - ffmc) / (59.5 + ffmc)
+    ff = 91.9 * np.exp(-0.1386 * mo) * (1 + mo ** 5.31 / 4.93e7)
+    return 0.208 * np.exp(0.05039 * wind) * ff
+
+def buildup_index(dmc, dc):
+    """
+    Buildup Index.
+
+    Parameters:
+    - dmc, dc (np.ndarray): DMC and DC.
+
+    Returns:
+    - np.ndarray: BUI.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        low = 0.8 * dmc * dc / (dmc + 0.4 * dc)
+        high = dmc - (1 - 0.8 * dc / (dmc + 0.4 * dc)) * (0.92 + (0.0114 * dmc) ** 1.7)
+    bui = np.where(dmc <= 0.4 * dc, low, high)
+    return np.where((dmc == 0) & (dc == 0), 0, np.maximum(bui, 0))
+
+def fire_weather_index(isi, bui):
+    """
+    Fire Weather Index.
+
+    Parameters:
+    - isi, bui (np.ndarray): ISI and BUI.
+
+    Returns:
+    - np.ndarray: FWI.
+    """
+    fd = np.where(bui <= 80, 0.626 * bui ** 0.809 + 2, 1000 / (25 + 108.64 * np.exp(-0.023 * bui)))
+    b = 0.1 * isi * fd
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scaled = np.exp(2.72 * (0.434 * np.log(b)) ** 0.647)
+    return np.where(b > 1, scaled, b)
+
+class FWIState:
+    """
+    Moisture codes carried from one day to the next for every grid cell.
+
+    Saving the state after a run lets the next day be computed from the
+    previous day's codes without replaying the history.
+    """
+
+    def __init__(self, cell_ids, ffmc, dmc, dc, date=None):
+        """
+        Parameters:
+        - cell_ids (np.ndarray): grid_id of each cell.
+        - ffmc, dmc, dc (np.ndarray): Codes of each cell after `date`.
+        - date (np.datetime64): Last day the codes were computed for, or None.
+        """
+        self.cell_ids = np.asarray(cell_ids, dtype=np.int64)
+        self.ffmc = np.asarray(ffmc, dtype=np.float64)
+        self.dmc = np.asarray(dmc, dtype=np.float64)
+        self.dc = np.asarray(dc, dtype=np.float64)
+        self.date = None if date is None else np.datetime64(date, "D")
+
+    @classmethod
+    def start_up(cls, cell_ids):
+        """
+        Standard start-up codes (FFMC 85, DMC 6, DC 15) for every cell.
+
+        Parameters:
+        - cell_ids (np.ndarray): grid_id of each cell.
+
+        Returns:
+        - FWIState
+        """
+        n_cells = len(cell_ids)
+        return cls(cell_ids, np.full(n_cells, FFMC_START), np.full(n_cells, DMC_START), np.full(n_cells, DC_START))
+
+    def for_cells(self, cell_ids):
+        """
+        Codes for the given cells, with start-up codes for cells not in the state.
+
+        Parameters:
+        - cell_ids (np.ndarray): grid_id of each cell.
+
+        Returns:
+        - FWIState
+        """
+        state = FWIState.start_up(cell_ids)
+        state.date = self.date
+        position = np.searchsorted(self.cell_ids, cell_ids)
+        position = np.minimum(position, len(self.cell_ids) - 1)
+        known = self.cell_ids[position] == cell_ids if len(self.cell_ids) else np.zeros(len(cell_ids), dtype=bool)
+        for name in ("ffmc", "dmc", "dc"):
+            getattr(state, name)[known] = getattr(self, name)[position[known]]
+        return state
+
+    def step(self, temp, rh, wind, rain, month):
+        """
+        Advances every cell by one day and returns that day's indices.
+
+        Cells with missing weather keep their codes and get NaN indices.
+
+        Parameters:
+        - temp (np.ndarray): Temperature (deg C) per cell.
+        - rh (np.ndarray): Relative humidity (%) per cell.
+        - wind (np.ndarray): Wind speed (km/h) per cell.
+        - rain (np.ndarray): 24-hour precipitation (mm) per cell.
+        - month (int): Month (1-12) of the day.
+
+        Returns:
+        - dict: FWI_COLUMNS -> (n_cells,) arrays.
+        """
+        valid = ~(np.isnan(temp) | np.isnan(rh) | np.isnan(wind) | np.isnan(rain))
+        with np.errstate(invalid="ignore"):
+            ffmc = fine_fuel_moisture_code(self.ffmc, temp, rh, wind, rain)
+            dmc = duff_moisture_code(self.dmc, temp, rh, rain, month)
+            dc = drought_code(self.dc, temp, rain, month)
+            isi = initial_spread_index(ffmc, wind)
+            bui = buildup_index(dmc, dc)
+            fwi = fire_weather_index(isi, bui)
+
+        self.ffmc = np.where(valid, ffmc, self.ffmc)
+        self.dmc = np.where(valid, dmc, self.dmc)
+        self.dc = np.where(valid, dc, self.dc)
+        codes = {"ffmc": ffmc, "dmc": dmc, "dc": dc, "isi": isi, "bui": bui, "fwi": fwi}
+        return {name: np.where(valid, values, np.nan) for name, values in codes.items()}
+
+    def save(self, path):
+        """
+        Saves the state as a .npz file.
+
+        Parameters:
+        - path (str): Output path.
+        """
+        np.savez(path, cell_ids=self.cell_ids, ffmc=self.ffmc, dmc=self.dmc, dc=self.dc,
+                 date=np.array(self.date if self.date is not None else np.datetime64("NaT"), dtype="datetime64[D]"))
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads a state saved with `save`.
+
+        Parameters:
+        - path (str): Path to the .npz file.
+
+        Returns:
+        - FWIState
+        """
+        with np.load(path) as data:
+            date = data["date"][()]
+            return cls(data["cell_ids"], data["ffmc"], data["dmc"], data["dc"],
+                       None if np.isnat(date) else date)
+
+def compute_fwi(climate_csv, output_csv, state_file=None, fill_limit=2, precipitation_scale=1000.0,
+                noon_hour=NOON_UTC_HOUR):
+    """
+    Computes the CFFDRS fire weather indices for every grid cell and day.
+
+    The days are stepped through in order and each day updates every cell
+    as one array operation. Daily inputs (e.g. from `process_climate_archive`)
+    are used as is, with daily means standing in for the noon observations
+    of the standard system. Sub-daily inputs (one row per ERA5 step, from
+    `process_climate_csv`) are first reduced to the step closest to noon for
+    the weather and the 24 h total for precipitation.
+
+    With a state file, only days after the saved state are computed and
+    appended to output_csv, and the state is saved again afterwards. The
+    new days must start the day after the saved state; a gap would carry
+    the moisture codes across days that were never computed.
+
+    Parameters:
+    - climate_csv (str): Processed climate CSV (grid_id, time, avg_temperature,
+      total_precipitation, avg_wind_speed, avg_humidity).
+    - output_csv (str): Path to save (or append) grid_id, time and the indices.
+    - state_file (str): Optional .npz state (see `FWIState`).
+    - fill_limit (int): Gaps of up to this many days in the weather inputs
+      are interpolated (see `gap_filling.fill_gaps`); 0 disables filling.
+    - precipitation_scale (float): Factor converting total_precipitation to
+      mm (ERA5 precipitation is in metres).
+    - noon_hour (int): UTC hour of the noon observation for sub-daily inputs.
+
+    Returns:
+    - FWIState: State after the last computed day.
+    """
+    print(f"Loading climate data from {climate_csv}...")
+    climate_df = pd.read_csv(climate_csv, parse_dates=["time"])
+    columns = ["avg_temperature", "avg_humidity", "avg_wind_speed", "total_precipitation"]
+    climate_df = daily_rows(climate_df[["grid_id", "time"] + columns], sum_columns=["total_precipitation"],
+                            hour=noon_hour)
+    cell_ids, days, arrays = to_dense(climate_df, columns)
+
+    if fill_limit:
+        arrays = {name: fill_gaps(values, method="linear", limit=fill_limit) for name, values in arrays.items()}
+
+    if state_file is not None and os.path.exists(state_file):
+        print(f"Resuming from FWI state in {state_file}...")
+        state = FWIState.load(state_file).for_cells(cell_ids)
+    else:
+        state = FWIState.start_up(cell_ids)
+    resumed = state.date is not None
+    start = 0 if not resumed else int(np.searchsorted(days.values.astype("datetime64[D]"), state.date, side="right"))
+    if start == len(days):
+        print("FWI state is already up to date.")
+        return state
+    if resumed and days[start] != pd.Timestamp(state.date + np.timedelta64(1, "D")):
+        raise ValueError(f"Climate data resumes on {days[start].date()}, but the FWI state in {state_file} "
+                         f"ends on {state.date}; remove the state file to restart the codes")
+
+    temp = arrays["avg_temperature"]
+    rh = arrays["avg_humidity"]
+    wind = arrays["avg_wind_speed"] * 3.6  # m/s -> km/h
+    rain = arrays["total_precipitation"] * precipitation_scale
+
+    print(f"Computing FWI for {len(cell_ids)} cells over {len(days) - start} days...")
+    daily_frames = []
+    for day in range(start, len(days)):
+        indices = state.step(temp[:, day], rh[:, day], wind[:, day], rain[:, day], days[day].month)
+        daily_frames.append(pd.DataFrame({"grid_id": cell_ids, "time": days[day].date(), **indices}))
+    state.date = np.datetime64(days[-1].date(), "D")
+
+    fwi_df = pd.concat(daily_frames, ignore_index=True).dropna(subset=["fwi"])
+    append = resumed and os.path.exists(output_csv)
+    print(f"{'Appending' if append else 'Saving'} FWI indices to {output_csv}...")
+    fwi_df.to_csv(output_csv, mode="a" if append else "w", header=not append, index=False)
+
+    if state_file is not None:
+        print(f"Saving FWI state to {state_file}...")
+        state.save(state_file)
+    return state
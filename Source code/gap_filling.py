@@ -0,0 +1,188 @@
+import numpy as np
+import pandas as pd
+
+FILL_METHODS = ("linear", "nearest", "ffill")
+
+def _index_dtype(n_times):
+    return np.int32 if n_times < np.iinfo(np.int32).max else np.int64
+
+def _previous_valid(valid):
+    """Index of the last valid step at or before each step (-1 if none), per row."""
+    n_times = valid.shape[1]
+    index = np.where(valid, np.arange(n_times, dtype=_index_dtype(n_times)), -1)
+    return np.maximum.accumulate(index, axis=1, out=index)
+
+def _next_valid(valid):
+    """Index of the first valid step at or after each step (n_times if none), per row."""
+    n_times = valid.shape[1]
+    index = np.where(valid[:, ::-1], np.arange(n_times, dtype=_index_dtype(n_times))[::-1], n_times)
+    return np.minimum.accumulate(index, axis=1)[:, ::-1]
+
+def fill_gaps(values, method="linear", limit=None, positions=None):
+    """
+    Fills missing steps of every series of a dense (n_cells, n_times) array at once.
+
+    For every missing step the indices of the previous and next valid steps
+    of its row are found with cumulative max/min over index arrays, so the
+    whole array is filled with a handful of array operations and no
+    per-cell loop.
+
+    Parameters:
+    - values (np.ndarray): (n_cells, n_times) array, NaN where missing.
+    - method (str): "linear" interpolates between the surrounding valid
+      steps, "nearest" takes the closer of them (the earlier one on ties),
+      and "ffill" carries the last valid value forward.
+    - limit (int): Maximum number of consecutive missing steps to fill. With
+      "ffill", steps further than `limit` from the last valid value stay
+      missing; with "linear" and "nearest", longer gaps are left unfilled.
+      No limit when None.
+    - positions (np.ndarray): Optional time coordinate of each step (e.g.
+      day numbers) for irregularly spaced steps; defaults to 0..n_times-1.
+
+    Returns:
+    - np.ndarray: Filled copy of `values`. Steps before the first valid
+      value (and, except for "ffill", after the last) stay missing.
+    """
+    if method not in FILL_METHODS:
+        raise ValueError(f"Unknown gap-filling method: {method}")
+
+    values = np.asarray(values)
+    squeeze = values.ndim == 1
+    values = np.atleast_2d(values)
+    n_times = values.shape[1]
+    if positions is None:
+        positions = np.arange(n_times, dtype=np.float64)
+    positions = np.asarray(positions, dtype=np.float64)
+
+    valid = ~np.isnan(values)
+    missing = ~valid
+    previous = _previous_valid(valid)
+    has_previous = previous >= 0
+    previous_value = np.take_along_axis(values, np.maximum(previous, 0), axis=1)
+    step = np.arange(n_times)
+
+    filled = values.copy()
+    if method == "ffill":
+        fill = missing & has_previous
+        if limit is not None:
+            fill &= (step - previous) <= limit
+        filled[fill] = previous_value[fill]
+        return filled[0] if squeeze else filled
+
+    following = _next_valid(valid)
+    has_next = following < n_times
+    next_value = np.take_along_axis(values, np.minimum(following, n_times - 1), axis=1)
+    fill = missing & has_previous & has_next
+    if limit is not None:
+        fill &= (following - previous - 1) <= limit
+
+    previous_position = positions[np.maximum(previous, 0)]
+    next_position = positions[np.minimum(following, n_times - 1)]
+    if method == "linear":
+        with np.errstate(invalid="ignore", divide="ignore"):
+            weight = (positions - previous_position) / (next_position - previous_position)
+        interpolated = previous_value + weight * (next_value - previous_value)
+    else:
+        closer_to_next = (next_position - positions) < (positions - previous_position)
+        interpolated = np.where(closer_to_next, next_value, previous_value)
+    filled[fill] = interpolated[fill]
+    return filled[0] if squeeze else filled
+
+def to_dense(df, value_columns, id_column="grid_id", time_column="time", freq="D", start=None, end=None):
+    """
+    Reshapes long-format rows into dense (n_cells, n_times) arrays on a regular time axis.
+
+    Parameters:
+    - df (DataFrame): Rows keyed by (id_column, time_column).
+    - value_columns (list): Columns to reshape.
+    - id_column (str): Cell identifier column.
+    - time_column (str): Timestamp column; rows are floored to `freq`.
+    - freq (str): Step of the regular time axis (e.g. "D").
+    - start, end (str): Optional time range; defaults to the range of the data.
+
+    Returns:
+    - tuple: (cell_ids, times, {column: (n_cells, n_times) float array with NaN for absent rows}).
+    """
+    row_times = pd.to_datetime(df[time_column]).dt.floor(freq)
+    times = pd.date_range(start or row_times.min(), end or row_times.max(), freq=freq)
+    cell_ids, rows = np.unique(df[id_column].to_numpy(), return_inverse=True)
+    cols = times.get_indexer(row_times)
+    inside = cols >= 0
+
+    arrays = {}
+    for column in value_columns:
+        dense = np.full((len(cell_ids), len(times)), np.nan)
+        dense[rows[inside], cols[inside]] = df[column].to_numpy(dtype=np.float64)[inside]
+        arrays[column] = dense
+    return cell_ids, times, arrays
+
+def daily_rows(df, sum_columns=(), hour=None, id_column="grid_id", time_column="time"):
+    """
+    Reduces sub-daily rows (e.g. one per ERA5 time step, as written by
+    `process_climate_csv`) to one row per cell and day.
+
+    Input that already has one row per cell and day is returned as is, with
+    its times floored to the day.
+
+    Parameters:
+    - df (DataFrame): Rows keyed by (id_column, time_column).
+    - sum_columns (list): Columns totalled over the day (e.g. precipitation).
+    - hour (int): If given, the other columns are taken from the step closest
+      to this UTC hour (e.g. the noon observation); otherwise they are averaged.
+    - id_column (str): Cell identifier column.
+    - time_column (str): Timestamp column.
+
+    Returns:
+    - DataFrame: One row per (id_column, day), sorted by cell and day.
+    """
+    times = pd.to_datetime(df[time_column])
+    df = df.assign(**{time_column: times.dt.floor("D")})
+    keys = [id_column, time_column]
+    if not df.duplicated(keys).any():
+        return df.sort_values(keys, ignore_index=True)
+
+    print(f"Reducing {len(df)} sub-daily rows to daily values...")
+    value_columns = [column for column in df.select_dtypes("number").columns if column not in keys]
+    sum_columns = [column for column in sum_columns if column in value_columns]
+    other_columns = [column for column in value_columns if column not in sum_columns]
+    grouped = df.groupby(keys)
+    totals = grouped[sum_columns].sum(min_count=1)
+    if hour is None:
+        others = grouped[other_columns].mean()
+    else:
+        distance = (times.dt.hour - hour).abs().to_numpy()
+        distance = np.minimum(distance, 24 - distance)
+        nearest = df.assign(_distance=distance).sort_values(keys + ["_distance"], kind="stable")
+        others = nearest.drop_duplicates(keys).set_index(keys)[other_columns]
+    return pd.concat([others, totals], axis=1)[value_columns].reset_index()
+
+def fill_series(df, value_columns, method="linear", limit=None, id_column="grid_id", time_column="time",
+                freq="D", start=None, end=None):
+    """
+    Regularizes sparse per-cell series (e.g. climate data every 5 days, or
+    weekly NDVI composites) to one row per cell and step and fills the gaps.
+
+    Parameters:
+    - df (DataFrame): Rows keyed by (id_column, time_column).
+    - value_columns (list): Columns to fill.
+    - method (str): "linear", "nearest" or "ffill" (see `fill_gaps`).
+    - limit (int): Maximum number of consecutive missing steps to fill.
+    - id_column (str): Cell identifier column.
+    - time_column (str): Timestamp column.
+    - freq (str): Step of the output rows (e.g. "D" for daily rows).
+    - start, end (str): Optional output time range.
+
+    Returns:
+    - DataFrame: (id_column, time_column, *value_columns) for every cell and step.
+    """
+    cell_ids, times, arrays = to_dense(df, value_columns, id_column, time_column, freq, start, end)
+    positions = ((times - times[0]) / pd.Timedelta(1, "D")).to_numpy(dtype=np.float64)
+
+    result = pd.DataFrame({
+        id_column: np.repeat(cell_ids, len(times)),
+        time_column: np.tile(times.to_numpy(), len(cell_ids)),
+    })
+    for column, dense in arrays.items():
+        print(f"Filling gaps in {column} ({method}) for {len(cell_ids)} cells x {len(times)} steps...")
+        result[column] = fill_gaps(dense, method=method, limit=limit, positions=positions).ravel()
+    return result
@@ -0,0 +1,204 @@
+import glob
+import hashlib
+import json
+import os
+import numpy as np
+import geopandas as gpd
+import shapely
+from pathlib import Path
+from grid_creator import build_grid
+from grid_index import GridIndex, grid_index_path
+
+GRID_FILE = "grid.parquet"
+INDEX_FILE = "grid.index.npz"
+METADATA_FILE = "metadata.json"
+# Province file (path, size, mtime) and grid settings -> cache key, see source_key
+SOURCES_FILE = "sources.json"
+
+class CachedGrid:
+    """
+    A grid loaded into memory once and shared by every pipeline stage.
+
+    Attributes:
+    - gdf (GeoDataFrame): Grid cells in EPSG:4326 with grid_id, centroid
+      latitude/longitude and cell bounds (minx, miny, maxx, maxy).
+    - index (GridIndex): Analytic point-to-cell index, or None for grids
+      loaded from a shapefile without one.
+    - key (str): Cache key the grid was stored under, if any.
+    """
+
+    def __init__(self, gdf, index=None, key=None):
+        self.gdf = gdf
+        self.index = index
+        self.key = key
+
+    def __len__(self):
+        return len(self.gdf)
+
+    def assign_points(self, lon, lat):
+        """
+        Assigns EPSG:4326 points to grid cells.
+
+        Parameters:
+        - lon, lat (array-like): Point coordinates in degrees.
+
+        Returns:
+        - np.ndarray: int64 grid_id per point, 0 for points outside the grid.
+        """
+        if self.index is not None:
+            return self.index.lookup(lon, lat)
+
+        points = gpd.GeoDataFrame(geometry=gpd.points_from_xy(lon, lat), crs="EPSG:4326").to_crs(self.gdf.crs)
+        joined = gpd.sjoin(points, self.gdf[["grid_id", "geometry"]], how="left", predicate="within")
+        joined = joined[~joined.index.duplicated()]
+        return joined["grid_id"].fillna(0).to_numpy(dtype=np.int64)
+
+def load_grid(grid):
+    """
+    Returns a CachedGrid for either an already-loaded grid or a grid file.
+
+    Parameters:
+    - grid (CachedGrid or str): Loaded grid, or path to a grid shapefile or
+      GeoParquet dataset (with its GridIndex next to it, if one was saved).
+
+    Returns:
+    - CachedGrid
+    """
+    if isinstance(grid, CachedGrid):
+        return grid
+
+    print(f"Loading grid from {grid}...")
+    index_file = grid_index_path(grid)
+    index = GridIndex.load(index_file) if index_file.exists() else None
+    if Path(grid).suffix == ".parquet":
+        return CachedGrid(gpd.read_parquet(grid), index)
+    return CachedGrid(gpd.read_file(grid), index)
+
+def _grid_settings(grid_size, target_crs, method, tolerance):
+    """Grid-building settings as part of a cache key."""
+    return f"|{float(grid_size)}|{target_crs}|{method}|{None if tolerance is None else float(tolerance)}"
+
+def grid_cache_key(province_gdf, grid_size, target_crs, method="vectorized", tolerance=None):
+    """
+    Content hash identifying a grid.
+
+    Parameters:
+    - province_gdf (GeoDataFrame): Province boundary.
+    - grid_size (int): Size of the grid cell (in meters).
+    - target_crs (str): Projected CRS the grid is laid out in.
+    - method (str): Grid engine passed to `build_grid`.
+    - tolerance (float): Boundary simplification tolerance passed to `build_grid`.
+
+    Returns:
+    - str: Hex digest of the province geometry and the grid settings.
+    """
+    geometry = shapely.normalize(shapely.union_all(province_gdf.to_crs("EPSG:4326").geometry.values))
+    digest = hashlib.sha256()
+    digest.update(shapely.to_wkb(geometry, byte_order=1))
+    digest.update(_grid_settings(grid_size, target_crs, method, tolerance).encode())
+    return digest.hexdigest()[:16]
+
+def source_key(province_shapefile, grid_size, target_crs, method="vectorized", tolerance=None):
+    """
+    Hash of a province file's path, size and modification time and the grid
+    settings, computed without reading the file. A shapefile's sidecar files
+    (.dbf, .shx, .prj, ...) are included.
+
+    Parameters:
+    - province_shapefile (str): Path to the province shapefile.
+    - grid_size (int): Size of the grid cell (in meters).
+    - target_crs (str): Projected CRS the grid is laid out in.
+    - method (str): Grid engine passed to `build_grid`.
+    - tolerance (float): Boundary simplification tolerance passed to `build_grid`.
+
+    Returns:
+    - str: Hex digest.
+    """
+    path = Path(province_shapefile).resolve()
+    files = sorted(path.parent.glob(glob.escape(path.stem) + ".*")) if path.suffix == ".shp" else [path]
+    digest = hashlib.sha256()
+    for file in files:
+        stat = file.stat()
+        digest.update(f"{file}|{stat.st_size}|{stat.st_mtime_ns}\n".encode())
+    digest.update(_grid_settings(grid_size, target_crs, method, tolerance).encode())
+    return digest.hexdigest()[:16]
+
+def _load_sources(sources_path):
+    if sources_path.exists():
+        with open(sources_path) as f:
+            return json.load(f)
+    return {}
+
+def _record_source(sources_path, source, key):
+    """Maps a source key to a grid cache key and atomically rewrites the sources file."""
+    sources = _load_sources(sources_path)
+    sources[source] = key
+    tmp_path = sources_path.with_suffix(".json.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(sources, f, indent=2)
+    os.replace(tmp_path, sources_path)
+
+def _load_entry(entry, key):
+    print(f"Loading cached grid {key} from {entry}...")
+    gdf = gpd.read_parquet(entry / GRID_FILE)
+    return CachedGrid(gdf, GridIndex.load(entry / INDEX_FILE), key)
+
+def load_or_create_grid(province_shapefile, grid_size, cache_folder, target_crs="EPSG:3005", method="vectorized",
+                        tolerance=None):
+    """
+    Loads a grid from the content-addressed cache, creating it on a miss.
+
+    The cache entry is keyed by a hash of the province geometry and the grid
+    settings (size, target CRS, method and tolerance), so a changed province
+    file or setting builds a new grid instead of reusing a stale one. The
+    sources file in the cache folder maps the province file's path, size and
+    modification time (see `source_key`) to that entry, so an unchanged file
+    is not read again.
+
+    Parameters:
+    - province_shapefile (str): Path to the province shapefile.
+    - grid_size (int): Size of the grid cell (in meters).
+    - cache_folder (str): Folder holding one sub-folder per cached grid.
+    - target_crs (str): Projected CRS the grid is laid out in.
+    - method (str): Grid engine passed to `build_grid` on a cache miss.
+    - tolerance (float): Boundary simplification tolerance passed to `build_grid`.
+
+    Returns:
+    - CachedGrid
+    """
+    sources_path = Path(cache_folder) / SOURCES_FILE
+    source = source_key(province_shapefile, grid_size, target_crs, method, tolerance)
+    key = _load_sources(sources_path).get(source)
+    if key is not None and (Path(cache_folder) / key / METADATA_FILE).exists():
+        return _load_entry(Path(cache_folder) / key, key)
+
+    print(f"Loading province shapefile from {province_shapefile}...")
+    province_gdf = gpd.read_file(province_shapefile)
+    key = grid_cache_key(province_gdf, grid_size, target_crs, method, tolerance)
+    entry = Path(cache_folder) / key
+
+    if (entry / METADATA_FILE).exists():
+        _record_source(sources_path, source, key)
+        return _load_entry(entry, key)
+
+    print(f"No cached grid for key {key}, creating it...")
+    gdf, index = build_grid(province_gdf, grid_size, method=method, tolerance=tolerance, target_crs=target_crs)
+    bounds = gdf.geometry.bounds
+    gdf = gdf.assign(minx=bounds["minx"], miny=bounds["miny"], maxx=bounds["maxx"], maxy=bounds["maxy"])
+
+    entry.mkdir(parents=True, exist_ok=True)
+    print(f"Saving grid to cache folder {entry}...")
+    gdf.to_parquet(entry / GRID_FILE)
+    index.save(entry / INDEX_FILE)
+    # Written last: its presence marks the entry as complete
+    with open(entry / METADATA_FILE, "w") as f:
+        json.dump({
+            "province_shapefile": str(province_shapefile),
+            "grid_size": grid_size,
+            "target_crs": target_crs,
+            "method": method,
+            "tolerance": tolerance,
+            "cells": len(gdf),
+        }, f, indent=2)
+    _record_source(sources_path, source, key)
+    return CachedGrid(gdf, index, key)
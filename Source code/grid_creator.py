@@ -1,48 +1,220 @@
 import geopandas as gpd
 import numpy as np
+import shapely
 from shapely.geometry import box
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import os
 import re
+from grid_index import GridIndex, grid_index_path, lattice_grid_ids, lattice_positions
+
+# Boundary cells are clipped against pieces of the province cut out per block
+# of BOUNDARY_BLOCK_CELLS x BOUNDARY_BLOCK_CELLS cells, so each exact
+# intersection only sees the vertices near that block.
+BOUNDARY_BLOCK_CELLS = 16
 
 def sanitize_filename(name):
     """Sanitize a string to be used as a filename."""
     return re.sub(r'[^\w\-_\.]', '_', name)
 
-def create_grid(province_shapefile, grid_size, output_folder):
+def generate_grid_cells(bounds, grid_size):
     """
-    Creates a grid over a province, clips it to the province boundary,
-    and adds latitude and longitude for grid centroids.
+    Builds the regular lattice of square cells covering a bounding box.
 
     Parameters:
-    - province_shapefile (str): Path to the province shapefile.
+    - bounds (array-like): [minx, miny, maxx, maxy] in the grid CRS.
     - grid_size (int): Size of the grid cell (in meters).
-    - output_folder (Path): Directory to save the grid shapefile.
 
     Returns:
-    - Path to the saved grid shapefile.
+    - tuple: (cells, rows, cols) where cells is an array of box polygons and
+      rows/cols are the integer lattice positions of each cell, ordered
+      column by column (the same order as the original nested loop).
     """
-    print(f"Loading province shapefile from {province_shapefile}...")
-    province_gdf = gpd.read_file(province_shapefile)
+    minx, miny, maxx, maxy = bounds
+    n_cols = len(np.arange(minx, maxx, grid_size))
+    n_rows = len(np.arange(miny, maxy, grid_size))
+    return lattice_cells((minx, miny), grid_size, (0, n_rows), (0, n_cols))
+
+def lattice_cells(origin, grid_size, row_range, col_range):
+    """
+    Builds the cells of one rectangular block of a lattice.
+
+    Parameters:
+    - origin (tuple): (x, y) lower-left corner of the whole lattice.
+    - grid_size (int): Size of the grid cell (in meters).
+    - row_range, col_range (tuple): Half-open (start, stop) lattice rows and
+      columns of the block.
+
+    Returns:
+    - tuple: (cells, rows, cols) as for `generate_grid_cells`.
+    """
+    cols, rows = np.meshgrid(np.arange(*col_range), np.arange(*row_range), indexing="ij")
+    cols = cols.ravel()
+    rows = rows.ravel()
+    x0 = origin[0] + cols * grid_size
+    y0 = origin[1] + rows * grid_size
+    cells = shapely.box(x0, y0, x0 + grid_size, y0 + grid_size)
+    return cells, rows, cols
+
+def split_interior_boundary(cells, boundary, tolerance):
+    """
+    Classifies cells against a province boundary without clipping them.
+
+    The boundary is simplified with `tolerance` and then shrunk/grown by the
+    same distance, which gives an inner polygon guaranteed to lie inside the
+    true boundary and an outer polygon guaranteed to contain it.
+
+    Parameters:
+    - cells (np.ndarray): Array of cell polygons.
+    - boundary (Geometry): Full-detail province geometry in the grid CRS.
+    - tolerance (float): Simplification tolerance (in meters).
+
+    Returns:
+    - tuple: (interior, boundary_band) boolean masks. Interior cells lie fully
+      inside the province; boundary_band cells may be partially inside and
+      need an exact clip. Cells in neither mask are outside the province.
+    """
+    simplified = shapely.simplify(boundary, tolerance)
+    # Pad the offset slightly: buffers approximate arcs with chords
+    offset = tolerance * 1.05 + 1e-6
+    inner = shapely.buffer(simplified, -offset)
+    outer = shapely.buffer(simplified, offset)
+    shapely.prepare(inner)
+    shapely.prepare(outer)
+
+    interior = shapely.contains(inner, cells)
+    boundary_band = ~interior & shapely.intersects(outer, cells)
+    return interior, boundary_band
 
-    # Reproject to EPSG:3005 (BC Albers)
-    print("Reprojecting province shapefile to EPSG:3005...")
-    province_gdf = province_gdf.to_crs("EPSG:3005")
+def clip_boundary_cells(cells, rows, cols, boundary):
+    """
+    Clips boundary-band cells exactly against the province geometry.
+
+    Parameters:
+    - cells (np.ndarray): Boundary-band cell polygons.
+    - rows, cols (np.ndarray): Lattice positions of those cells.
+    - boundary (Geometry): Full-detail province geometry in the grid CRS.
+
+    Returns:
+    - np.ndarray: Clipped polygons (empty geometries for cells that turned out
+      to be outside the province).
+    """
+    clipped = np.empty(len(cells), dtype=object)
+    block_ids = (rows // BOUNDARY_BLOCK_CELLS) * (cols.max(initial=0) + 1) + cols // BOUNDARY_BLOCK_CELLS
+    for block_id in np.unique(block_ids):
+        in_block = block_ids == block_id
+        block_cells = cells[in_block]
+        block_piece = shapely.intersection(boundary, box(*shapely.total_bounds(block_cells)))
+        clipped[in_block] = shapely.intersection(block_cells, block_piece)
+    return _polygonal_parts(clipped)
+
+def _polygonal_parts(geoms):
+    """Drops the line/point slivers an exact intersection can produce."""
+    geoms = np.asarray(geoms, dtype=object)
+    collections = shapely.get_type_id(geoms) == shapely.GeometryType.GEOMETRYCOLLECTION
+    for i in np.flatnonzero(collections):
+        parts = shapely.get_parts(geoms[i])
+        polygons = parts[np.isin(shapely.get_type_id(parts),
+                                 [shapely.GeometryType.POLYGON, shapely.GeometryType.MULTIPOLYGON])]
+        geoms[i] = shapely.union_all(polygons) if len(polygons) else shapely.Polygon()
+    not_polygonal = ~np.isin(shapely.get_type_id(geoms),
+                             [shapely.GeometryType.POLYGON, shapely.GeometryType.MULTIPOLYGON])
+    geoms[not_polygonal] = shapely.Polygon()
+    return geoms
+
+def build_grid_cells(boundary, grid_size, tolerance=None, block=None):
+    """
+    Vectorized grid engine: builds the lattice over the boundary, keeps
+    interior cells as plain boxes and clips only the boundary band.
+
+    Parameters:
+    - boundary (Geometry): Province geometry in the (projected) grid CRS.
+    - grid_size (int): Size of the grid cell (in meters).
+    - tolerance (float): Simplification tolerance used to find interior
+      cells. Defaults to a tenth of the grid size.
+    - block (tuple): Optional (origin, row_range, col_range) restricting the
+      lattice to one block of a larger grid (see `lattice_cells`). By default
+      the lattice covers the bounds of `boundary`.
 
-    # Generate grid
-    print("Creating grid...")
+    Returns:
+    - dict: Arrays "geometry", "row", "col" and "is_boundary" for every cell
+      that overlaps the province, in lattice (column-major) order.
+    """
+    if tolerance is None:
+        tolerance = grid_size / 10
+
+    if block is None:
+        cells, rows, cols = generate_grid_cells(shapely.bounds(boundary), grid_size)
+    else:
+        cells, rows, cols = lattice_cells(block[0], grid_size, block[1], block[2])
+    interior, boundary_band = split_interior_boundary(cells, boundary, tolerance)
+
+    geoms = cells.copy()
+    geoms[boundary_band] = clip_boundary_cells(cells[boundary_band], rows[boundary_band],
+                                               cols[boundary_band], boundary)
+    keep = interior | (boundary_band & ~shapely.is_empty(geoms))
+    return {
+        "geometry": geoms[keep],
+        "row": rows[keep],
+        "col": cols[keep],
+        "is_boundary": boundary_band[keep],
+    }
+
+def _overlay_grid(province_gdf, grid_size):
+    """Original grid path: builds every cell and overlays the full province."""
     minx, miny, maxx, maxy = province_gdf.total_bounds
     x_coords = np.arange(minx, maxx, grid_size)
     y_coords = np.arange(miny, maxy, grid_size)
     grid_cells = [box(x, y, x + grid_size, y + grid_size) for x in x_coords for y in y_coords]
-    grid_gdf = gpd.GeoDataFrame({"geometry": grid_cells}, crs="EPSG:3005")
+    grid_gdf = gpd.GeoDataFrame({"geometry": grid_cells}, crs=province_gdf.crs)
+    return gpd.overlay(grid_gdf, province_gdf, how="intersection")
+
+def _vectorized_grid(province_gdf, grid_size, tolerance=None):
+    """Vectorized grid path with the same columns as the overlay output."""
+    boundary = shapely.union_all(province_gdf.geometry.values)
+    cells = build_grid_cells(boundary, grid_size, tolerance)
+    attributes = province_gdf.drop(columns=province_gdf.geometry.name).iloc[[0] * len(cells["geometry"])]
+    return gpd.GeoDataFrame(attributes.reset_index(drop=True), geometry=cells["geometry"],
+                            crs=province_gdf.crs)
+
+def build_grid(province_gdf, grid_size, method="vectorized", tolerance=None, target_crs="EPSG:3005"):
+    """
+    Builds the clipped grid for a province without writing it to disk.
+
+    Parameters:
+    - province_gdf (GeoDataFrame): Province boundary (any CRS).
+    - grid_size (int): Size of the grid cell (in meters).
+    - method (str): "vectorized" (default) clips only the boundary band of
+      cells; "overlay" runs the original full `gpd.overlay`.
+    - tolerance (float): Boundary simplification tolerance for the
+      vectorized method (in meters). Defaults to a tenth of the grid size.
+    - target_crs (str): Projected CRS the grid is laid out in.
+
+    Returns:
+    - tuple: (grid_gdf, grid_index) with the grid in EPSG:4326 and the
+      GridIndex in the projected CRS.
+    """
+    print(f"Reprojecting province shapefile to {target_crs}...")
+    province_gdf = province_gdf.to_crs(target_crs)
 
-    # Clip grid to province boundary
-    print("Clipping grid to province boundary...")
-    grid_gdf = gpd.overlay(grid_gdf, province_gdf, how="intersection")
+    # Generate grid and clip it to province boundary
+    if method == "overlay":
+        print("Creating grid and clipping it to province boundary (overlay)...")
+        grid_gdf = _overlay_grid(province_gdf, grid_size)
+    elif method == "vectorized":
+        print("Creating grid and clipping boundary cells to province boundary...")
+        grid_gdf = _vectorized_grid(province_gdf, grid_size, tolerance)
+    else:
+        raise ValueError(f"Unknown grid method: {method}")
 
-    # Add grid_id column
+    # Add grid_id column derived from each cell's lattice row/column, so the
+    # same cell keeps the same id however the grid was clipped
     print("Adding grid_id column...")
-    grid_gdf["grid_id"] = range(1, len(grid_gdf) + 1)
+    minx, miny, maxx, _ = province_gdf.total_bounds
+    n_cols = len(np.arange(minx, maxx, grid_size))
+    rows, cols = lattice_positions(grid_gdf.geometry.values, (minx, miny), grid_size)
+    grid_gdf["grid_id"] = lattice_grid_ids(rows, cols, n_cols)
+    grid_index = GridIndex.from_grid(grid_gdf, (minx, miny), grid_size)
 
     # Reproject grid to EPSG:4326 for lat/lon
     print("Reprojecting grid to EPSG:4326...")
@@ -52,6 +224,30 @@ def create_grid(province_shapefile, grid_size, output_folder):
     print("Adding latitude and longitude columns from centroids...")
     grid_gdf["latitude"] = grid_gdf.geometry.centroid.y
     grid_gdf["longitude"] = grid_gdf.geometry.centroid.x
+    return grid_gdf, grid_index
+
+def create_grid(province_shapefile, grid_size, output_folder, method="vectorized", tolerance=None):
+    """
+    Creates a grid over a province, clips it to the province boundary,
+    and adds latitude and longitude for grid centroids.
+
+    Parameters:
+    - province_shapefile (str): Path to the province shapefile.
+    - grid_size (int): Size of the grid cell (in meters).
+    - output_folder (Path): Directory to save the grid shapefile.
+    - method (str): "vectorized" (default) clips only the boundary band of
+      cells; "overlay" runs the original full `gpd.overlay`.
+    - tolerance (float): Boundary simplification tolerance for the
+      vectorized method (in meters). Defaults to a tenth of the grid size.
+
+    Returns:
+    - Path to the saved grid shapefile. A GridIndex for fast point-to-cell
+      assignment is saved next to it (see `grid_index.grid_index_path`).
+    """
+    print(f"Loading province shapefile from {province_shapefile}...")
+    province_gdf = gpd.read_file(province_shapefile)
+
+    grid_gdf, grid_index = build_grid(province_gdf, grid_size, method, tolerance)
 
     # Save grid to file
     province_name = province_gdf["PRNAME"].iloc[0]
@@ -60,5 +256,156 @@ def create_grid(province_shapefile, grid_size, output_folder):
     print(f"Saving grid shapefile to {output_file}...")
     grid_gdf.to_file(output_file)
 
+    index_file = grid_index_path(output_file)
+    print(f"Saving grid index to {index_file}...")
+    grid_index.save(index_file)
+
     print("Grid creation complete!")
     return str(output_file)
+
+# Province boundary and lattice settings shared by the tiled-grid workers,
+# set once per worker process by _init_block_worker
+_block_worker = {}
+
+def _init_block_worker(boundary_wkb, origin, grid_size, n_cols, tolerance, crs, output_dir):
+    """Initializes a tiled-grid worker process with the shared settings."""
+    boundary = shapely.from_wkb(boundary_wkb)
+    shapely.prepare(boundary)
+    _block_worker.update(boundary=boundary, origin=origin, grid_size=grid_size, n_cols=n_cols,
+                         tolerance=tolerance, crs=crs, output_dir=output_dir)
+
+def _build_block(block_row, block_col, row_range, col_range):
+    """
+    Builds, clips and writes one block of a tiled grid (runs in a worker).
+
+    Returns:
+    - tuple: (block_row, block_col, rows, cols, grid_ids, boundary_ids,
+      boundary_wkb) with the lattice positions of the written cells and the
+      clipped cells needed for the GridIndex.
+    """
+    settings = _block_worker
+    origin, grid_size = settings["origin"], settings["grid_size"]
+    block_box = box(origin[0] + col_range[0] * grid_size, origin[1] + row_range[0] * grid_size,
+                    origin[0] + col_range[1] * grid_size, origin[1] + row_range[1] * grid_size)
+    # Cut the province with a margin so the block edges are not mistaken
+    # for the province boundary
+    piece = shapely.intersection(settings["boundary"], shapely.buffer(block_box, 2 * grid_size, join_style="mitre"))
+    empty = np.empty(0, dtype=np.int64)
+    if shapely.is_empty(piece):
+        return block_row, block_col, empty, empty, empty, empty, []
+
+    cells = build_grid_cells(piece, grid_size, settings["tolerance"], block=(origin, row_range, col_range))
+    grid_ids = lattice_grid_ids(cells["row"], cells["col"], settings["n_cols"])
+    clipped = shapely.area(cells["geometry"]) < grid_size * grid_size * (1 - 1e-9)
+    boundary_wkb = list(shapely.to_wkb(cells["geometry"][clipped]))
+
+    if len(grid_ids):
+        block_gdf = gpd.GeoDataFrame({"grid_id": grid_ids}, geometry=cells["geometry"], crs=settings["crs"])
+        block_gdf = block_gdf.to_crs("EPSG:4326")
+        block_gdf["latitude"] = block_gdf.geometry.centroid.y
+        block_gdf["longitude"] = block_gdf.geometry.centroid.x
+        block_gdf.to_parquet(Path(settings["output_dir"]) / f"part-{block_row:05d}-{block_col:05d}.parquet")
+    return block_row, block_col, cells["row"], cells["col"], grid_ids, grid_ids[clipped], boundary_wkb
+
+def create_grid_tiled(province_shapefile, grid_size, output_folder, block_cells=256, max_workers=None,
+                      max_blocks_in_flight=None, tolerance=None, target_crs="EPSG:3005"):
+    """
+    Creates a grid block by block in a process pool, for grids too large to
+    build in memory at once (e.g. a Canada-wide 1 km grid).
+
+    The province bounding box is split into blocks of block_cells x
+    block_cells cells on one global lattice, so grid_ids are the same as a
+    single-pass `create_grid` would produce. Each worker builds and clips its
+    block and writes it as one part of a partitioned GeoParquet dataset.
+
+    Parameters:
+    - province_shapefile (str): Path to the province (or national) shapefile.
+    - grid_size (int): Size of the grid cell (in meters).
+    - output_folder (Path): Directory to save the grid dataset.
+    - block_cells (int): Block width and height in cells.
+    - max_workers (int): Worker processes. Defaults to the CPU count.
+    - max_blocks_in_flight (int): Upper bound on blocks submitted but not yet
+      collected, which bounds peak memory. Defaults to twice max_workers.
+    - tolerance (float): Boundary simplification tolerance (in meters).
+      Defaults to a tenth of the grid size.
+    - target_crs (str): Projected CRS the grid is laid out in.
+
+    Returns:
+    - Path to the GeoParquet dataset folder (readable with
+      `gpd.read_parquet`). A GridIndex is saved next to it.
+    """
+    if tolerance is None:
+        tolerance = grid_size / 10
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    if max_blocks_in_flight is None:
+        max_blocks_in_flight = 2 * max_workers
+
+    print(f"Loading province shapefile from {province_shapefile}...")
+    province_gdf = gpd.read_file(province_shapefile)
+    print(f"Reprojecting province shapefile to {target_crs}...")
+    province_gdf = province_gdf.to_crs(target_crs)
+    boundary = shapely.union_all(province_gdf.geometry.values)
+    shapely.prepare(boundary)
+
+    minx, miny, maxx, maxy = province_gdf.total_bounds
+    n_cols = len(np.arange(minx, maxx, grid_size))
+    n_rows = len(np.arange(miny, maxy, grid_size))
+    origin = (minx, miny)
+
+    province_safe_name = sanitize_filename(province_gdf["PRNAME"].iloc[0])
+    output_dir = Path(output_folder) / f"{province_safe_name}_grid.parquet"
+    output_dir.mkdir(parents=True, exist_ok=True)
+    for old_part in output_dir.glob("part-*.parquet"):
+        old_part.unlink()
+
+    blocks = []
+    for r0 in range(0, n_rows, block_cells):
+        for c0 in range(0, n_cols, block_cells):
+            row_range = (r0, min(r0 + block_cells, n_rows))
+            col_range = (c0, min(c0 + block_cells, n_cols))
+            block_box = box(minx + col_range[0] * grid_size, miny + row_range[0] * grid_size,
+                            minx + col_range[1] * grid_size, miny + row_range[1] * grid_size)
+            if shapely.intersects(boundary, block_box):
+                blocks.append((r0 // block_cells, c0 // block_cells, row_range, col_range))
+    print(f"Creating grid of {n_rows} x {n_cols} cells in {len(blocks)} blocks "
+          f"({max_workers} workers, at most {max_blocks_in_flight} blocks in flight)...")
+
+    lookup_array = np.zeros((n_rows, n_cols), dtype=np.int64)
+    boundary_ids = []
+    boundary_wkb = []
+    total_cells = 0
+
+    def collect(future):
+        nonlocal total_cells
+        _, _, rows, cols, grid_ids, clipped_ids, clipped_wkb = future.result()
+        lookup_array[rows, cols] = grid_ids
+        boundary_ids.append(clipped_ids)
+        boundary_wkb.extend(clipped_wkb)
+        total_cells += len(grid_ids)
+
+    init_args = (shapely.to_wkb(boundary), origin, grid_size, n_cols, tolerance, target_crs, str(output_dir))
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_block_worker, initargs=init_args) as pool:
+        pending = set()
+        for done_blocks, block in enumerate(blocks, start=1):
+            if len(pending) >= max_blocks_in_flight:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    collect(future)
+            pending.add(pool.submit(_build_block, *block))
+            if done_blocks % 100 == 0:
+                print(f"Submitted {done_blocks}/{len(blocks)} blocks...")
+        for future in wait(pending).done:
+            collect(future)
+
+    boundary_ids = np.concatenate(boundary_ids) if boundary_ids else np.empty(0, dtype=np.int64)
+    order = np.argsort(boundary_ids)
+    boundary_geoms = shapely.from_wkb(np.asarray(boundary_wkb, dtype=object))
+    grid_index = GridIndex(minx, miny, grid_size, target_crs, lookup_array,
+                           boundary_ids[order], boundary_geoms[order])
+    index_file = grid_index_path(output_dir)
+    print(f"Saving grid index to {index_file}...")
+    grid_index.save(index_file)
+
+    print(f"Grid creation complete! {total_cells} cells written to {output_dir}")
+    return str(output_dir)
@@ -0,0 +1,178 @@
+import numpy as np
+import shapely
+from pathlib import Path
+from pyproj import Transformer
+
+def grid_index_path(grid_file):
+    """Returns the path of the GridIndex saved next to a grid file."""
+    return Path(grid_file).with_suffix(".index.npz")
+
+def lattice_grid_ids(rows, cols, n_cols):
+    """Stable grid_id of a lattice cell, derived from its row and column."""
+    return np.asarray(rows, dtype=np.int64) * n_cols + np.asarray(cols, dtype=np.int64) + 1
+
+def lattice_positions(geoms, origin, cell_size):
+    """
+    Finds the lattice row and column of (possibly clipped) grid cells.
+
+    Parameters:
+    - geoms (np.ndarray): Cell polygons in the grid CRS.
+    - origin (tuple): (x, y) lower-left corner of the lattice.
+    - cell_size (float): Size of the grid cell (in grid CRS units).
+
+    Returns:
+    - tuple: (rows, cols) int64 arrays.
+    """
+    points = shapely.point_on_surface(geoms)
+    cols = np.floor((shapely.get_x(points) - origin[0]) / cell_size).astype(np.int64)
+    rows = np.floor((shapely.get_y(points) - origin[1]) / cell_size).astype(np.int64)
+    return rows, cols
+
+class GridIndex:
+    """
+    Analytic point-to-cell index for a regular grid.
+
+    A point is projected to the grid CRS and floor-divided by the cell size to
+    get its lattice row and column, which are looked up in a dense
+    row/col -> grid_id array. Only points that land in a clipped boundary
+    cell are tested exactly against that cell's polygon.
+    """
+
+    def __init__(self, origin_x, origin_y, cell_size, crs, lookup_array, boundary_ids, boundary_geoms):
+        """
+        Parameters:
+        - origin_x, origin_y (float): Lower-left corner of the lattice in the grid CRS.
+        - cell_size (float): Size of the grid cell (in grid CRS units).
+        - crs (str): CRS of the lattice (e.g., "EPSG:3005").
+        - lookup_array (np.ndarray): (n_rows, n_cols) int64 array of grid_ids,
+          0 where the lattice cell is outside the grid.
+        - boundary_ids (np.ndarray): Sorted grid_ids of clipped boundary cells.
+        - boundary_geoms (np.ndarray): Clipped polygons (grid CRS) matching boundary_ids.
+        """
+        self.origin_x = float(origin_x)
+        self.origin_y = float(origin_y)
+        self.cell_size = float(cell_size)
+        self.crs = str(crs)
+        self.lookup_array = np.asarray(lookup_array, dtype=np.int64)
+        self.boundary_ids = np.asarray(boundary_ids, dtype=np.int64)
+        self.boundary_geoms = np.asarray(boundary_geoms, dtype=object)
+        shapely.prepare(self.boundary_geoms)
+        self.is_boundary = np.isin(self.lookup_array, self.boundary_ids)
+        self._transformer = Transformer.from_crs("EPSG:4326", self.crs, always_xy=True)
+
+    @property
+    def shape(self):
+        """(n_rows, n_cols) of the lattice."""
+        return self.lookup_array.shape
+
+    @classmethod
+    def from_grid(cls, grid_gdf, origin, cell_size):
+        """
+        Builds the index from a grid GeoDataFrame in its projected CRS.
+
+        Parameters:
+        - grid_gdf (GeoDataFrame): Grid cells (projected CRS) with a grid_id column
+          produced by `lattice_grid_ids`.
+        - origin (tuple): (x, y) lower-left corner of the lattice.
+        - cell_size (float): Size of the grid cell (in grid CRS units).
+
+        Returns:
+        - GridIndex
+        """
+        origin_x, origin_y = origin
+        geoms = grid_gdf.geometry.values
+        rows, cols = lattice_positions(geoms, origin, cell_size)
+
+        minx, miny, maxx, maxy = grid_gdf.total_bounds
+        n_cols = max(int(np.ceil((maxx - origin_x) / cell_size)), cols.max(initial=-1) + 1)
+        n_rows = max(int(np.ceil((maxy - origin_y) / cell_size)), rows.max(initial=-1) + 1)
+        lookup_array = np.zeros((n_rows, n_cols), dtype=np.int64)
+        grid_ids = grid_gdf["grid_id"].to_numpy(dtype=np.int64)
+        lookup_array[rows, cols] = grid_ids
+
+        # Cells that are not full squares were clipped by the boundary
+        clipped = shapely.area(geoms) < cell_size * cell_size * (1 - 1e-9)
+        order = np.argsort(grid_ids[clipped])
+        return cls(origin_x, origin_y, cell_size, grid_gdf.crs.to_string(), lookup_array,
+                   grid_ids[clipped][order], geoms[clipped][order])
+
+    def lookup(self, lon, lat):
+        """
+        Assigns EPSG:4326 points to grid cells.
+
+        Parameters:
+        - lon, lat (array-like): Point coordinates in degrees.
+
+        Returns:
+        - np.ndarray: int64 grid_id per point, 0 for points outside the grid.
+        """
+        x, y = self._transformer.transform(np.asarray(lon, dtype=float), np.asarray(lat, dtype=float))
+        return self.lookup_projected(x, y)
+
+    def lookup_projected(self, x, y):
+        """
+        Assigns points already in the grid CRS to grid cells.
+
+        Parameters:
+        - x, y (array-like): Point coordinates in the grid CRS.
+
+        Returns:
+        - np.ndarray: int64 grid_id per point, 0 for points outside the grid.
+        """
+        x = np.atleast_1d(np.asarray(x, dtype=float))
+        y = np.atleast_1d(np.asarray(y, dtype=float))
+        n_rows, n_cols = self.shape
+        cols = np.floor((x - self.origin_x) / self.cell_size)
+        rows = np.floor((y - self.origin_y) / self.cell_size)
+        valid = (cols >= 0) & (cols < n_cols) & (rows >= 0) & (rows < n_rows)
+
+        grid_ids = np.zeros(len(x), dtype=np.int64)
+        rows = rows[valid].astype(np.int64)
+        cols = cols[valid].astype(np.int64)
+        grid_ids[valid] = self.lookup_array[rows, cols]
+
+        # Exact polygon test only for points in clipped boundary cells
+        candidates = np.flatnonzero(valid)[self.is_boundary[rows, cols]]
+        if len(candidates):
+            geoms = self.boundary_geoms[np.searchsorted(self.boundary_ids, grid_ids[candidates])]
+            inside = shapely.contains_xy(geoms, x[candidates], y[candidates])
+            grid_ids[candidates[~inside]] = 0
+        return grid_ids
+
+    def save(self, path):
+        """
+        Saves the index as a compressed .npz file.
+
+        Parameters:
+        - path (str): Output path.
+        """
+        wkb = shapely.to_wkb(self.boundary_geoms)
+        offsets = np.cumsum([0] + [len(g) for g in wkb])
+        np.savez_compressed(
+            path,
+            origin=np.array([self.origin_x, self.origin_y]),
+            cell_size=np.array(self.cell_size),
+            crs=np.array(self.crs),
+            lookup_array=self.lookup_array,
+            boundary_ids=self.boundary_ids,
+            boundary_wkb=np.frombuffer(b"".join(wkb), dtype=np.uint8),
+            boundary_offsets=offsets,
+        )
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads an index saved with `save`.
+
+        Parameters:
+        - path (str): Path to the .npz file.
+
+        Returns:
+        - GridIndex
+        """
+        with np.load(path) as data:
+            wkb = data["boundary_wkb"].tobytes()
+            offsets = data["boundary_offsets"]
+            boundary_geoms = shapely.from_wkb([wkb[start:end] for start, end in zip(offsets[:-1], offsets[1:])])
+            return cls(data["origin"][0], data["origin"][1], data["cell_size"], str(data["crs"]),
+                       data["lookup_array"], data["boundary_ids"], boundary_geoms)
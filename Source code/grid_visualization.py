@@ -1,6 +1,8 @@
 import matplotlib.pyplot as plt
 import geopandas as gpd
 import os
+import rasterio
+from raster_io import read_raster, PREVIEW_SIZE
 
 def visualize_grid_and_boundary(province_shapefile, grid_shapefile):
     """
@@ -49,6 +51,47 @@ def visualize_grid_and_boundary(province_shapefile, grid_shapefile):
     plt.tight_layout()
     plt.show()
 
+def visualize_raster(raster_file, province_shapefile=None, max_size=PREVIEW_SIZE, title=None):
+    """
+    Shows a coarse preview of a raster (e.g. DEM, slope or aspect), optionally
+    only over a province with its boundary on top.
+
+    Only the window covering the province is read, at a resolution of at
+    most max_size pixels per side, which GDAL serves from the raster's
+    overviews, so previews of province-wide rasters are quick.
+
+    Parameters:
+    - raster_file (str): Path to the raster.
+    - province_shapefile (str): Optional province boundary to crop to and draw.
+    - max_size (int): Maximum width/height of the preview in pixels.
+    - title (str): Plot title (defaults to the file name).
+    """
+    province_gdf = None
+    bounds, bounds_crs = None, None
+    if province_shapefile:
+        print(f"Loading province shapefile from {province_shapefile}...")
+        province_gdf = gpd.read_file(province_shapefile)
+        bounds, bounds_crs = province_gdf.total_bounds, province_gdf.crs
+
+    print(f"Reading preview of {raster_file}...")
+    values, transform = read_raster(raster_file, bounds=bounds, bounds_crs=bounds_crs, max_size=max_size)
+    with rasterio.open(raster_file) as src:
+        raster_crs = src.crs
+    extent = (transform.c, transform.c + values.shape[1] * transform.a,
+              transform.f + values.shape[0] * transform.e, transform.f)
+
+    _, ax = plt.subplots(figsize=(10, 10))
+    image = ax.imshow(values, extent=extent, cmap="terrain")
+    plt.colorbar(image, ax=ax, shrink=0.7)
+    if province_gdf is not None:
+        province_gdf.to_crs(raster_crs).plot(ax=ax, edgecolor="black", facecolor="none", linewidth=1)
+
+    ax.set_title(title or os.path.basename(raster_file), fontsize=16)
+    ax.set_xlabel("Longitude", fontsize=12)
+    ax.set_ylabel("Latitude", fontsize=12)
+    plt.tight_layout()
+    plt.show()
+
 if __name__ == "__main__":
     # Dynamically resolve paths relative to the current script
     base_dir = os.path.dirname(os.path.abspath(__file__))
@@ -140,18 +140,24 @@
 # if __name__ == "__main__":
 #     main()
 from pathlib import Path
-from grid_creator import create_grid
-from climate_data_processor import process_climate_csv
+from grid_cache import load_or_create_grid
+from climate_data_processor import process_climate_csv, process_climate_archive
+from climate_cube import ingest_climate_files
+from climate_data_fetcher import monthly_climate_files
+from fwi import compute_fwi
+from rolling_features import add_rolling_features
 from fire_data_processor import process_fire_data
 from fetch_dem_data import fetch_dem_data
-from process_dem_data import calculate_slope_aspect
 from map_slope_elevation_aspect import map_values_to_grid
+from terrain_features import compute_terrain_features, summarize_terrain, terrain_band
 import pandas as pd
 
 # Base folders
 BASE_FOLDER = Path(__file__).resolve().parent / "project_data"
 SHAPEFILE_FOLDER = BASE_FOLDER / "shapefiles"
 GRID_FOLDER = BASE_FOLDER / "grids"
+GRID_CACHE_FOLDER = GRID_FOLDER / "cache"
+REGRID_WEIGHTS_FOLDER = GRID_CACHE_FOLDER / "regrid_weights"
 CLIMATE_DATA_FOLDER = BASE_FOLDER / "climate_data"
 FIRE_DATA_FOLDER = BASE_FOLDER / "fire_data"
 DEM_DATA_FOLDER = BASE_FOLDER / "dem_data"
@@ -160,15 +166,21 @@ OUTPUT_FOLDER = BASE_FOLDER / "output"
 # Input files
 PROVINCE_SHAPEFILE = SHAPEFILE_FOLDER / "Nova_Scotia_shapefile/nova_scotia_boundary.shp"
 CLIMATE_CSV_FILE = CLIMATE_DATA_FOLDER / "climate_data.csv"
-FIRE_FILE = FIRE_DATA_FOLDER / "NFDB_point_20240613.txt"
+CLIMATE_CUBE = CLIMATE_DATA_FOLDER / "nova_scotia_era5.zarr"
+FIRE_FILE = FIRE_DATA_FOLDER  # Newest NFDB_point_*.txt release in the folder; converted once to a Parquet archive
+
+# Grid settings
+GRID_SIZE = 10000  # Grid size: 10 km x 10 km
 
 # Output files
-GRID_SHAPEFILE = GRID_FOLDER / "Nova_Scotia___Nouvelle-Écosse_grid.shp"
 PROCESSED_CLIMATE_CSV = OUTPUT_FOLDER / "Nova_Scotia_processed_climate_data.csv"
+FWI_CSV = OUTPUT_FOLDER / "Nova_Scotia_fwi.csv"
+FWI_STATE_FILE = OUTPUT_FOLDER / "Nova_Scotia_fwi_state.npz"
+CLIMATE_FEATURES_CSV = OUTPUT_FOLDER / "Nova_Scotia_climate_features.csv"
 DEM_FILE = DEM_DATA_FOLDER / "dem_data.tif"
-SLOPE_FILE = DEM_DATA_FOLDER / "slope.tif"
-ASPECT_FILE = DEM_DATA_FOLDER / "aspect.tif"
+TERRAIN_FILE = DEM_DATA_FOLDER / "terrain_features.tif"
 GRID_WITH_DEM_CSV = OUTPUT_FOLDER / "Nova_Scotia_grid_with_dem_data.csv"
+TERRAIN_SUMMARY_CSV = OUTPUT_FOLDER / "Nova_Scotia_terrain_summary.csv"
 COMBINED_CSV = OUTPUT_FOLDER / "Nova_Scotia_combined_data.csv"
 FINAL_CSV = OUTPUT_FOLDER / "Nova_Scotia_final_combined_data.csv"
 
@@ -179,31 +191,60 @@ NOVA_SCOTIA_BBOX = [-66.45, 43.26, -59.66, 47.24]  # (min_lon, min_lat, max_lon,
 def main():
     print("Starting the workflow...\n")
 
-    # Step 1: Create Grid (if not already created)
-    if not GRID_SHAPEFILE.exists():
-        print("Creating grid for the province...")
-        create_grid(
-            province_shapefile=str(PROVINCE_SHAPEFILE),
-            grid_size=10000,  # Grid size: 10 km x 10 km
-            output_folder=str(GRID_FOLDER)
-        )
-        print(f"Grid created: {GRID_SHAPEFILE}\n")
-    else:
-        print(f"Grid already exists: {GRID_SHAPEFILE}\n")
-
-    # Step 2: Process Climate Data
+    # Step 1: Load Grid (created and cached when the province or grid size changes)
+    print("Loading grid for the province...")
+    grid = load_or_create_grid(
+        province_shapefile=str(PROVINCE_SHAPEFILE),
+        grid_size=GRID_SIZE,
+        cache_folder=str(GRID_CACHE_FOLDER)
+    )
+    print(f"Grid ready: {len(grid)} cells (cache key {grid.key})\n")
+
+    # Step 2: Ingest downloaded months into the climate cube (months already in it are skipped)
+    climate_files = monthly_climate_files(CLIMATE_DATA_FOLDER)
+    if climate_files:
+        print("Ingesting climate data into the climate cube...")
+        appended = ingest_climate_files(str(CLIMATE_CUBE), [str(f) for f in climate_files])
+        print(f"Climate cube {CLIMATE_CUBE}: {len(appended)} new month(s)\n")
+
+    # Step 3: Process Climate Data
     if not PROCESSED_CLIMATE_CSV.exists():
         print("Processing climate data and mapping it to grid cells...")
-        process_climate_csv(
-            grid_shapefile=str(GRID_SHAPEFILE),
-            climate_csv=str(CLIMATE_CSV_FILE),
-            output_csv=str(PROCESSED_CLIMATE_CSV)
-        )
+        if CLIMATE_CUBE.exists():
+            process_climate_archive(
+                grid=grid,
+                climate_files=str(CLIMATE_CUBE),
+                output_csv=str(PROCESSED_CLIMATE_CSV),
+                weights_folder=str(REGRID_WEIGHTS_FOLDER)
+            )
+        else:
+            process_climate_csv(
+                grid=grid,
+                climate_csv=str(CLIMATE_CSV_FILE),
+                output_csv=str(PROCESSED_CLIMATE_CSV)
+            )
         print(f"Processed climate data saved to: {PROCESSED_CLIMATE_CSV}\n")
     else:
         print(f"Processed climate data already exists: {PROCESSED_CLIMATE_CSV}\n")
 
-    # Step 3: Fetch DEM Data
+    # Step 4: Compute Fire Weather Index (continues from the saved state when one exists)
+    print("Computing fire weather indices...")
+    compute_fwi(
+        climate_csv=str(PROCESSED_CLIMATE_CSV),
+        output_csv=str(FWI_CSV),
+        state_file=str(FWI_STATE_FILE)
+    )
+    print(f"Fire weather indices saved to: {FWI_CSV}\n")
+
+    # Step 5: Rolling-window and lagged climate features
+    if not CLIMATE_FEATURES_CSV.exists():
+        print("Computing rolling climate features...")
+        add_rolling_features(climate_csv=str(PROCESSED_CLIMATE_CSV), output_csv=str(CLIMATE_FEATURES_CSV))
+        print(f"Climate features saved to: {CLIMATE_FEATURES_CSV}\n")
+    else:
+        print(f"Climate features already exist: {CLIMATE_FEATURES_CSV}\n")
+
+    # Step 6: Fetch DEM Data
     if not DEM_FILE.exists():
         print("Fetching DEM data...")
         fetch_dem_data(bbox=NOVA_SCOTIA_BBOX, output_file=str(DEM_FILE))
@@ -211,34 +252,43 @@ def main():
     else:
         print(f"DEM data already exists: {DEM_FILE}\n")
 
-    # Step 4: Process DEM Data (Calculate Slope and Aspect)
-    if not (SLOPE_FILE.exists() and ASPECT_FILE.exists()):
-        print("Processing DEM data...")
-        calculate_slope_aspect(dem_file=str(DEM_FILE), slope_file=str(SLOPE_FILE), aspect_file=str(ASPECT_FILE))
-        print(f"Slope and aspect data saved to: {SLOPE_FILE}, {ASPECT_FILE}\n")
+    # Step 7: Terrain Features (slope, aspect, TPI, TRI, roughness, curvature, solar exposure)
+    # in one block-wise pass over the DEM
+    if not TERRAIN_FILE.exists():
+        print("Calculating terrain features...")
+        compute_terrain_features(dem_file=str(DEM_FILE), output_file=str(TERRAIN_FILE))
+        print(f"Terrain features saved to: {TERRAIN_FILE}\n")
     else:
-        print(f"Slope and aspect data already exist: {SLOPE_FILE}, {ASPECT_FILE}\n")
+        print(f"Terrain features already exist: {TERRAIN_FILE}\n")
 
-    # Step 5: Map DEM Data to Grid
+    # Step 8: Map DEM Data to Grid (slope and aspect are bands of the terrain raster)
     if not GRID_WITH_DEM_CSV.exists():
         print("Mapping DEM, slope, and aspect data to grid cells...")
         map_values_to_grid(
-            grid_file=str(GRID_SHAPEFILE),
+            grid=grid,
             dem_file=str(DEM_FILE),
-            slope_file=str(SLOPE_FILE),
-            aspect_file=str(ASPECT_FILE),
+            slope_file=terrain_band(str(TERRAIN_FILE), "slope"),
+            aspect_file=terrain_band(str(TERRAIN_FILE), "aspect"),
             output_csv=str(GRID_WITH_DEM_CSV)
         )
         print(f"DEM data mapped to grid and saved to: {GRID_WITH_DEM_CSV}\n")
     else:
         print(f"Mapped DEM data already exists: {GRID_WITH_DEM_CSV}\n")
 
-    # Step 6: Process Fire History Data
+    # Step 8b: Terrain Feature Summaries per Grid Cell
+    if not TERRAIN_SUMMARY_CSV.exists():
+        print("Summarizing terrain features per grid cell...")
+        summarize_terrain(grid=grid, terrain_file=str(TERRAIN_FILE), output_csv=str(TERRAIN_SUMMARY_CSV))
+        print(f"Terrain summaries saved to: {TERRAIN_SUMMARY_CSV}\n")
+    else:
+        print(f"Terrain summaries already exist: {TERRAIN_SUMMARY_CSV}\n")
+
+    # Step 9: Process Fire History Data
     if not COMBINED_CSV.exists():
         print("Processing fire history data and integrating with climate data...")
         process_fire_data(
             fire_file=str(FIRE_FILE),
-            grid_shapefile=str(GRID_SHAPEFILE),
+            grid=grid,
             climate_csv=str(PROCESSED_CLIMATE_CSV),
             output_csv=str(COMBINED_CSV)
         )
@@ -246,7 +296,7 @@ def main():
     else:
         print(f"Combined data already exists: {COMBINED_CSV}\n")
 
-    # Step 7: Merge DEM Data with Combined Data
+    # Step 10: Merge DEM Data with Combined Data
     if not FINAL_CSV.exists():
         print("Merging DEM data with combined data...")
         combined_df = pd.read_csv(COMBINED_CSV)
@@ -257,6 +307,11 @@ def main():
             dem_df[['grid_id', 'elevation', 'slope', 'aspect']], on='grid_id', how='left'
         )
 
+        # Merge the cell means of the other terrain features
+        terrain_df = pd.read_csv(TERRAIN_SUMMARY_CSV)
+        terrain_columns = ['tpi', 'tri', 'roughness', 'profile_curvature', 'plan_curvature', 'solar_exposure']
+        final_df = final_df.merge(terrain_df[['grid_id'] + terrain_columns], on='grid_id', how='left')
+
         # Save the final combined CSV
         final_df.to_csv(FINAL_CSV, index=False)
         print(f"Final combined data saved to: {FINAL_CSV}\n")
@@ -1,34 +1,48 @@
-import geopandas as gpd
-import rasterio
 import pandas as pd
-import numpy as np
-
-def map_values_to_grid(grid_file, dem_file, slope_file, aspect_file, output_csv):
-    grid_gdf = gpd.read_file(grid_file)
-
-    with rasterio.open(dem_file) as dem_src, \
-         rasterio.open(slope_file) as slope_src, \
-         rasterio.open(aspect_file) as aspect_src:
-
-        dem_data = dem_src.read(1)
-        slope_data = slope_src.read(1)
-        aspect_data = aspect_src.read(1)
-
-        transform = dem_src.transform
-
-        grid_gdf["elevation"] = np.nan
-        grid_gdf["slope"] = np.nan
-        grid_gdf["aspect"] = np.nan
-
-        for index, row in grid_gdf.iterrows():
-            x, y = row["geometry"].centroid.x, row["geometry"].centroid.y
-            row_idx, col_idx = ~transform * (x, y)
-            row_idx, col_idx = int(row_idx), int(col_idx)
-
-            if 0 <= row_idx < dem_data.shape[0] and 0 <= col_idx < dem_data.shape[1]:
-                grid_gdf.at[index, "elevation"] = dem_data[row_idx, col_idx]
-                grid_gdf.at[index, "slope"] = slope_data[row_idx, col_idx]
-                grid_gdf.at[index, "aspect"] = aspect_data[row_idx, col_idx]
+from grid_cache import load_grid
+from raster_sampler import RasterSampler
+from zonal_stats import grid_label_raster, zonal_statistics, BLOCK_SIZE
+
+def map_values_to_grid(grid, dem_file, slope_file, aspect_file, output_csv, label_file=None, block_size=BLOCK_SIZE,
+                       point_rasters=None, point_method="nearest"):
+    """
+    Summarizes elevation, slope and aspect over every grid cell.
+
+    The grid is rasterized once into a label raster aligned to the DEM, and
+    every DEM pixel whose centre falls in a cell contributes to that cell's
+    statistics (see `zonal_stats.zonal_statistics`). "elevation" and "slope"
+    are cell means and "aspect" is the circular mean of aspect. Other rasters
+    (e.g. NDVI, land cover, fuel type) can be sampled at the cell centroids.
+
+    Parameters:
+    - grid (CachedGrid or str): Loaded grid, or path to a grid file.
+    - dem_file (str): DEM raster.
+    - slope_file (str or tuple): Slope raster on the DEM's grid, or (path, band)
+      for a band of a multi-band raster (see `terrain_features.terrain_band`).
+    - aspect_file (str or tuple): Aspect raster on the DEM's grid, or (path, band).
+    - output_csv (str): Path to save the grid with the terrain statistics.
+    - label_file (str): Path of the label raster (defaults to a name hashed
+      from the grid and the DEM's pixel grid, next to the DEM); an existing
+      one aligned to the DEM is reused (see `zonal_stats.grid_label_raster`).
+    - block_size (int): Block edge in pixels.
+    - point_rasters (dict): Column name -> raster path, sampled at each cell's
+      centroid with a `RasterSampler`.
+    - point_method (str or dict): "nearest" or "bilinear", or column name -> method.
+    """
+    grid = load_grid(grid)
+    grid_gdf = grid.gdf.copy()
+    label_file = grid_label_raster(grid, dem_file, label_file, block_size=block_size)
+
+    stats = zonal_statistics(label_file, {"elevation": dem_file, "slope": slope_file, "aspect": aspect_file},
+                             len(grid_gdf), circular=("aspect",), block_size=block_size)
+    stats.index = grid_gdf.index
+    grid_gdf = pd.concat([grid_gdf.drop(columns=["elevation", "slope", "aspect"], errors="ignore"), stats], axis=1)
+
+    if point_rasters:
+        with RasterSampler(point_rasters) as sampler:
+            samples = sampler.sample(grid_gdf["longitude"], grid_gdf["latitude"], method=point_method)
+        samples.index = grid_gdf.index
+        grid_gdf = pd.concat([grid_gdf.drop(columns=list(point_rasters), errors="ignore"), samples], axis=1)
 
     grid_gdf.to_csv(output_csv, index=False)
     print(f"Values mapped to grid and saved to '{output_csv}'.")
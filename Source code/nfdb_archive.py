@@ -0,0 +1,168 @@
+import json
+import os
+import shutil
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+from pathlib import Path
+
+ARCHIVE_FOLDER_NAME = "nfdb_archive"
+SOURCE_FILE = "_source.json"
+NFDB_PATTERN = "NFDB_point_*.txt"
+
+DATE_COLUMNS = ["REP_DATE", "ATTK_DATE", "OUT_DATE", "ACQ_DATE"]
+CATEGORY_COLUMNS = ["SRC_AGENCY", "SRC_AGY2", "CAUSE", "PROTZONE", "FIRE_TYPE", "ECOZ_NAME", "ECOZ_NOM"]
+NUMERIC_COLUMNS = {"LATITUDE": "float64", "LONGITUDE": "float64", "SIZE_HA": "float64", "YEAR": "Int16",
+                   "MONTH": "Int8", "DAY": "Int8", "ECOZONE": "Int16"}
+PARTITIONING = ds.partitioning(pa.schema([("province", pa.string()), ("year", pa.int16())]), flavor="hive")
+
+def latest_nfdb_file(folder, pattern=NFDB_PATTERN):
+    """
+    Newest NFDB point file in a folder.
+
+    NFDB releases are named after their date (e.g. NFDB_point_20240613.txt),
+    so the last name in sorted order is the newest release.
+
+    Parameters:
+    - folder (str): Folder holding NFDB text files.
+    - pattern (str): Glob of the NFDB files.
+
+    Returns:
+    - Path: Newest file, or None if there is none.
+    """
+    files = sorted(Path(folder).glob(pattern))
+    return files[-1] if files else None
+
+def _source_signature(fire_file):
+    stat = Path(fire_file).stat()
+    return {"name": Path(fire_file).name, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+def read_nfdb_text(fire_file):
+    """
+    Parses an NFDB point text file with explicit types.
+
+    Parameters:
+    - fire_file (str): NFDB point file (comma separated).
+
+    Returns:
+    - DataFrame: Dates as datetime64, cause and agency codes as categoricals,
+      coordinates and sizes as floats, and the remaining columns as strings.
+    """
+    print(f"Parsing NFDB fire data from {fire_file}...")
+    header = pd.read_csv(fire_file, nrows=0).columns
+    dtypes = {column: "string" for column in header}
+    dtypes.update({column: "category" for column in CATEGORY_COLUMNS if column in header})
+    fire_df = pd.read_csv(fire_file, dtype=dtypes, na_values=["", " "])
+
+    for column, dtype in NUMERIC_COLUMNS.items():
+        if column in fire_df:
+            values = pd.to_numeric(fire_df[column], errors="coerce")
+            fire_df[column] = values.astype(dtype) if dtype == "float64" else values.round().astype(dtype)
+    for column in DATE_COLUMNS:
+        if column in fire_df:
+            fire_df[column] = pd.to_datetime(fire_df[column], errors="coerce")
+    return fire_df
+
+def build_fire_archive(fire_file, archive_folder):
+    """
+    Converts an NFDB text file into a Parquet dataset partitioned by province and year.
+
+    Rows are sorted by report date within each partition, so the Parquet
+    row-group statistics let date and coordinate filters skip row groups
+    as well as partitions. The dataset is written to a temporary folder and
+    swapped in, and a _source.json records which NFDB file it was built from.
+
+    Parameters:
+    - fire_file (str): NFDB point text file.
+    - archive_folder (str): Folder of the Parquet dataset.
+    """
+    fire_df = read_nfdb_text(fire_file)
+    # SRC_AGENCY is the reporting agency (a province or territory, or PC for Parks Canada)
+    fire_df["province"] = fire_df["SRC_AGENCY"].astype("string").fillna("UNKNOWN")
+    year = fire_df["REP_DATE"].dt.year.astype("Int16")
+    fire_df["year"] = year.fillna(fire_df["YEAR"]).fillna(0).astype("int16")
+    fire_df = fire_df.sort_values(["province", "year", "REP_DATE"], kind="stable").reset_index(drop=True)
+
+    archive_folder = Path(archive_folder)
+    tmp_folder = archive_folder.with_name(archive_folder.name + ".tmp")
+    shutil.rmtree(tmp_folder, ignore_errors=True)
+    print(f"Writing {len(fire_df)} fires to {archive_folder}...")
+    ds.write_dataset(pa.Table.from_pandas(fire_df, preserve_index=False), tmp_folder, format="parquet",
+                     partitioning=PARTITIONING, max_rows_per_group=64_000,
+                     file_options=ds.ParquetFileFormat().make_write_options(compression="zstd"))
+    with open(tmp_folder / SOURCE_FILE, "w") as f:
+        json.dump(_source_signature(fire_file), f)
+
+    shutil.rmtree(archive_folder, ignore_errors=True)
+    os.replace(tmp_folder, archive_folder)
+
+def ensure_fire_archive(fire_file, archive_folder=None):
+    """
+    Returns an up-to-date Parquet archive of the NFDB, building it only when needed.
+
+    The archive is rebuilt when it does not exist or was built from a
+    different file (a newer NFDB release, or the same file modified since).
+
+    Parameters:
+    - fire_file (str): NFDB point text file, or a folder to take the newest one from.
+    - archive_folder (str): Folder of the Parquet dataset; defaults to
+      "nfdb_archive" next to the NFDB file.
+
+    Returns:
+    - Path: archive_folder.
+    """
+    if Path(fire_file).is_dir():
+        newest = latest_nfdb_file(fire_file)
+        if newest is None:
+            raise FileNotFoundError(f"No {NFDB_PATTERN} file in {fire_file}")
+        fire_file = newest
+    archive_folder = Path(archive_folder or Path(fire_file).parent / ARCHIVE_FOLDER_NAME)
+
+    source_file = archive_folder / SOURCE_FILE
+    if source_file.exists():
+        with open(source_file) as f:
+            if json.load(f) == _source_signature(fire_file):
+                print(f"NFDB archive is up to date: {archive_folder}")
+                return archive_folder
+        print(f"NFDB archive was built from another file; rebuilding from {fire_file}...")
+    build_fire_archive(fire_file, archive_folder)
+    return archive_folder
+
+def read_fires(archive_folder, provinces=None, bbox=None, start=None, end=None, columns=None):
+    """
+    Reads fires from the archive, touching only the matching partitions and columns.
+
+    Province and year filters prune whole partitions; the date and bounding
+    box filters are pushed down to the Parquet row groups.
+
+    Parameters:
+    - archive_folder (str): Parquet dataset from `build_fire_archive`.
+    - provinces (list): Optional SRC_AGENCY codes (e.g. ["NS"]).
+    - bbox (list): Optional [min_lon, min_lat, max_lon, max_lat].
+    - start, end (str or datetime): Optional inclusive report date range.
+    - columns (list): Columns to read (all when None).
+
+    Returns:
+    - DataFrame: Matching fires.
+    """
+    dataset = ds.dataset(archive_folder, format="parquet", partitioning=PARTITIONING)
+    filters = []
+    if provinces is not None:
+        filters.append(ds.field("province").isin(list(provinces)))
+    if start is not None:
+        start = pd.Timestamp(start)
+        filters += [ds.field("year") >= start.year, ds.field("REP_DATE") >= start]
+    if end is not None:
+        end = pd.Timestamp(end)
+        # Include the whole end day when only a date is given
+        end_exclusive = end + pd.Timedelta(days=1) if end == end.normalize() else end + pd.Timedelta(microseconds=1)
+        filters += [ds.field("year") <= end.year, ds.field("REP_DATE") < end_exclusive]
+    if bbox is not None:
+        min_lon, min_lat, max_lon, max_lat = bbox
+        filters += [ds.field("LONGITUDE") >= min_lon, ds.field("LONGITUDE") <= max_lon,
+                    ds.field("LATITUDE") >= min_lat, ds.field("LATITUDE") <= max_lat]
+
+    expression = None
+    for condition in filters:
+        expression = condition if expression is None else expression & condition
+    return dataset.to_table(columns=columns, filter=expression).to_pandas()
@@ -1,30 +1,177 @@
+import os
 import rasterio
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from rasterio.windows import Window
+from raster_io import write_cog, COG_BLOCK_SIZE
+
+BLOCK_SIZE = 1024
+NODATA = -9999
+
+def _slope_aspect(elevation, res_x, res_y):
+    """Slope and aspect (degrees) of an elevation array, NaN where it is missing."""
+    x, y = np.gradient(elevation, res_x, res_y)
+
+    slope = np.sqrt(x**2 + y**2)
+    slope = np.arctan(slope) * (180 / np.pi)
+
+    aspect = np.arctan2(-x, y) * (180 / np.pi)
+    aspect[aspect < 0] += 360
+    return slope, aspect
+
+def dem_blocks(width, height, block_size=BLOCK_SIZE):
+    """(col_off, row_off, width, height) blocks tiling a width x height raster."""
+    return [(col_off, row_off, min(block_size, width - col_off), min(block_size, height - row_off))
+            for row_off in range(0, height, block_size) for col_off in range(0, width, block_size)]
+
+def map_blocks(pool, function, dem_file, blocks, *args, max_in_flight):
+    """
+    Runs function(dem_file, block, *args) for every block in a process pool
+    and yields the results as they finish.
+
+    At most `max_in_flight` blocks are submitted but not yet collected, so
+    results cannot pile up in memory while the caller is still writing
+    earlier ones.
+    """
+    pending = set()
+    for block in blocks:
+        if len(pending) >= max_in_flight:
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                yield future.result()
+        pending.add(pool.submit(function, dem_file, block, *args))
+    for future in wait(pending).done:
+        yield future.result()
+
+def read_halo_block(src, block, halo=1):
+    """
+    Reads one block of a DEM with `halo` extra pixels on every side.
+
+    The halo gives the pixels on the block's edges the same neighbours as in
+    the full array; on the raster's own edges there is nothing to read, so
+    the halo is cut short there.
+
+    Parameters:
+    - src (rasterio dataset): Open DEM.
+    - block (tuple): (col_off, row_off, width, height) of the block.
+    - halo (int): Extra pixels read on each side.
+
+    Returns:
+    - tuple: (float64 elevation with nodata as NaN, (row slice, col slice)
+      of the block within it).
+    """
+    col_off, row_off, width, height = block
+    row_start, col_start = max(row_off - halo, 0), max(col_off - halo, 0)
+    row_stop, col_stop = min(row_off + height + halo, src.height), min(col_off + width + halo, src.width)
+    window = Window(col_start, row_start, col_stop - col_start, row_stop - row_start)
+    # float32 holds any DEM sample exactly and halves the read; the
+    # arithmetic is done in float64 as in the in-memory version
+    elevation = src.read(1, window=window, out_dtype=np.float32).astype(np.float64)
+    if src.nodata is not None:
+        elevation[elevation == np.float32(src.nodata)] = np.nan
+    inner = (slice(row_off - row_start, row_off - row_start + height),
+             slice(col_off - col_start, col_off - col_start + width))
+    return elevation, inner
+
+def _slope_aspect_block(dem_file, block):
+    """
+    Slope and aspect of one block, read with a 1-pixel halo.
+
+    Without a halo on the raster's own edges, np.gradient falls back to the
+    same one-sided differences as on the full array.
+    """
+    with rasterio.open(dem_file) as src:
+        elevation, inner = read_halo_block(src, block)
+        res_x, res_y = src.transform[0], -src.transform[4]
+
+    slope, aspect = _slope_aspect(elevation, res_x, res_y)
+    return block, _to_float32(slope[inner]), _to_float32(aspect[inner])
+
+def _to_float32(values):
+    """float32 copy with missing values set to NODATA."""
+    values = values.astype(np.float32)
+    values[np.isnan(values)] = NODATA
+    return values
+
+def _terrain_profile(profile):
+    """Profile of the intermediate tiled float32 rasters the COGs are copied from."""
+    profile = profile.copy()
+    profile.update(driver="GTiff", count=1, dtype=rasterio.float32, nodata=NODATA, tiled=True,
+                   blockxsize=COG_BLOCK_SIZE, blockysize=COG_BLOCK_SIZE, compress="deflate", BIGTIFF="IF_SAFER")
+    return profile
+
+def _finish_cogs(slope_tmp, aspect_tmp, slope_file, aspect_file):
+    # Aspect is an angle, so its overviews pick pixels instead of averaging across 0/360
+    write_cog(slope_tmp, slope_file, overview_resampling="average")
+    write_cog(aspect_tmp, aspect_file, overview_resampling="nearest")
+    os.remove(slope_tmp)
+    os.remove(aspect_tmp)
+
+def calculate_slope_aspect(dem_file, slope_file="project_data/slope.tif", aspect_file="project_data/aspect.tif",
+                           block_size=BLOCK_SIZE, max_workers=None, max_blocks_in_flight=None):
+    """
+    Calculates slope and aspect rasters from a DEM.
+
+    By default the DEM is processed block by block: each block is read with
+    a 1-pixel halo, computed in a worker process, and written straight into
+    tiled outputs, so memory use depends on the block size (times the
+    blocks in flight) rather than on the DEM. The results are identical to processing the whole DEM at once.
+    Both rasters are saved as float32 Cloud Optimized GeoTIFFs with internal
+    overviews and NODATA where the DEM has no data.
+
+    Parameters:
+    - dem_file (str): Path to the DEM raster.
+    - slope_file (str): Path to save the slope raster (degrees).
+    - aspect_file (str): Path to save the aspect raster (degrees clockwise from north).
+    - block_size (int): Block edge in pixels (a multiple of 16); None reads the whole DEM into memory.
+    - max_workers (int): Worker processes (defaults to the number of CPUs).
+    - max_blocks_in_flight (int): Upper bound on blocks submitted but not yet
+      written. Defaults to twice max_workers.
+    """
+    if block_size is None:
+        _calculate_slope_aspect_in_memory(dem_file, slope_file, aspect_file)
+        return
 
-def calculate_slope_aspect(dem_file, slope_file="project_data/slope.tif", aspect_file="project_data/aspect.tif"):
+    with rasterio.open(dem_file) as src:
+        profile = _terrain_profile(src.profile)
+        width, height = src.width, src.height
+    slope_tmp, aspect_tmp = f"{slope_file}.tmp.tif", f"{aspect_file}.tmp.tif"
+
+    blocks = dem_blocks(width, height, block_size)
+    max_workers = max_workers or os.cpu_count()
+    max_blocks_in_flight = max_blocks_in_flight or 2 * max_workers
+    print(f"Calculating slope and aspect in {len(blocks)} blocks on {max_workers} processes...")
+
+    with rasterio.open(slope_tmp, "w", **profile) as slope_dst, rasterio.open(aspect_tmp, "w", **profile) as aspect_dst:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            results = map_blocks(pool, _slope_aspect_block, dem_file, blocks, max_in_flight=max_blocks_in_flight)
+            for (col_off, row_off, block_width, block_height), slope, aspect in results:
+                window = Window(col_off, row_off, block_width, block_height)
+                slope_dst.write(slope, 1, window=window)
+                aspect_dst.write(aspect, 1, window=window)
+
+    _finish_cogs(slope_tmp, aspect_tmp, slope_file, aspect_file)
+    print(f"Slope saved to '{slope_file}', Aspect saved to '{aspect_file}'.")
+
+def _calculate_slope_aspect_in_memory(dem_file, slope_file, aspect_file):
     with rasterio.open(dem_file) as src:
         elevation = src.read(1).astype(float)
         elevation[elevation == src.nodata] = np.nan
-        
+
         transform = src.transform
         res_x, res_y = transform[0], -transform[4]
 
-        x, y = np.gradient(elevation, res_x, res_y)
-
-        slope = np.sqrt(x**2 + y**2)
-        slope = np.arctan(slope) * (180 / np.pi)
-
-        aspect = np.arctan2(-x, y) * (180 / np.pi)
-        aspect[aspect < 0] += 360
+        slope, aspect = _slope_aspect(elevation, res_x, res_y)
 
-        profile = src.profile
-        profile.update(dtype=rasterio.float32, nodata=-9999)
+        profile = _terrain_profile(src.profile)
 
-        with rasterio.open(slope_file, "w", **profile) as dst:
-            dst.write(slope.astype(rasterio.float32), 1)
-        with rasterio.open(aspect_file, "w", **profile) as dst:
-            dst.write(aspect.astype(rasterio.float32), 1)
+    slope_tmp, aspect_tmp = f"{slope_file}.tmp.tif", f"{aspect_file}.tmp.tif"
+    with rasterio.open(slope_tmp, "w", **profile) as dst:
+        dst.write(_to_float32(slope), 1)
+    with rasterio.open(aspect_tmp, "w", **profile) as dst:
+        dst.write(_to_float32(aspect), 1)
 
+    _finish_cogs(slope_tmp, aspect_tmp, slope_file, aspect_file)
     print(f"Slope saved to '{slope_file}', Aspect saved to '{aspect_file}'.")
 
 if __name__ == "__main__":
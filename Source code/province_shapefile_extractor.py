@@ -1,7 +1,122 @@
 import os
 import geopandas as gpd
 
-def extract_province_shapefile(province_name, shapefile_folder="shapefiles/lpr_000a21a_e", parent_output_folder="shapefiles"):
+# One-time cache of every province boundary, written next to the province
+# folders by build_province_cache
+PROVINCE_CACHE_FOLDER = "province_cache"
+GRID_CRS = "EPSG:3005"
+
+def _province_cache_files(cache_folder, grid_crs=GRID_CRS):
+    """Paths of the cached boundaries in EPSG:4326 and in the grid CRS."""
+    grid_crs_name = grid_crs.replace(":", "_").lower()
+    return (os.path.join(cache_folder, "province_boundaries_epsg_4326.parquet"),
+            os.path.join(cache_folder, f"province_boundaries_{grid_crs_name}.parquet"))
+
+def build_province_cache(shapefile_path, cache_folder, grid_crs=GRID_CRS):
+    """
+    Reads the national shapefile once and caches every province boundary in
+    EPSG:4326 and in the grid CRS as GeoParquet.
+
+    Parameters:
+    - shapefile_path (str): Path to the national shapefile.
+    - cache_folder (str): Folder to store the cached boundaries.
+    - grid_crs (str): Projected CRS used for grid creation.
+
+    Returns:
+    - GeoDataFrame: All province boundaries in EPSG:4326.
+    """
+    cache_4326, cache_grid = _province_cache_files(cache_folder, grid_crs)
+    os.makedirs(cache_folder, exist_ok=True)
+
+    print(f"Loading shapefile from {shapefile_path} to cache all province boundaries...")
+    gdf = gpd.read_file(shapefile_path)
+
+    print(f"Caching province boundaries in {cache_folder}...")
+    gdf.to_crs(grid_crs).to_parquet(cache_grid)
+    gdf_4326 = gdf.to_crs("EPSG:4326")
+    gdf_4326.to_parquet(cache_4326)
+    return gdf_4326
+
+def load_province_boundaries(shapefile_path, cache_folder, crs="EPSG:4326", grid_crs=GRID_CRS):
+    """
+    Loads every province boundary from the cache, building it on first use
+    or when the national shapefile is newer than the cache.
+
+    Parameters:
+    - shapefile_path (str): Path to the national shapefile.
+    - cache_folder (str): Folder holding the cached boundaries.
+    - crs (str): "EPSG:4326" or the grid CRS.
+    - grid_crs (str): Projected CRS used for grid creation.
+
+    Returns:
+    - GeoDataFrame: All province boundaries in the requested CRS.
+    """
+    cache_4326, cache_grid = _province_cache_files(cache_folder, grid_crs)
+    cache_file = cache_grid if crs == grid_crs else cache_4326
+    if not os.path.exists(cache_file) or os.path.getmtime(cache_file) < os.path.getmtime(shapefile_path):
+        gdf = build_province_cache(shapefile_path, cache_folder, grid_crs)
+        return gdf if crs == "EPSG:4326" else gdf.to_crs(crs)
+    return gpd.read_parquet(cache_file).to_crs(crs)
+
+def read_province(shapefile_path, province_name, bbox=None):
+    """
+    Reads only the features of one province from the national shapefile.
+
+    The name filter and optional bounding box are passed to the reader, so
+    features of other provinces are never decoded.
+
+    Parameters:
+    - shapefile_path (str): Path to the national shapefile.
+    - province_name (str): Case-insensitive part of the province name.
+    - bbox (tuple): Optional (minx, miny, maxx, maxy) in the shapefile CRS.
+
+    Returns:
+    - GeoDataFrame: Matching features in the shapefile CRS.
+    """
+    return gpd.read_file(shapefile_path, where=f"PRNAME ILIKE '%{_like_pattern(province_name)}%' ESCAPE '\\'",
+                         bbox=bbox)
+
+def _like_pattern(text):
+    """Escapes the LIKE wildcards and quotes of text for an OGR SQL ILIKE ... ESCAPE '\\' filter."""
+    for character in ("\\", "%", "_"):
+        text = text.replace(character, "\\" + character)
+    return text.replace("'", "''")
+
+def load_province_boundary(shapefile_path, province_name, cache_folder):
+    """
+    Loads one province boundary from the cache, reading only its features from
+    the national shapefile on first use or when the shapefile is newer than
+    the cached entry.
+
+    Parameters:
+    - shapefile_path (str): Path to the national shapefile.
+    - province_name (str): Case-insensitive part of the province name.
+    - cache_folder (str): Folder holding the cached boundaries.
+
+    Returns:
+    - GeoDataFrame: Matching features in EPSG:4326 (empty if none match).
+    """
+    cache_file = os.path.join(cache_folder, f"{province_name.replace(' ', '_').lower()}_epsg_4326.parquet")
+    if os.path.exists(cache_file) and os.path.getmtime(cache_file) >= os.path.getmtime(shapefile_path):
+        return gpd.read_parquet(cache_file)
+
+    gdf = read_province(shapefile_path, province_name).to_crs("EPSG:4326")
+    if not gdf.empty:
+        print(f"Caching {province_name} boundary in {cache_folder}...")
+        os.makedirs(cache_folder, exist_ok=True)
+        gdf.to_parquet(cache_file)
+    return gdf
+
+def _save_province(filtered_gdf, province_name, province_output_folder):
+    """Saves one province boundary in EPSG:4326 and returns its path."""
+    os.makedirs(province_output_folder, exist_ok=True)
+    output_file = os.path.join(province_output_folder, f"{province_name.replace(' ', '_').lower()}_boundary.shp")
+    print(f"Saving filtered shapefile to {output_file}...")
+    filtered_gdf.to_file(output_file)
+    return output_file
+
+def extract_province_shapefile(province_name, shapefile_folder="shapefiles/lpr_000a21a_e", parent_output_folder="shapefiles",
+                               use_cache=True, bbox=None):
     """
     Extracts the shapefile for a given province and saves it to a dedicated folder within the parent output folder.
 
@@ -9,6 +124,11 @@ def extract_province_shapefile(province_name, shapefile_folder="shapefiles/lpr_0
     - province_name (str): The name of the province to extract (e.g., "British Columbia").
     - shapefile_folder (str): The folder containing the source shapefile.
     - parent_output_folder (str): The parent folder where province-specific folders will be created.
+    - use_cache (bool): Serve the boundary from the province's cache entry,
+      built on first use from a read of only its features. When False, the
+      matching feature is read from the national shapefile on every call.
+    - bbox (tuple): Optional (minx, miny, maxx, maxy) in the national
+      shapefile CRS, passed to the reader when use_cache is False.
 
     Returns:
     - str: The path to the saved shapefile or an error message if the province is not found.
@@ -17,17 +137,14 @@ def extract_province_shapefile(province_name, shapefile_folder="shapefiles/lpr_0
     script_dir = os.path.dirname(os.path.abspath(__file__))
     shapefile_path = os.path.join(script_dir, shapefile_folder, "lpr_000a21a_e.shp")
     province_output_folder = os.path.join(script_dir, parent_output_folder, f"{province_name.replace(' ', '_')}_shapefile")
-  
-    # Ensure province-specific output directory exists
-    os.makedirs(province_output_folder, exist_ok=True)
-
-    # Load the shapefile
-    print(f"Loading shapefile from {shapefile_path}...")
-    gdf = gpd.read_file(shapefile_path)
+    cache_folder = os.path.join(script_dir, parent_output_folder, PROVINCE_CACHE_FOLDER)
 
     # Filter province by user input
     print(f"Filtering for province: {province_name}...")
-    filtered_gdf = gdf[gdf["PRNAME"].str.contains(province_name, case=False, na=False)]
+    if use_cache:
+        filtered_gdf = load_province_boundary(shapefile_path, province_name, cache_folder)
+    else:
+        filtered_gdf = read_province(shapefile_path, province_name, bbox=bbox)
 
     if filtered_gdf.empty:
         return f"Error: Province '{province_name}' not found in the shapefile."
@@ -36,18 +153,41 @@ def extract_province_shapefile(province_name, shapefile_folder="shapefiles/lpr_0
     print("Reprojecting to EPSG:4326...")
     filtered_gdf = filtered_gdf.to_crs("EPSG:4326")
 
-    # Save the filtered shapefile
-    output_file = os.path.join(province_output_folder, f"{province_name.replace(' ', '_').lower()}_boundary.shp")
-    print(f"Saving filtered shapefile to {output_file}...")
-    filtered_gdf.to_file(output_file)
+    return _save_province(filtered_gdf, province_name, province_output_folder)
 
-    return output_file
+def extract_all_provinces(province_names, shapefile_folder="shapefiles/lpr_000a21a_e", parent_output_folder="shapefiles"):
+    """
+    Extracts several provinces with a single pass over the national shapefile.
+
+    Parameters:
+    - province_names (list): Province names (e.g., the entries of province_list.txt).
+    - shapefile_folder (str): The folder containing the source shapefile.
+    - parent_output_folder (str): The parent folder where province-specific folders will be created.
+
+    Returns:
+    - dict: Province name -> saved shapefile path or error message.
+    """
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    shapefile_path = os.path.join(script_dir, shapefile_folder, "lpr_000a21a_e.shp")
+    cache_folder = os.path.join(script_dir, parent_output_folder, PROVINCE_CACHE_FOLDER)
+    gdf = load_province_boundaries(shapefile_path, cache_folder)
+
+    results = {}
+    for province_name in province_names:
+        print(f"Filtering for province: {province_name}...")
+        filtered_gdf = gdf[gdf["PRNAME"].str.contains(province_name, case=False, na=False, regex=False)]
+        if filtered_gdf.empty:
+            results[province_name] = f"Error: Province '{province_name}' not found in the shapefile."
+            continue
+        province_output_folder = os.path.join(script_dir, parent_output_folder, f"{province_name.replace(' ', '_')}_shapefile")
+        results[province_name] = _save_province(filtered_gdf, province_name, province_output_folder)
+    return results
 
 # Example Usage
 if __name__ == "__main__":
     # User inputs province name
     user_input = input("Enter the name of the province/territory (e.g., 'British Columbia'): ").strip()
-    
+
     # Call the function
     result = extract_province_shapefile(user_input)
     print(result)
@@ -0,0 +1,76 @@
+import os
+import numpy as np
+import rasterio
+import rasterio.shutil
+from rasterio.enums import Resampling
+from rasterio.warp import transform_bounds
+from rasterio.windows import Window, from_bounds
+
+COG_BLOCK_SIZE = 512
+PREVIEW_SIZE = 1024
+
+def write_cog(src_file, cog_file, overview_resampling="average"):
+    """
+    Copies a raster to a Cloud Optimized GeoTIFF with internal overviews.
+
+    The COG is tiled (COG_BLOCK_SIZE pixels), deflate-compressed with the
+    predictor suited to its data type, and carries overviews down to a
+    single tile, so windowed reads and coarse previews only touch the
+    tiles they need. GDAL streams the copy, so the raster is never held in
+    memory. The COG is written to a temporary file and moved into place.
+
+    Parameters:
+    - src_file (str): Source raster (GeoTIFF or VRT).
+    - cog_file (str): Path of the COG.
+    - overview_resampling (str): Resampling of the overviews, e.g. "average"
+      for continuous values, "nearest" for categories or angles.
+
+    Returns:
+    - str: cog_file.
+    """
+    tmp_file = f"{cog_file}.part"
+    rasterio.shutil.copy(src_file, tmp_file, driver="COG", compress="DEFLATE", predictor="YES",
+                         blocksize=COG_BLOCK_SIZE, overview_resampling=overview_resampling.upper(),
+                         BIGTIFF="IF_SAFER")
+    os.replace(tmp_file, cog_file)
+    return cog_file
+
+def read_raster(raster_file, bounds=None, bounds_crs=None, max_size=None, resampling="nearest"):
+    """
+    Reads band 1 of a raster, optionally only a window and/or at reduced resolution.
+
+    With `bounds` only the tiles inside the box are read (e.g. one province
+    of a country-wide raster). With `max_size` the read is decimated so that
+    neither side exceeds max_size pixels, and GDAL serves it from the
+    closest internal overview instead of the full-resolution data.
+
+    Parameters:
+    - raster_file (str): Raster path.
+    - bounds (tuple): Optional (minx, miny, maxx, maxy) to read.
+    - bounds_crs (str): CRS of `bounds`; defaults to the raster's CRS.
+    - max_size (int): Optional maximum width/height of the result in pixels.
+    - resampling (str): Resampling used when decimating.
+
+    Returns:
+    - tuple: (float64 array with nodata as NaN, affine transform of the array).
+    """
+    with rasterio.open(raster_file) as src:
+        window = None
+        if bounds is not None:
+            if bounds_crs is not None:
+                bounds = transform_bounds(bounds_crs, src.crs, *bounds)
+            window = from_bounds(*bounds, transform=src.transform).round_offsets().round_lengths()
+            window = window.intersection(Window(0, 0, src.width, src.height))
+        height, width = (window.height, window.width) if window is not None else (src.height, src.width)
+
+        out_shape = None
+        if max_size is not None and max(height, width) > max_size:
+            scale = max_size / max(height, width)
+            out_shape = (max(1, round(height * scale)), max(1, round(width * scale)))
+        values = src.read(1, window=window, out_shape=out_shape, masked=True,
+                          resampling=Resampling[resampling]).astype(np.float64).filled(np.nan)
+
+        transform = src.window_transform(window) if window is not None else src.transform
+        if out_shape is not None:
+            transform = transform * transform.scale(width / out_shape[1], height / out_shape[0])
+    return values, transform
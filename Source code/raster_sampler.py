@@ -0,0 +1,147 @@
+import numpy as np
+import pandas as pd
+import rasterio
+from collections import OrderedDict
+from pathlib import Path
+from pyproj import Transformer
+from rasterio.windows import Window
+
+SAMPLE_METHODS = ("nearest", "bilinear")
+BLOCK_SIZE = 512
+CACHE_BLOCKS = 64
+
+class RasterSampler:
+    """
+    Samples several rasters at many points in one vectorized pass.
+
+    Each raster is opened once, with its inverse transform and a transformer
+    from the points' CRS computed up front. Points are converted to pixel
+    coordinates all at once and grouped by the block of BLOCK_SIZE x
+    BLOCK_SIZE pixels they fall in, so only the blocks that contain points
+    are read. Blocks are kept in an LRU cache of at most `cache_blocks`
+    blocks shared by all rasters, which bounds memory whatever the raster
+    size. Nodata pixels and points outside a raster sample as NaN.
+    """
+
+    def __init__(self, rasters, block_size=BLOCK_SIZE, cache_blocks=CACHE_BLOCKS, points_crs="EPSG:4326"):
+        """
+        Parameters:
+        - rasters (dict): Column name -> raster path (a list of paths uses the file stems).
+        - block_size (int): Edge in pixels of the blocks that are read and cached.
+        - cache_blocks (int): Maximum number of blocks kept in memory.
+        - points_crs (str): CRS of the points passed to `sample`.
+        """
+        if not isinstance(rasters, dict):
+            rasters = {Path(path).stem: path for path in rasters}
+        self.block_size = block_size
+        self.cache_blocks = cache_blocks
+        self.sources = {name: rasterio.open(path) for name, path in rasters.items()}
+        self._inverse = {name: ~src.transform for name, src in self.sources.items()}
+        self._transformers = {name: Transformer.from_crs(points_crs, src.crs, always_xy=True)
+                              for name, src in self.sources.items()}
+        self._cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        for src in self.sources.values():
+            src.close()
+        self._cache.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _block(self, name, block_row, block_col):
+        """One block of a raster as float64 with nodata as NaN, through the LRU cache."""
+        key = (name, block_row, block_col)
+        if key in self._cache:
+            self.hits += 1
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        self.misses += 1
+        src = self.sources[name]
+        row_off, col_off = block_row * self.block_size, block_col * self.block_size
+        window = Window(col_off, row_off, min(self.block_size, src.width - col_off),
+                        min(self.block_size, src.height - row_off))
+        values = src.read(1, window=window).astype(np.float64)
+        if src.nodata is not None:
+            values[values == src.nodata] = np.nan
+        self._cache[key] = values
+        if len(self._cache) > self.cache_blocks:
+            self._cache.popitem(last=False)
+        return values
+
+    def _gather(self, name, rows, cols):
+        """Pixel values at integer (rows, cols) inside the raster, reading block by block."""
+        values = np.empty(len(rows))
+        block_rows, block_cols = rows // self.block_size, cols // self.block_size
+        n_block_cols = -(-self.sources[name].width // self.block_size)
+        blocks, inverse = np.unique(block_rows * n_block_cols + block_cols, return_inverse=True)
+        order = np.argsort(inverse, kind="stable")
+        bounds = np.searchsorted(inverse[order], np.arange(len(blocks) + 1))
+        for i, block in enumerate(blocks):
+            members = order[bounds[i]:bounds[i + 1]]
+            block_row, block_col = divmod(int(block), n_block_cols)
+            data = self._block(name, block_row, block_col)
+            values[members] = data[rows[members] - block_row * self.block_size,
+                                   cols[members] - block_col * self.block_size]
+        return values
+
+    def _sample_raster(self, name, x, y, method):
+        src = self.sources[name]
+        inverse = self._inverse[name]
+        x, y = self._transformers[name].transform(x, y)
+        col = inverse.a * x + inverse.b * y + inverse.c
+        row = inverse.d * x + inverse.e * y + inverse.f
+        inside = (col >= 0) & (col < src.width) & (row >= 0) & (row < src.height)
+        result = np.full(len(col), np.nan)
+        col, row = col[inside], row[inside]
+
+        if method == "nearest":
+            result[inside] = self._gather(name, row.astype(np.int64), col.astype(np.int64))
+            return result
+
+        # Bilinear between the four surrounding pixel centres; at the raster's
+        # edges the outermost pixels are repeated, and nodata neighbours are
+        # dropped with the remaining weights renormalized
+        row0, col0 = np.floor(row - 0.5), np.floor(col - 0.5)
+        dr, dc = row - 0.5 - row0, col - 0.5 - col0
+        total = np.zeros(len(row))
+        weight_sum = np.zeros(len(row))
+        for r_step, c_step, weight in ((0, 0, (1 - dr) * (1 - dc)), (0, 1, (1 - dr) * dc),
+                                       (1, 0, dr * (1 - dc)), (1, 1, dr * dc)):
+            rows = np.clip(row0 + r_step, 0, src.height - 1).astype(np.int64)
+            cols = np.clip(col0 + c_step, 0, src.width - 1).astype(np.int64)
+            values = self._gather(name, rows, cols)
+            valid = ~np.isnan(values) & (weight > 0)
+            total[valid] += weight[valid] * values[valid]
+            weight_sum[valid] += weight[valid]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            result[inside] = np.where(weight_sum > 0, total / weight_sum, np.nan)
+        return result
+
+    def sample(self, x, y, method="nearest"):
+        """
+        Samples every raster at the given points.
+
+        Parameters:
+        - x, y (array-like): Point coordinates in `points_crs` (longitude, latitude by default).
+        - method (str or dict): "nearest" or "bilinear", or column name -> method
+          (e.g. nearest for categorical rasters such as land cover, bilinear for NDVI).
+
+        Returns:
+        - DataFrame: One float64 column per raster, one row per point.
+        """
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        methods = method if isinstance(method, dict) else {name: method for name in self.sources}
+        columns = {}
+        for name in self.sources:
+            if methods.get(name, "nearest") not in SAMPLE_METHODS:
+                raise ValueError(f"Unknown sampling method: {methods[name]}")
+            columns[name] = self._sample_raster(name, x, y, methods.get(name, "nearest"))
+        return pd.DataFrame(columns)
@@ -0,0 +1,138 @@
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from gap_filling import to_dense, fill_gaps, daily_rows
+
+# Column -> (reduction, window in days) pairs computed by default
+DEFAULT_WINDOWS = {
+    "total_precipitation": [("sum", 3), ("sum", 7), ("sum", 14), ("sum", 30)],
+    "avg_temperature": [("mean", 7), ("max", 7), ("max", 30)],
+    "avg_humidity": [("mean", 7), ("min", 7)],
+}
+
+def rolling_window(values, window, how="sum"):
+    """
+    Trailing window reduction along the day axis for every cell at once.
+
+    Sums and means come from one cumulative sum (a window is the difference
+    of two running totals); maxima and minima reduce a strided window view
+    without copying the data. As in pandas' `rolling(window)`, a window that
+    is incomplete or contains a missing day is NaN.
+
+    Parameters:
+    - values (np.ndarray): (n_cells, n_days) array.
+    - window (int): Window length in days, including the current day.
+    - how (str): "sum", "mean", "max" or "min".
+
+    Returns:
+    - np.ndarray: (n_cells, n_days) window values.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n_cells, n_days = values.shape
+    result = np.full((n_cells, n_days), np.nan)
+    if window > n_days:
+        return result
+
+    if how in ("sum", "mean"):
+        missing = np.isnan(values)
+        totals = np.zeros((n_cells, n_days + 1))
+        np.cumsum(np.where(missing, 0, values), axis=1, out=totals[:, 1:])
+        gaps = np.zeros((n_cells, n_days + 1), dtype=np.int32)
+        np.cumsum(missing, axis=1, out=gaps[:, 1:])
+        window_total = totals[:, window:] - totals[:, :-window]
+        window_gaps = gaps[:, window:] - gaps[:, :-window]
+        if how == "mean":
+            window_total /= window
+        result[:, window - 1:] = np.where(window_gaps > 0, np.nan, window_total)
+    elif how in ("max", "min"):
+        view = sliding_window_view(values, window, axis=1)
+        result[:, window - 1:] = view.max(axis=-1) if how == "max" else view.min(axis=-1)
+    else:
+        raise ValueError(f"Unknown window reduction: {how}")
+    return result
+
+def streak_length(condition):
+    """
+    Number of consecutive days, up to and including each day, on which a
+    condition held.
+
+    Parameters:
+    - condition (np.ndarray): (n_cells, n_days) boolean array.
+
+    Returns:
+    - np.ndarray: (n_cells, n_days) int streak lengths (0 where the condition is False).
+    """
+    day = np.arange(condition.shape[1])
+    last_break = np.maximum.accumulate(np.where(condition, -1, day), axis=1)
+    return day - last_break
+
+def days_since(condition):
+    """
+    Days since the condition last held (0 on days it holds).
+
+    Parameters:
+    - condition (np.ndarray): (n_cells, n_days) boolean array.
+
+    Returns:
+    - np.ndarray: (n_cells, n_days) float days, NaN before the first day it held.
+    """
+    day = np.arange(condition.shape[1])
+    last_hit = np.maximum.accumulate(np.where(condition, day, -1), axis=1)
+    return np.where(last_hit >= 0, day - last_hit, np.nan)
+
+def add_rolling_features(climate_csv, output_csv, windows=None, rain_threshold=0.001, hot_threshold=20.0,
+                         fill_limit=0):
+    """
+    Adds rolling-window and lagged climate features to the processed climate data.
+
+    Each variable is reshaped once into a dense (grid cell x day) matrix,
+    every window is computed on that matrix, and the results are joined back
+    to the rows as extra columns keyed by (grid_id, time). Sub-daily input
+    (one row per ERA5 step, from `process_climate_csv`) is first reduced to
+    one row per cell and day, with precipitation summed and the other
+    columns averaged over the day.
+
+    Parameters:
+    - climate_csv (str): Processed climate CSV (see `process_climate_csv`).
+    - output_csv (str): Path to save the rows with the feature columns.
+    - windows (dict): Column -> list of (reduction, days) pairs; reductions
+      are "sum", "mean", "max" or "min". Defaults to DEFAULT_WINDOWS.
+      Columns are named "{column}_{reduction}_{days}d".
+    - rain_threshold (float): Daily total_precipitation counted as rain
+      (0.001 = 1 mm, as ERA5 precipitation is in metres).
+    - hot_threshold (float): Daily mean temperature (deg C) counted as hot.
+    - fill_limit (int): Gaps of up to this many days are interpolated before
+      the windows are computed (see `gap_filling.fill_gaps`); 0 keeps them missing.
+
+    Returns:
+    - DataFrame: The daily climate rows with the feature columns.
+    """
+    windows = DEFAULT_WINDOWS if windows is None else windows
+
+    print(f"Loading climate data from {climate_csv}...")
+    climate_df = daily_rows(pd.read_csv(climate_csv, parse_dates=["time"]), sum_columns=["total_precipitation"])
+    columns = sorted(set(windows) | {"total_precipitation", "avg_temperature"})
+    cell_ids, days, arrays = to_dense(climate_df, columns)
+    if fill_limit:
+        arrays = {name: fill_gaps(values, method="linear", limit=fill_limit) for name, values in arrays.items()}
+
+    # Position of each row in the dense matrices
+    rows = np.searchsorted(cell_ids, climate_df["grid_id"].to_numpy())
+    cols = days.get_indexer(climate_df["time"].dt.floor("D"))
+
+    print(f"Computing rolling features for {len(cell_ids)} cells x {len(days)} days...")
+    features = {}
+    for column, reductions in windows.items():
+        for how, window in reductions:
+            features[f"{column}_{how}_{window}d"] = rolling_window(arrays[column], window, how)[rows, cols]
+
+    with np.errstate(invalid="ignore"):
+        rain = arrays["total_precipitation"] >= rain_threshold
+        hot = arrays["avg_temperature"] >= hot_threshold
+    features["days_since_rain"] = days_since(rain)[rows, cols]
+    features["hot_streak_days"] = streak_length(hot)[rows, cols]
+
+    feature_df = pd.concat([climate_df, pd.DataFrame(features, index=climate_df.index)], axis=1)
+    print(f"Saving climate data with rolling features to {output_csv}...")
+    feature_df.to_csv(output_csv, index=False)
+    return feature_df
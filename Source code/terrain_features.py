@@ -0,0 +1,209 @@
+import os
+import numpy as np
+import pandas as pd
+import rasterio
+from concurrent.futures import ProcessPoolExecutor
+from rasterio.windows import Window
+from grid_cache import load_grid
+from process_dem_data import dem_blocks, map_blocks, read_halo_block, _terrain_profile, _to_float32, BLOCK_SIZE
+from raster_io import write_cog
+from zonal_stats import grid_label_raster, zonal_statistics
+
+TERRAIN_BANDS = ("slope", "aspect", "tpi", "tri", "roughness", "profile_curvature", "plan_curvature",
+                 "solar_exposure")
+# Bands with percentile columns in the grid summaries; each one costs a
+# grid cells x zonal_stats.HISTOGRAM_BINS histogram
+PERCENTILE_BANDS = ("slope", "tpi")
+# Sun positions averaged into the solar exposure (azimuth, altitude in degrees)
+SUN_POSITIONS = ((90, 30), (135, 45), (180, 55), (225, 45), (270, 30))
+EARTH_RADIUS = 6371008.8
+
+def terrain_band(terrain_file, name):
+    """
+    One band of a terrain raster as a (path, band) source for `zonal_stats.zonal_statistics`.
+
+    Parameters:
+    - terrain_file (str): Multi-band raster from `compute_terrain_features`.
+    - name (str): Band name from TERRAIN_BANDS (e.g. "slope").
+
+    Returns:
+    - tuple: (terrain_file, 1-based band number).
+    """
+    return terrain_file, TERRAIN_BANDS.index(name) + 1
+
+def _pixel_size(src, rows):
+    """
+    Pixel width (per row) and height in metres.
+
+    For a geographic DEM the width of a degree shrinks with the cosine of
+    the latitude, so it is computed for each row's centre latitude.
+    """
+    res_x, res_y = src.transform[0], -src.transform[4]
+    if not src.crs.is_geographic:
+        return np.full((len(rows), 1), res_x), res_y
+    latitude = src.transform[5] + (rows + 0.5) * src.transform[4]
+    metres_per_degree = np.pi / 180 * EARTH_RADIUS
+    return (res_x * metres_per_degree * np.cos(np.deg2rad(latitude)))[:, None], res_y * metres_per_degree
+
+def _window_sum(z, weights_rows, weights_cols):
+    """Separable 3x3 filter of a padded array: a 3-tap pass along rows, then along columns."""
+    rows = weights_rows[0] * z[:-2] + weights_rows[1] * z[1:-1] + weights_rows[2] * z[2:]
+    return weights_cols[0] * rows[:, :-2] + weights_cols[1] * rows[:, 1:-1] + weights_cols[2] * rows[:, 2:]
+
+def _window_extreme(z, reduce):
+    """Separable 3x3 max or min filter of a padded array."""
+    rows = reduce(reduce(z[:-2], z[1:-1]), z[2:])
+    return reduce(reduce(rows[:, :-2], rows[:, 1:-1]), rows[:, 2:])
+
+def terrain_kernel(z, dx, dy, sun_positions=SUN_POSITIONS):
+    """
+    All terrain features of a padded elevation block in one pass.
+
+    Every feature is built from a few separable 3x3 filters (3-tap passes
+    along rows and columns over shifted views), so there is no per-pixel
+    Python and the block is read once for all of them. Pixels next to
+    missing elevation are missing.
+
+    Parameters:
+    - z (np.ndarray): (h + 2, w + 2) float64 elevation (m) with a 1-pixel border.
+    - dx (np.ndarray): (h, 1) pixel width in metres.
+    - dy (float): Pixel height in metres.
+    - sun_positions (tuple): (azimuth, altitude) pairs averaged into the solar exposure.
+
+    Returns:
+    - dict: Band name -> (h, w) array:
+      slope and aspect (degrees, Horn's method; aspect is the downslope
+      direction clockwise from north, NaN on flat ground); tpi (elevation
+      minus the mean of the 8 neighbours, m); tri (Riley's terrain
+      ruggedness index, m); roughness (max - min of the 3x3 window, m);
+      profile_curvature and plan_curvature (Zevenbergen-Thorne, 1/m, positive
+      for convex profiles and diverging contours); solar_exposure (mean
+      hillshade, 0-1, over the sun positions).
+    """
+    centre = z[1:-1, 1:-1]
+    smooth, diff, ones = (1, 2, 1), (-1, 0, 1), (1, 1, 1)
+
+    # Horn's gradients: central differences smoothed across the other axis
+    dz_east = _window_sum(z, smooth, diff) / (8 * dx)
+    dz_north = -_window_sum(z, diff, smooth) / (8 * dy)
+    gradient = np.hypot(dz_east, dz_north)
+    slope_rad = np.arctan(gradient)
+    aspect_rad = np.arctan2(-dz_east, -dz_north) % (2 * np.pi)
+    aspect = np.where(gradient > 0, np.rad2deg(aspect_rad), np.nan)
+
+    neighbour_sum = _window_sum(z, ones, ones) - centre
+    neighbour_squares = _window_sum(z ** 2, ones, ones) - centre ** 2
+    tpi = centre - neighbour_sum / 8
+    tri = np.sqrt(np.maximum(neighbour_squares - 2 * centre * neighbour_sum + 8 * centre ** 2, 0))
+    roughness = _window_extreme(z, np.maximum) - _window_extreme(z, np.minimum)
+
+    # Zevenbergen-Thorne coefficients of the quadratic surface through the
+    # window; both curvatures are signed so that a convex hill is positive
+    d = ((z[1:-1, :-2] + z[1:-1, 2:]) / 2 - centre) / dx ** 2
+    e = ((z[:-2, 1:-1] + z[2:, 1:-1]) / 2 - centre) / dy ** 2
+    f = (-z[:-2, :-2] + z[:-2, 2:] + z[2:, :-2] - z[2:, 2:]) / (4 * dx * dy)
+    g = (z[1:-1, 2:] - z[1:-1, :-2]) / (2 * dx)
+    h = (z[:-2, 1:-1] - z[2:, 1:-1]) / (2 * dy)
+    g2h2 = g ** 2 + h ** 2
+    with np.errstate(invalid="ignore", divide="ignore"):
+        profile_curvature = np.where(g2h2 > 0, -2 * (d * g ** 2 + e * h ** 2 + f * g * h) / g2h2, 0)
+        plan_curvature = np.where(g2h2 > 0, -2 * (d * h ** 2 + e * g ** 2 - f * g * h) / g2h2, 0)
+
+    exposure = np.zeros_like(centre)
+    for azimuth, altitude in sun_positions:
+        zenith = np.deg2rad(90 - altitude)
+        exposure += np.maximum(np.cos(zenith) * np.cos(slope_rad) +
+                               np.sin(zenith) * np.sin(slope_rad) * np.cos(np.deg2rad(azimuth) - aspect_rad), 0)
+    exposure /= len(sun_positions)
+
+    missing = np.isnan(roughness)
+    features = {"slope": np.rad2deg(slope_rad), "aspect": aspect, "tpi": tpi, "tri": tri, "roughness": roughness,
+                "profile_curvature": profile_curvature, "plan_curvature": plan_curvature,
+                "solar_exposure": exposure}
+    for values in features.values():
+        values[missing] = np.nan
+    return features
+
+def _terrain_block(dem_file, block, sun_positions):
+    """Terrain features of one block, read with a 1-pixel halo (edge pixels repeated on the raster's edges)."""
+    col_off, row_off, width, height = block
+    with rasterio.open(dem_file) as src:
+        elevation, (rows, cols) = read_halo_block(src, block)
+        dx, dy = _pixel_size(src, np.arange(row_off, row_off + height))
+
+    pad = ((1 - rows.start, 1 - (elevation.shape[0] - rows.stop)), (1 - cols.start, 1 - (elevation.shape[1] - cols.stop)))
+    z = np.pad(elevation, pad, mode="edge")
+    features = terrain_kernel(z, dx, dy, sun_positions)
+    return block, [_to_float32(features[band]) for band in TERRAIN_BANDS]
+
+def compute_terrain_features(dem_file, output_file, block_size=BLOCK_SIZE, max_workers=None,
+                             sun_positions=SUN_POSITIONS, max_blocks_in_flight=None):
+    """
+    Computes every terrain feature from one block-wise pass over the DEM.
+
+    Each block is read once with a 1-pixel halo (see
+    `process_dem_data.read_halo_block`), all features are computed from it
+    in a worker process, and the blocks are written into one multi-band
+    Cloud Optimized GeoTIFF with a band per TERRAIN_BANDS entry (band
+    descriptions hold the names). Pixel spacing is converted to metres for
+    geographic DEMs, so slopes and curvatures are in true units.
+
+    Parameters:
+    - dem_file (str): Path to the DEM raster.
+    - output_file (str): Path to save the multi-band terrain raster.
+    - block_size (int): Block edge in pixels (a multiple of 16).
+    - max_workers (int): Worker processes (defaults to the number of CPUs).
+    - sun_positions (tuple): (azimuth, altitude) pairs for the solar exposure.
+    - max_blocks_in_flight (int): Upper bound on blocks submitted but not yet
+      written. Defaults to twice max_workers.
+    """
+    with rasterio.open(dem_file) as src:
+        profile = _terrain_profile(src.profile)
+        blocks = dem_blocks(src.width, src.height, block_size)
+    profile.update(count=len(TERRAIN_BANDS), interleave="band")
+    max_workers = max_workers or os.cpu_count()
+    max_blocks_in_flight = max_blocks_in_flight or 2 * max_workers
+    print(f"Calculating {len(TERRAIN_BANDS)} terrain features in {len(blocks)} blocks on {max_workers} processes...")
+
+    tmp_file = f"{output_file}.tmp.tif"
+    with rasterio.open(tmp_file, "w", **profile) as dst:
+        for band, name in enumerate(TERRAIN_BANDS, start=1):
+            dst.set_band_description(band, name)
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            results = map_blocks(pool, _terrain_block, dem_file, blocks, sun_positions,
+                                 max_in_flight=max_blocks_in_flight)
+            for (col_off, row_off, width, height), bands in results:
+                dst.write(np.stack(bands), window=Window(col_off, row_off, width, height))
+
+    # One resampling applies to every band; nearest keeps aspect overviews valid
+    write_cog(tmp_file, output_file, overview_resampling="nearest")
+    os.remove(tmp_file)
+    print(f"Terrain features saved to '{output_file}'.")
+
+def summarize_terrain(grid, terrain_file, output_csv, label_file=None, block_size=BLOCK_SIZE,
+                      percentile_bands=PERCENTILE_BANDS):
+    """
+    Zonal summaries of every terrain band per grid cell.
+
+    Parameters:
+    - grid (CachedGrid or str): Loaded grid, or path to a grid file.
+    - terrain_file (str): Multi-band raster from `compute_terrain_features`.
+    - output_csv (str): Path to save one row per grid_id.
+    - label_file (str): Optional grid label raster aligned to the terrain raster
+      (see `zonal_stats.grid_label_raster`).
+    - block_size (int): Block edge in pixels.
+    - percentile_bands (tuple): Bands that also get percentile columns.
+
+    Returns:
+    - DataFrame: grid_id with "{band}", "{band}_std", "{band}_min" and "{band}_max",
+      percentile columns of percentile_bands, and the circular mean of aspect.
+    """
+    grid = load_grid(grid)
+    label_file = grid_label_raster(grid, terrain_file, label_file, block_size=block_size)
+    rasters = {name: (terrain_file, band) for band, name in enumerate(TERRAIN_BANDS, start=1)}
+    stats = zonal_statistics(label_file, rasters, len(grid.gdf), circular=("aspect",),
+                             percentile_rasters=percentile_bands, block_size=block_size)
+    summary = pd.concat([grid.gdf[["grid_id"]].reset_index(drop=True), stats], axis=1)
+    summary.to_csv(output_csv, index=False)
+    print(f"Terrain summaries saved to '{output_csv}'.")
+    return summary
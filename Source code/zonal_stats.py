@@ -0,0 +1,272 @@
+import hashlib
+import numpy as np
+import pandas as pd
+import rasterio
+import shapely
+from pathlib import Path
+from rasterio.features import rasterize
+from rasterio.windows import Window, bounds as window_bounds, transform as window_transform
+
+BLOCK_SIZE = 1024
+PERCENTILES = (10, 50, 90)
+# Bins of the per-zone histograms the percentiles are read from; each
+# zone's bins span its own min..max, so a percentile is within
+# (max - min) / HISTOGRAM_BINS of the exact value
+HISTOGRAM_BINS = 256
+NO_ZONE = -1
+
+def block_windows(width, height, block_size=BLOCK_SIZE):
+    """Windows tiling a width x height raster in blocks of block_size pixels."""
+    return [Window(col_off, row_off, min(block_size, width - col_off), min(block_size, height - row_off))
+            for row_off in range(0, height, block_size) for col_off in range(0, width, block_size)]
+
+def rasterize_zones(zones_gdf, reference_file, label_file, block_size=BLOCK_SIZE):
+    """
+    Burns zone polygons into a label raster aligned to a reference raster.
+
+    Each pixel holds the position (0..n-1) of the zone containing its centre
+    in `zones_gdf`, or NO_ZONE. The raster is written block by block, and
+    each block only rasterizes the zones that overlap it.
+
+    Parameters:
+    - zones_gdf (GeoDataFrame): Non-overlapping zone polygons (e.g. grid cells).
+    - reference_file (str): Raster whose grid the labels are aligned to.
+    - label_file (str): Path to save the int32 label raster.
+    - block_size (int): Block edge in pixels (a multiple of 16).
+
+    Returns:
+    - str: label_file.
+    """
+    with rasterio.open(reference_file) as src:
+        profile = src.profile
+        width, height, transform, crs = src.width, src.height, src.transform, src.crs
+    geometries = zones_gdf.to_crs(crs).geometry.values
+    tree = shapely.STRtree(geometries)
+
+    profile.update(driver="GTiff", count=1, dtype=rasterio.int32, nodata=NO_ZONE, tiled=True,
+                   blockxsize=min(block_size, 512), blockysize=min(block_size, 512),
+                   compress="deflate", BIGTIFF="IF_SAFER")
+    print(f"Rasterizing {len(geometries)} zones onto a {width} x {height} label raster...")
+    with rasterio.open(label_file, "w", **profile) as dst:
+        for window in block_windows(width, height, block_size):
+            hits = tree.query(shapely.box(*window_bounds(window, transform)))
+            labels = np.full((window.height, window.width), NO_ZONE, dtype=np.int32)
+            if len(hits):
+                rasterize(zip(geometries[hits], hits.astype(np.int32)), out=labels,
+                          transform=window_transform(window, transform))
+            dst.write(labels, 1, window=window)
+    return label_file
+
+def _label_key(grid, reference):
+    """
+    Hash of a grid and of the pixel grid of an open reference raster.
+
+    Grids loaded from a cache entry are identified by their cache key, other
+    grids by their grid ids and geometries.
+    """
+    digest = hashlib.sha256()
+    if grid.key:
+        digest.update(grid.key.encode())
+    else:
+        digest.update(np.ascontiguousarray(grid.gdf["grid_id"].to_numpy(dtype=np.int64)).tobytes())
+        digest.update(b"".join(shapely.to_wkb(grid.gdf.geometry.values, byte_order=1)))
+        digest.update(str(grid.gdf.crs).encode())
+    digest.update(f"|{reference.width}|{reference.height}|{tuple(reference.transform)}|{reference.crs}".encode())
+    return digest.hexdigest()[:16]
+
+def grid_label_raster(grid, reference_file, label_file=None, block_size=BLOCK_SIZE):
+    """
+    Label raster of a grid aligned to a reference raster, built once and reused.
+
+    The default file name carries a hash of the grid and of the reference
+    raster's size, transform and CRS, so another grid or a re-fetched DEM
+    on a different pixel grid gets its own label raster. An existing
+    label_file that is not aligned to the reference is rebuilt.
+
+    Parameters:
+    - grid (CachedGrid): Loaded grid.
+    - reference_file (str): Raster the labels are aligned to (e.g. the DEM).
+    - label_file (str): Path of the label raster; defaults to
+      "grid_labels_{hash}.tif" next to the reference raster.
+    - block_size (int): Block edge in pixels.
+
+    Returns:
+    - str: Path of the label raster.
+    """
+    with rasterio.open(reference_file) as reference:
+        pixel_grid = (reference.width, reference.height, reference.transform, reference.crs)
+        label_file = label_file or str(Path(reference_file).with_name(f"grid_labels_{_label_key(grid, reference)}.tif"))
+    if Path(label_file).exists():
+        with rasterio.open(label_file) as labels:
+            if (labels.width, labels.height, labels.transform, labels.crs) == pixel_grid:
+                return label_file
+        print(f"Label raster {label_file} is not aligned to {reference_file}; rebuilding it...")
+    rasterize_zones(grid.gdf, reference_file, label_file, block_size=block_size)
+    return label_file
+
+def _read_block(src, window, band=1):
+    """Block of a raster band as float64 with nodata as NaN."""
+    values = src.read(band, window=window).astype(np.float64)
+    if src.nodata is not None:
+        values[values == src.nodata] = np.nan
+    return values
+
+def _block_zones(labels_src, window):
+    """
+    Zones of one block: (mask of labelled pixels, zones present in the block,
+    index of each labelled pixel's zone within them), or None if there are none.
+    Per-block sums are taken over the present zones only.
+    """
+    labels = labels_src.read(1, window=window)
+    inside = labels != NO_ZONE
+    if not inside.any():
+        return None
+    present, local = np.unique(labels[inside], return_inverse=True)
+    return inside, present, local
+
+def _percentiles(histograms, counts, low, width, percentiles):
+    """Percentiles of each zone from its histogram, interpolating within the bin."""
+    cumulative = np.cumsum(histograms, axis=1)
+    result = {}
+    for q in percentiles:
+        target = q / 100 * counts
+        bin_index = np.argmax(cumulative >= target[:, None], axis=1)
+        rows = np.arange(len(counts))
+        before = np.where(bin_index > 0, cumulative[rows, bin_index - 1], 0)
+        in_bin = histograms[rows, bin_index]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            fraction = np.where(in_bin > 0, (target - before) / in_bin, 0)
+            result[q] = low + (bin_index + fraction) * width
+    return result
+
+def zonal_statistics(label_file, rasters, n_zones, circular=(), percentiles=PERCENTILES,
+                     percentile_rasters=None, bins=HISTOGRAM_BINS, block_size=BLOCK_SIZE):
+    """
+    Per-zone statistics of rasters aligned to a label raster.
+
+    Everything is accumulated block by block with np.bincount on the zone
+    labels, so no raster is ever read whole; each block only touches the
+    zones it contains. A first pass collects counts,
+    sums, minima and maxima; a second pass collects squared deviations from
+    the zone mean (for a numerically stable std) and a histogram per zone
+    for the percentiles. The histograms hold n_zones x bins int32 counts per
+    raster, so on large grids restrict the percentiles with percentile_rasters.
+
+    Parameters:
+    - label_file (str): Label raster from `rasterize_zones`.
+    - rasters (dict): Output name -> raster path, or (path, band) for bands
+      other than the first; all on the label raster's grid.
+    - n_zones (int): Number of zones.
+    - circular (tuple): Names of rasters holding angles in degrees (e.g.
+      aspect), summarized by their circular mean and mean resultant length
+      (1 when all angles agree, near 0 when they are spread out).
+    - percentiles (tuple): Percentiles of the other rasters.
+    - percentile_rasters (tuple): Names of the non-circular rasters to take
+      percentiles of (None for all of them).
+    - bins (int): Histogram bins per zone for the percentiles.
+    - block_size (int): Block edge in pixels.
+
+    Returns:
+    - DataFrame: One row per zone position with "pixel_count", and for each
+      raster "{name}" (mean), "{name}_std", "{name}_min", "{name}_max" and
+      "{name}_p{q}" (for percentile_rasters only), or "{name}" and
+      "{name}_resultant" for circular rasters.
+      Zones without valid pixels are NaN.
+    """
+    bands = {name: source if isinstance(source, tuple) else (source, 1) for name, source in rasters.items()}
+    sources = {name: rasterio.open(path) for name, (path, _) in bands.items()}
+    labels_src = rasterio.open(label_file)
+    try:
+        for name, src in sources.items():
+            if (src.width, src.height, src.transform) != (labels_src.width, labels_src.height, labels_src.transform):
+                raise ValueError(f"Raster '{name}' is not aligned to the label raster")
+        windows = block_windows(labels_src.width, labels_src.height, block_size)
+        linear = [name for name in rasters if name not in circular]
+        ranked = linear if percentile_rasters is None else [name for name in linear if name in percentile_rasters]
+
+        pixel_count = np.zeros(n_zones)
+        counts = {name: np.zeros(n_zones) for name in rasters}
+        sums = {name: np.zeros(n_zones) for name in linear}
+        minima = {name: np.full(n_zones, np.inf) for name in linear}
+        maxima = {name: np.full(n_zones, -np.inf) for name in linear}
+        sines = {name: np.zeros(n_zones) for name in circular}
+        cosines = {name: np.zeros(n_zones) for name in circular}
+
+        print(f"Zonal statistics, pass 1 of 2 ({len(windows)} blocks)...")
+        for window in windows:
+            block_zones = _block_zones(labels_src, window)
+            if block_zones is None:
+                continue
+            inside, present, local = block_zones
+            pixel_count[present] += np.bincount(local, minlength=len(present))
+            for name, src in sources.items():
+                values = _read_block(src, window, bands[name][1])[inside]
+                valid = ~np.isnan(values)
+                zone_local, values = local[valid], values[valid]
+                counts[name][present] += np.bincount(zone_local, minlength=len(present))
+                if name in circular:
+                    radians = np.deg2rad(values)
+                    sines[name][present] += np.bincount(zone_local, weights=np.sin(radians), minlength=len(present))
+                    cosines[name][present] += np.bincount(zone_local, weights=np.cos(radians), minlength=len(present))
+                else:
+                    zone = present[zone_local]
+                    sums[name][present] += np.bincount(zone_local, weights=values, minlength=len(present))
+                    np.minimum.at(minima[name], zone, values)
+                    np.maximum.at(maxima[name], zone, values)
+
+        result = pd.DataFrame({"pixel_count": pixel_count.astype(np.int64)})
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = {name: sums[name] / counts[name] for name in linear}
+        if not linear:
+            return _circular_columns(result, circular, sines, cosines, counts)
+
+        widths = {name: (maxima[name] - minima[name]) / bins for name in ranked}
+        squares = {name: np.zeros(n_zones) for name in linear}
+        histograms = {name: np.zeros((n_zones, bins), dtype=np.int32) for name in ranked}
+
+        print(f"Zonal statistics, pass 2 of 2 ({len(windows)} blocks)...")
+        for window in windows:
+            block_zones = _block_zones(labels_src, window)
+            if block_zones is None:
+                continue
+            inside, present, local = block_zones
+            for name in linear:
+                values = _read_block(sources[name], window, bands[name][1])[inside]
+                valid = ~np.isnan(values)
+                zone_local, values = local[valid], values[valid]
+                zone = present[zone_local]
+                squares[name][present] += np.bincount(zone_local, weights=(values - means[name][zone]) ** 2,
+                                                      minlength=len(present))
+                if name not in histograms:
+                    continue
+                width = widths[name][zone]
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    bin_index = np.where(width > 0, (values - minima[name][zone]) / width, 0)
+                bin_index = np.clip(bin_index.astype(np.int64), 0, bins - 1)
+                # Histograms of the zones in this block only, not of every zone
+                histograms[name][present] += np.bincount(zone_local * bins + bin_index,
+                                                         minlength=len(present) * bins).reshape(len(present), bins)
+    finally:
+        labels_src.close()
+        for src in sources.values():
+            src.close()
+
+    for name in linear:
+        empty = counts[name] == 0
+        result[name] = means[name]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            result[f"{name}_std"] = np.sqrt(squares[name] / counts[name])
+        result[f"{name}_min"] = np.where(empty, np.nan, minima[name])
+        result[f"{name}_max"] = np.where(empty, np.nan, maxima[name])
+        if name not in histograms:
+            continue
+        for q, value in _percentiles(histograms[name], counts[name], minima[name], widths[name], percentiles).items():
+            result[f"{name}_p{q}"] = np.where(empty, np.nan, np.clip(value, minima[name], maxima[name]))
+    return _circular_columns(result, circular, sines, cosines, counts)
+
+def _circular_columns(result, circular, sines, cosines, counts):
+    for name in circular:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            result[name] = np.where(counts[name] > 0, np.rad2deg(np.arctan2(sines[name], cosines[name])) % 360, np.nan)
+            result[f"{name}_resultant"] = np.hypot(sines[name], cosines[name]) / counts[name]
+    return result
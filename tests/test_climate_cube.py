@@ -0,0 +1,55 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Source code"))
+from climate_cube import ingest_climate_files, open_climate_cube
+
+LATITUDE = np.array([45.2, 45.1, 45.0])
+LONGITUDE = np.array([-63.2, -63.1])
+
+def _month_file(folder, month, hours=None):
+    """Writes a 3-hourly ERA5-like file for one month; t2m holds each step's hours since 2021-01-01."""
+    times = pd.date_range(month, pd.Timestamp(month) + pd.offsets.MonthEnd(1) + pd.Timedelta(hours=21), freq="3h")
+    if hours is not None:
+        times = times[:hours // 3]
+    values = ((times - pd.Timestamp("2021-01-01")) / pd.Timedelta(hours=1)).to_numpy(dtype=np.float32)
+    t2m = np.broadcast_to(values[:, None, None], (len(times), len(LATITUDE), len(LONGITUDE)))
+    ds = xr.Dataset({"t2m": (("valid_time", "latitude", "longitude"), t2m.copy())},
+                    coords={"valid_time": times, "latitude": LATITUDE, "longitude": LONGITUDE})
+    path = os.path.join(folder, f"climate_data_{month[:4]}_{month[5:7]}{'_part' if hours else ''}.nc")
+    ds.to_netcdf(path)
+    return path
+
+def _assert_cube_matches(store, months):
+    with open_climate_cube(store) as cube:
+        times = cube["time"].values
+        expected = np.concatenate([
+            pd.date_range(m, pd.Timestamp(m) + pd.offsets.MonthEnd(1) + pd.Timedelta(hours=21), freq="3h").to_numpy()
+            for m in months])
+        np.testing.assert_array_equal(times, expected)
+        hours = ((times - np.datetime64("2021-01-01")) / np.timedelta64(1, "h")).astype(np.float32)
+        np.testing.assert_array_equal(cube["t2m"].values[:, 0, 0], hours)
+
+def test_out_of_order_month_is_inserted_in_time_order(tmp_path):
+    store = str(tmp_path / "cube.zarr")
+    february = _month_file(tmp_path, "2021-02-01")
+    january = _month_file(tmp_path, "2021-01-01")
+
+    assert ingest_climate_files(store, [february]) == ["2021-02"]
+    assert ingest_climate_files(store, [january, february]) == ["2021-01"]
+    _assert_cube_matches(store, ["2021-01-01", "2021-02-01"])
+    assert ingest_climate_files(store, [january, february]) == []
+
+def test_partly_stored_month_is_completed(tmp_path):
+    store = str(tmp_path / "cube.zarr")
+    partial = _month_file(tmp_path, "2021-01-01", hours=240)
+    january = _month_file(tmp_path, "2021-01-01")
+    february = _month_file(tmp_path, "2021-02-01")
+
+    ingest_climate_files(store, [partial])
+    ingest_climate_files(store, [february])
+    assert ingest_climate_files(store, [january]) == ["2021-01"]
+    _assert_cube_matches(store, ["2021-01-01", "2021-02-01"])